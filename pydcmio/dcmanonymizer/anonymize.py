@@ -12,34 +12,565 @@ Module that provides tools to anonymize DICOM files.
 
 # System import
 import os
+import sys
+import io
 import json
-import re
+import time
+import tarfile
+import tempfile
+import zipfile
+import itertools
+import posixpath
+import collections
+import hashlib
+import functools
+import multiprocessing
 
 # Third party import
 import progressbar
 import dicom
 
 # Dcmio import
-from .callbacks import callback_private
-from .callbacks import callback_xxxx
-from .callbacks import ANON_LOG
-from .callbacks import MANUFACTURER
-from .callbacks import PRIVATE_DEIDENTIFY
-from .callbacks import CALLBACKS
-from .callbacks import TAGS
+from .callbacks import callback_tag
 from .utils import add_dataelement
-from .utils import replace_by
-from .utils import repr_dataelement
+from .utils import compile_tag_patterns
+from .utils import match_tag
+from .utils import skip_dataelement
+from .utils import copy_bytes
+from .utils import is_dicom
+from .utils import is_dicom_file
+from .utils import repr_tag
+from .utils import REMOVE_ACTIONS
+from .runlog import AnonymizationLog
+from .runlog import LOG_REPR_LENGTH
+from .manifest import Manifest
+from .manifest import HashingFile
+from .uids import UIDMapper
+from pydcmio.dcmreader.reader import read_header
+from pydcmio.dcmreader.reader import PIXEL_DATA_TAG
+
+
+# The manufacturer tag used to select the private tags to keep
+MANUFACTURER_TAG = dicom.tag.Tag(0x0008, 0x0070)
+
+# The UID mapped to identify the UIDs mapping in the rules version
+UID_FINGERPRINT = "1.2.840.10008"
+
+# The archive writing modes indexed by extension
+ARCHIVE_MODES = [
+    (".zip", "zip"),
+    (".tar", "w"),
+    (".tar.gz", "w:gz"),
+    (".tgz", "w:gz"),
+    (".tar.bz2", "w:bz2"),
+    (".tbz2", "w:bz2")]
+
+# The size in bytes above which the log of an archive anonymization is
+# spooled to a temporary file
+LOG_SPOOL_SIZE = 16777216
+
+
+class Anonymizer(object):
+    """ DICOM anonymizer: the anonymization rules are compiled once and the
+    anonymizer holds the log of the last anonymized dataset.
+
+    The rules are compiled in integer lookups so that the rule applied on
+    a data element is found without formatting its tag. The anonymizer can
+    be pickled and sent to other processes.
+
+    Attributes
+    ----------
+    manufacturer: str
+        the manufacturer of the anonymized DICOM files, used to select the
+        private tags to keep.
+    tags: dict
+        the actions of the standard tags to anonymize indexed by 32-bit tag.
+    tag_patterns: dict
+        the actions of the 'xx' wildcard tag patterns, see
+        'compile_tag_patterns'.
+    remove_private_tags: bool
+        if set the private tags are anonymized.
+    private_keep: dict
+        the compiled patterns of the manufacturer private tags to keep, see
+        'compile_tag_patterns'.
+    repr_length: int
+        if set, the maximum length of the anonymized values representation
+        stored in the log, see 'repr_dataelement'.
+    uid_mapper: UIDMapper
+        the deterministic mapping of the replaced UIDs, None if no mapping
+        key is specified.
+    log: dict
+        the anonymization operations of the last anonymized dataset.
+    sop_instance_uid: str
+        the SOP instance UID of the last anonymized file.
+    input_hash: str
+        the content hash of the last anonymized file, if requested, see
+        'anonymize_file'.
+    rules_version: str
+        the version of the anonymization rules: a hash of the rule files,
+        of the anonymizer settings and of the UIDs mapping if any.
+    """
+    def __init__(self, manufacturer=None, remove_all_private_tags=False,
+                 repr_length=None, uid_key=None):
+        """ Initialize the Anonymizer class.
+
+        Parameters
+        ----------
+        manufacturer: str (optional, default None)
+            the manufacturer of the anonymized DICOM files, required if the
+            private tags are anonymized.
+        remove_all_private_tags: bool (optional, default False)
+            If set remove all the private tags in the DICOM files, otherwise
+            apply the mapping available in the 'private_deidentify' file.
+        repr_length: int (optional, default None)
+            if set, the maximum length of the anonymized values
+            representation stored in the log.
+        uid_key: str or bytes (optional, default None)
+            the secret key of the UIDs mapping, see 'UIDMapper': share this
+            key to remap consistently the UIDs of the DICOM files in
+            different processes or runs. If not set the replaced UIDs are
+            set to a constant dummy UID.
+        """
+        self.manufacturer = manufacturer
+        self.tags = {}
+        self.remove_private_tags = False
+        self.repr_length = repr_length
+        self.uid_mapper = None
+        if uid_key is not None:
+            self.uid_mapper = UIDMapper(uid_key)
+        self.log = {}
+        self.sop_instance_uid = None
+        self.input_hash = None
+        tag_patterns = []
+
+        # Load the tags to anonymize
+        filedir = os.path.dirname(os.path.realpath(__file__))
+        settings = (manufacturer, remove_all_private_tags)
+        if self.uid_mapper is not None:
+            settings += (self.uid_mapper.get(UID_FINGERPRINT), )
+        sha1 = hashlib.sha1(repr(settings).encode("utf-8"))
+        with open(os.path.join(filedir, "deidentify.json"), "rb") as open_file:
+            content = open_file.read()
+        sha1.update(content)
+        anon_tags = json.loads(content.decode("utf-8"))[1:]
+
+        # Set up the desired callbacks and tags to be anonymized
+        # Iterate over all the tag to anonymize according to PS 3.15-2008
+        # and supplement 142
+        for tag_item in anon_tags:
+            tag_repr = tag_item["Tag"][1:-1]
+            action = tag_item["Basic Profile"]
+            group, element = tag_repr.split(",", 1)
+
+            # Deal with special tags
+            if "xx" in group or "xx" in element:
+                tag_patterns.append((tag_repr, "X"))
+
+            # Deal with private tags
+            elif "gggg" in group:
+                if manufacturer is None:
+                    raise Exception(
+                        "The '(0008,0070)' manufacturer tag is not specified "
+                        "and is required to anonymize private tags.")
+                self.remove_private_tags = True
+
+            # Deal with standard tags
+            else:
+                self.tags.setdefault(
+                    (int(group, 16) << 16) | int(element, 16), action)
+        self.tag_patterns = compile_tag_patterns(tag_patterns)
+
+        # Now compile the diffusion private tags patterns
+        if remove_all_private_tags:
+            private_anons = {}
+        else:
+            with open(os.path.join(filedir, "private_deidentify.json"),
+                      "rb") as open_file:
+                content = open_file.read()
+            sha1.update(content)
+            private_anons = json.loads(content.decode("utf-8"))
+        self.rules_version = sha1.hexdigest()
+        self.private_keep = compile_tag_patterns([
+            (value["Tag"], True)
+            for value in private_anons.get(manufacturer, [])])
+
+    @classmethod
+    def from_header(cls, path_or_stream, remove_all_private_tags=False,
+                    repr_length=None, uid_key=None):
+        """ Create an anonymizer for the manufacturer of a DICOM file: the
+        header is only read up to the manufacturer tag.
+
+        Parameters
+        ----------
+        path_or_stream: str or file-like (mandatory)
+            a DICOM file path or a seekable DICOM file-like object opened in
+            binary mode: the stream is positioned back where it started.
+        remove_all_private_tags, repr_length, uid_key: (optional)
+            the anonymizer settings, see 'Anonymizer'.
+
+        Returns
+        -------
+        anonymizer: Anonymizer
+            the anonymizer of the DICOM file manufacturer.
+        """
+        if isinstance(path_or_stream, str):
+            with open(path_or_stream, "rb") as open_file:
+                return cls.from_header(
+                    open_file, remove_all_private_tags=remove_all_private_tags,
+                    repr_length=repr_length, uid_key=uid_key)
+        start = path_or_stream.tell()
+        header = dicom.filereader.read_partial(
+            path_or_stream, stop_when=_stop_after_manufacturer, force=True)
+        path_or_stream.seek(start)
+        return cls(
+            manufacturer=header.get("Manufacturer"),
+            remove_all_private_tags=remove_all_private_tags,
+            repr_length=repr_length, uid_key=uid_key)
+
+    def anonymize_file(self, input_dicom, outdir, outname=None,
+                       write_log=True, stream_pixel_data=False,
+                       hash_input=False):
+        """ Anonymize a DICOM file, see 'anonymize_dicomfile': if
+        'hash_input' is set, the input file content hash is computed from
+        the bytes read and stored in the 'input_hash' attribute.
+        """
+        # Clean the log
+        self.log = {}
+        self.input_hash = None
+
+        # Load the DICOM dataset to anonymize
+        if outname is None:
+            basedicom = os.path.basename(input_dicom)
+            outname = basedicom.split(".")[0]
+        else:
+            basedicom = outname + ".dcm"
+        with open(input_dicom, "rb") as open_file:
+            in_file = HashingFile(open_file) if hash_input else open_file
+            dataset, pixel_data_offset = self.read_dataset(
+                in_file, stream_pixel_data)
+
+            # Anonymize the dataset
+            self.anonymize_dataset(dataset)
+
+            # Save the anonymized DICOM
+            output_dicom = os.path.join(outdir, basedicom)
+            dataset.save_as(output_dicom)
+            if pixel_data_offset is not None:
+                self.splice_pixel_data(in_file, output_dicom,
+                                       pixel_data_offset,
+                                       dataset.is_implicit_VR,
+                                       dataset.is_little_endian)
+            if hash_input:
+                self.input_hash = in_file.hexdigest()
+
+        # Save the anonimized log
+        output_log = None
+        if write_log:
+            output_log = os.path.join(outdir, outname + ".json")
+            with open(output_log, "w") as open_file:
+                json.dump(self.log, open_file, indent=4)
+
+        return output_dicom, output_log
+
+    def anonymize_stream(self, input_stream, output_stream=None,
+                         stream_pixel_data=False):
+        """ Anonymize a DICOM file-like object, see 'anonymize_stream'.
+        """
+        # Clean the log
+        self.log = {}
+
+        # Load the DICOM dataset to anonymize: the non seekable streams,
+        # like sockets, are buffered
+        if not _is_seekable(input_stream):
+            input_stream = io.BytesIO(input_stream.read())
+        dataset, pixel_data_offset = self.read_dataset(
+            input_stream, stream_pixel_data)
+
+        # Anonymize the dataset
+        self.anonymize_dataset(dataset)
+
+        # Write the anonymized DICOM: the pydicom file-like wrappers close
+        # the wrapped object when collected, the header is written in a
+        # buffer
+        if output_stream is None:
+            output = io.BytesIO()
+        else:
+            output = output_stream
+        header = io.BytesIO()
+        dataset.save_as(header)
+        output.write(header.getvalue())
+        if pixel_data_offset is not None:
+            self.copy_pixel_data(input_stream, output, pixel_data_offset,
+                                 dataset.is_implicit_VR,
+                                 dataset.is_little_endian)
+        if output_stream is None:
+            output = output.getvalue()
+
+        return output, self.log
+
+    def read_dataset(self, input_stream, stream_pixel_data=False):
+        """ Load a DICOM dataset to anonymize and record its SOP instance
+        UID.
+
+        Parameters
+        ----------
+        input_stream: file-like (mandatory)
+            a seekable DICOM file-like object opened in binary mode.
+        stream_pixel_data: bool (optional, default False)
+            If set only the DICOM header is read, the deflated files being
+            fully decoded.
+
+        Returns
+        -------
+        dataset: dicom.dataset.Dataset
+            the loaded dataset.
+        pixel_data_offset: int
+            the position of the pixel data element in the stream if only the
+            header has been read, None otherwise.
+        """
+        start = input_stream.tell()
+        pixel_data_offset = None
+        if stream_pixel_data:
+            dataset = dicom.filereader.read_partial(
+                input_stream, stop_when=_stop_at_pixel_data, force=True)
+            pixel_data_offset = input_stream.tell()
+            if (dataset.file_meta.get("TransferSyntaxUID") ==
+                    dicom.UID.DeflatedExplicitVRLittleEndian):
+                pixel_data_offset = None
+                input_stream.seek(start)
+        if pixel_data_offset is None:
+            dataset = dicom.read_file(input_stream, force=True)
+        self.sop_instance_uid = dataset.get("SOPInstanceUID")
+        if self.sop_instance_uid is not None:
+            self.sop_instance_uid = str(self.sop_instance_uid)
+        return dataset, pixel_data_offset
+
+    def splice_pixel_data(self, in_file, output_dicom, pixel_data_offset,
+                          is_implicit_VR, is_little_endian):
+        """ Append the raw pixel data of a DICOM file to an anonymized DICOM
+        header.
+
+        The pixel data bytes are copied unchanged, the data elements stored
+        after the pixel data are read and anonymized.
+
+        Parameters
+        ----------
+        in_file: file (mandatory)
+            the DICOM file opened in binary mode.
+        output_dicom: str (mandatory)
+            the anonymized DICOM header file path.
+        pixel_data_offset: int (mandatory)
+            the position of the pixel data element in the DICOM file.
+        is_implicit_VR: bool (mandatory)
+            the DICOM file value representation encoding.
+        is_little_endian: bool (mandatory)
+            the DICOM file byte ordering.
+        """
+        with open(output_dicom, "ab") as out_file:
+            self.copy_pixel_data(in_file, out_file, pixel_data_offset,
+                                 is_implicit_VR, is_little_endian)
+
+    def copy_pixel_data(self, in_file, out_file, pixel_data_offset,
+                        is_implicit_VR, is_little_endian):
+        """ Copy the raw pixel data of a DICOM file-like object at the end
+        of an anonymized DICOM header file-like object, see
+        'splice_pixel_data'.
+        """
+        in_file.seek(0, os.SEEK_END)
+        file_size = in_file.tell()
+        if pixel_data_offset >= file_size:
+            return
+        in_file.seek(pixel_data_offset)
+        skip_dataelement(in_file, is_implicit_VR, is_little_endian)
+        pixel_data_end = in_file.tell()
+        in_file.seek(pixel_data_offset)
+        copy_bytes(in_file, out_file, pixel_data_end - pixel_data_offset)
+        if pixel_data_end < file_size:
+            in_file.seek(pixel_data_end)
+            trailer = dicom.filereader.read_dataset(
+                in_file, is_implicit_VR, is_little_endian)
+            self.anonymize_dataset(trailer, level=2)
+            trailer_buffer = io.BytesIO()
+            trailer_file = dicom.filebase.DicomFileLike(trailer_buffer)
+            trailer_file.is_implicit_VR = is_implicit_VR
+            trailer_file.is_little_endian = is_little_endian
+            dicom.filewriter.write_dataset(trailer_file, trailer)
+            out_file.write(trailer_buffer.getvalue())
+
+    def anonymize_dataset(self, dataset, level=1):
+        """ Anonymize a pydicom dataset, see 'anonymize_dataset'.
+        """
+        # Anonymize the dataset and its sequences items applying the
+        # dispatched actions: the kept private tags are left unchanged
+        self.dispatch(dataset, self._apply_action, level=level)
+
+        # In supplement 142 the attribute Patient Identity Removed shall be
+        # replaced or added to the dataset and the method used for
+        # identification need to be specified
+        if level == 1:
+            file_meta = getattr(dataset, "file_meta", None)
+            if (file_meta is not None and "SOPInstanceUID" in dataset and
+                    "MediaStorageSOPInstanceUID" in file_meta):
+                file_meta.MediaStorageSOPInstanceUID = dataset.SOPInstanceUID
+            add_dataelement(dataset, (0x0012, 0x0062), "YES", "CS")
+            add_dataelement(dataset, (0x0012, 0x0063), [
+                "Basic Application Confidentiality Profil",
+                "Clean Graphics Option",
+                "Retain Device Identity Option"], "LO")
+            sqdataset = []
+            for value, desc in [
+                    ("113100", "Basic Application Confidentiality Profil"),
+                    ("113103", "Clean Graphics Option"),
+                    ("113103", "Retain Device Identity Option")]:
+                sqdataset.append((
+                    ((0x0008, 0x0100), value, "CS"),
+                    ((0x0008, 0x0104), desc, "LO"),
+                    ((0x0008, 0x0102), "DCM", "CS")))
+            add_dataelement(dataset, (0x0012, 0x0064), sqdataset, "SQ")
+
+        # Check that all tags with 'VR' 'PN' has been anonymized
+        # dataset.walk(functools.partial(callback_patient_name, self))
+
+    def audit_dataset(self, dataset, counts, private_groups):
+        """ Count the actions the anonymization would apply on a pydicom
+        dataset, without modifying it, see 'dispatch'.
+
+        Only the sequences are decoded, the other data elements may be raw.
+
+        Parameters
+        ----------
+        dataset: dicom.dataset.Dataset (mandatory)
+            a dataset to audit.
+        counts: dict (mandatory)
+            the actions counts indexed by tag representation and action,
+            updated inplace: the kept private tags are counted with the 'K'
+            action.
+        private_groups: set (mandatory)
+            the private groups containing tags that are not in the
+            manufacturer keep-list, updated inplace.
+        """
+        def count_action(dataset, tag, action, level):
+            tag_counts = counts.setdefault(repr_tag(tag), {})
+            tag_counts[action] = tag_counts.get(action, 0) + 1
+            if action == "X" and (tag >> 16) & 1:
+                private_groups.add("{0:04x}".format(tag >> 16))
+
+        self.dispatch(dataset, count_action)
+
+    def dispatch(self, dataset, callback, level=1):
+        """ Dispatch the data elements of a pydicom dataset, and of its
+        sequences items, to the anonymization rules.
+
+        The data elements are visited in tag order: the registered tag
+        action is dispatched first, then, unless the data element is
+        removed, the sequence items are dispatched, or the private tag
+        action, see 'private_action', or the tag pattern action. The data
+        elements are not converted, except the sequences.
+
+        Parameters
+        ----------
+        dataset: dicom.dataset.Dataset (mandatory)
+            a dataset to dispatch.
+        callback: callable (mandatory)
+            called as 'callback(dataset, tag, action, level)' for each action
+            applied on a data element: the callback may modify the data
+            element.
+        level: int (optional, default 1)
+            the dataset nesting level, 1 for a top level dataset.
+        """
+        kept_blocks = self.kept_private_blocks(dict.keys(dataset))
+        for tag, data_element in sorted(dict.items(dataset)):
+            tag = int(tag)
+
+            # Deal with the registered tags
+            action = self.tags.get(tag)
+            if action is not None:
+                callback(dataset, tag, action, level)
+                if action in REMOVE_ACTIONS or tag not in dataset:
+                    continue
+
+            # Deal with sequence
+            action = None
+            if _element_vr(tag, data_element) == "SQ":
+                for inner_dataset in dataset[tag].value:
+                    self.dispatch(inner_dataset, callback, level=level + 1)
+
+            # Deal with private tags
+            elif (tag >> 16) & 1:
+                if self.remove_private_tags:
+                    action = self.private_action(tag, kept_blocks)
+
+            # Deal with typed tags
+            else:
+                action = match_tag(self.tag_patterns, tag)
+            if action is not None:
+                callback(dataset, tag, action, level)
+
+    def kept_private_blocks(self, tags):
+        """ Return the private blocks containing tags in the manufacturer
+        keep-list.
+
+        Parameters
+        ----------
+        tags: list of int (mandatory)
+            the 32-bit tags of a dataset.
+
+        Returns
+        -------
+        kept_blocks: set of 2-uplet
+            the (group, block) private blocks: the block of a '(gggg,bbxx)'
+            tag is reserved by the '(gggg,00bb)' private creator.
+        """
+        return set(
+            (tag >> 16, (tag >> 8) & 0xff) for tag in tags
+            if (tag >> 16) & 1 and (tag & 0xffff) >= 0x1000 and
+            match_tag(self.private_keep, tag, False))
+
+    def private_action(self, tag, kept_blocks):
+        """ Return the action applied on a private tag.
+
+        Parameters
+        ----------
+        tag: int (mandatory)
+            a 32-bit private tag.
+        kept_blocks: set of 2-uplet (mandatory)
+            the private blocks containing kept tags, see
+            'kept_private_blocks'.
+
+        Returns
+        -------
+        action: str
+            'K' if the tag is in the manufacturer keep-list or if it is the
+            private creator of a kept block, 'X' otherwise.
+        """
+        element = tag & 0xffff
+        if match_tag(self.private_keep, tag, False):
+            return "K"
+        if 0x0010 <= element <= 0x00ff and (tag >> 16, element) in kept_blocks:
+            return "K"
+        return "X"
+
+    def _apply_action(self, dataset, tag, action, level):
+        """ Anonymize a data element applying a dispatched action, see
+        'dispatch': the kept private tags are left unchanged.
+        """
+        if action != "K":
+            callback_tag(self, dataset, dataset[tag], action)
 
 
 def anonymize_dicomdir(inputdir, outdir, write_logs=True,
-                       use_dicom_names=False, remove_all_private_tags=False):
+                       use_dicom_names=False, remove_all_private_tags=False,
+                       n_jobs=1, chunksize=16, stream_pixel_data=False,
+                       aggregate_logs=False, incremental=False,
+                       uid_key=None, dry_run=False):
     """ Anonymize all DICOM files of the input directory.
 
     Parameters
     ----------
     inputdir: str (mandatory)
-        A folder that contains only DICOM files to be anonymized.
+        A folder that contains the DICOM files to be anonymized, the hidden
+        files and the files without the DICOM magic bytes are not
+        considered, see 'is_dicom'.
     outdir: str (mandatory)
         The anonimized DICOM files folder.
     write_logs: bool (optional, default True)
@@ -50,87 +581,443 @@ def anonymize_dicomdir(inputdir, outdir, write_logs=True,
     remove_all_private_tags: bool (optional, default False)
         If set remove all the private tags in the DICOM files, otherwise
         apply the mapping available in the 'private_deidentify' file.
+    n_jobs: int (optional, default 1)
+        the number of processes used to anonymize the files.
+    chunksize: int (optional, default 16)
+        the number of files sent at once to a process.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM headers are decoded and the pixel data are
+        copied unchanged, see 'anonymize_dicomfile'.
+    aggregate_logs: bool (optional, default False)
+        If set write a single 'anonymization.jsonl' log for all the DICOM
+        files with bounded values representation, see 'AnonymizationLog',
+        instead of one log for each file.
+    incremental: bool (optional, default False)
+        If set only anonymize the new or changed DICOM files: the anonymized
+        files are recorded in an 'anonymization_manifest.json' manifest,
+        invalidated when the anonymization rules or settings change, see
+        'Manifest'.
+    uid_key: str or bytes (optional, default None)
+        the secret key of the UIDs mapping, see 'Anonymizer': required to
+        remap the UIDs consistently, by default the replaced UIDs are set
+        to a constant dummy UID.
+    dry_run: bool (optional, default False)
+        If set nothing is anonymized, the actions the anonymization would
+        apply are counted, see 'audit_dicomdir': if 'write_logs' is set the
+        audit is saved in an 'anonymization_audit.json' file.
 
     Returns
     -------
     dcmfiles: str
-        The anonimized DICOM files.
+        The anonimized DICOM files. In 'dry_run' mode, the actions counts,
+        see 'audit_dicomdir'.
     logfiles: list
-        The anonimization log files.
+        The anonimization log files, the aggregated log only if
+        'aggregate_logs' is set. In 'dry_run' mode, the private groups
+        that are not in the manufacturer keep-list indexed by DICOM file.
+    """
+    # Only audit the DICOM headers if requested
+    if dry_run:
+        audit_file = None
+        if write_logs:
+            audit_file = os.path.join(outdir, "anonymization_audit.json")
+        return audit_dicomdir(
+            inputdir, audit_file=audit_file,
+            remove_all_private_tags=remove_all_private_tags, n_jobs=n_jobs,
+            chunksize=chunksize)
+
+    # Compile the anonymization rules for the first dataset manufacturer
+    input_dicoms = _list_dicoms(inputdir)
+    aggregate_logs = aggregate_logs and write_logs
+    anonymizer = Anonymizer.from_header(
+        input_dicoms[0], remove_all_private_tags=remove_all_private_tags,
+        repr_length=LOG_REPR_LENGTH if aggregate_logs else None,
+        uid_key=uid_key)
+
+    # Skip the unchanged DICOM files recorded in the manifest
+    manifest = None
+    records = [None] * len(input_dicoms)
+    if incremental:
+        manifest = Manifest(
+            os.path.join(outdir, "anonymization_manifest.json"), {
+                "rules": anonymizer.rules_version,
+                "logs": ("aggregated" if aggregate_logs else
+                         "files" if write_logs else None)})
+        records = [manifest.get(path) for path in input_dicoms]
+    used_names = set(
+        os.path.basename(record["output"]).rsplit(".", 1)[0]
+        for record in records if record is not None)
+
+    # Process the DICOM files, in parallel if requested
+    jobs = []
+    job_indices = []
+    name_cnt = 0
+    for cnt, input_dicom in enumerate(input_dicoms):
+        if records[cnt] is not None:
+            continue
+        if use_dicom_names:
+            otuname = os.path.basename(input_dicom).rsplit(".", 1)[0]
+        else:
+            while str(name_cnt) in used_names:
+                name_cnt += 1
+            otuname = str(name_cnt)
+            name_cnt += 1
+        jobs.append((input_dicom, otuname))
+        job_indices.append(cnt)
+    worker = functools.partial(
+        _anonymize_job, anonymizer=anonymizer, outdir=outdir,
+        write_log=write_logs, stream_pixel_data=stream_pixel_data,
+        aggregate_log=aggregate_logs, hash_input=incremental)
+    dcmfiles = [None if record is None else record["output"]
+                for record in records]
+    logfiles = [None if record is None else record["log"]
+                for record in records]
+    run_log = None
+    if aggregate_logs:
+        run_log = AnonymizationLog(
+            os.path.join(outdir, "anonymization.jsonl"),
+            append=(manifest is not None and len(manifest) > 0))
+        logfiles = [run_log.log_file]
+    pool = None
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(processes=n_jobs)
+        results = pool.imap(worker, jobs, chunksize=chunksize)
+    else:
+        results = map(worker, jobs)
+    try:
+        with progressbar.ProgressBar(max_value=len(jobs),
+                                     redirect_stdout=True) as bar:
+            for cnt, (output_dicom, output_log, record, digest) in enumerate(
+                    results):
+                input_dicom = input_dicoms[job_indices[cnt]]
+                dcmfiles[job_indices[cnt]] = output_dicom
+                if run_log is not None:
+                    run_log.add(input_dicom, output_dicom, *record)
+                    output_log = run_log.log_file
+                else:
+                    logfiles[job_indices[cnt]] = output_log
+                if manifest is not None:
+                    manifest.add(input_dicom, output_dicom, output_log,
+                                 digest=digest)
+                bar.update(cnt)
+    finally:
+        if run_log is not None:
+            run_log.close()
+        if manifest is not None:
+            manifest.save()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return dcmfiles, logfiles
+
+
+def _anonymize_job(job, anonymizer, outdir, write_log, stream_pixel_data,
+                   aggregate_log, hash_input=False):
+    """ Anonymize a DICOM file in a worker, see 'anonymize_dicomdir': the
+    anonymization operations are sent back if the logs are aggregated, and
+    the input content hash if requested.
+    """
+    input_dicom, outname = job
+    output_dicom, output_log = anonymizer.anonymize_file(
+        input_dicom, outdir, outname=outname,
+        write_log=write_log and not aggregate_log,
+        stream_pixel_data=stream_pixel_data, hash_input=hash_input)
+    record = None
+    if aggregate_log:
+        record = (anonymizer.sop_instance_uid, anonymizer.log)
+    return output_dicom, output_log, record, anonymizer.input_hash
+
+
+def audit_dicomdir(inputdir, audit_file=None, remove_all_private_tags=False,
+                   n_jobs=1, chunksize=16):
+    """ Count the actions the anonymization of the DICOM files of the input
+    directory would apply, without anonymizing them.
+
+    Only the DICOM headers are read, up to the pixel data, see 'read_header'
+    and 'Anonymizer.audit_dataset'.
+
+    Parameters
+    ----------
+    inputdir: str (mandatory)
+        A folder that contains the DICOM files to be audited, the hidden
+        files and the files without the DICOM magic bytes are not
+        considered, see 'is_dicom'.
+    audit_file: str (optional, default None)
+        If set save the audit in this JSON file.
+    remove_all_private_tags: bool (optional, default False)
+        If set audit the removal of all the private tags, otherwise the
+        mapping available in the 'private_deidentify' file.
+    n_jobs: int (optional, default 1)
+        the number of processes used to audit the files.
+    chunksize: int (optional, default 16)
+        the number of files sent at once to a process.
+
+    Returns
+    -------
+    counts: dict
+        The actions counts indexed by tag representation and action.
+    private_files: dict
+        The private groups that are not in the manufacturer keep-list
+        indexed by DICOM file, for the files containing such groups.
+    """
+    # Compile the anonymization rules for the first dataset manufacturer
+    input_dicoms = _list_dicoms(inputdir)
+    anonymizer = Anonymizer.from_header(
+        input_dicoms[0], remove_all_private_tags=remove_all_private_tags)
+
+    # Audit the DICOM files, in parallel if requested
+    worker = functools.partial(_audit_job, anonymizer=anonymizer)
+    counts = {}
+    private_files = {}
+    pool = None
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(processes=n_jobs)
+        results = pool.imap(worker, input_dicoms, chunksize=chunksize)
+    else:
+        results = map(worker, input_dicoms)
+    try:
+        with progressbar.ProgressBar(max_value=len(input_dicoms),
+                                     redirect_stdout=True) as bar:
+            for cnt, (file_counts, private_groups) in enumerate(results):
+                for tag_repr, tag_counts in file_counts.items():
+                    all_counts = counts.setdefault(tag_repr, {})
+                    for action, nb_actions in tag_counts.items():
+                        all_counts[action] = (
+                            all_counts.get(action, 0) + nb_actions)
+                if len(private_groups) > 0:
+                    private_files[input_dicoms[cnt]] = private_groups
+                bar.update(cnt)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Save the audit
+    if audit_file is not None:
+        with open(audit_file, "w") as open_file:
+            json.dump({"counts": counts, "private_files": private_files},
+                      open_file, indent=4)
+
+    return counts, private_files
+
+
+def _audit_job(input_dicom, anonymizer):
+    """ Audit a DICOM file header in a worker, see 'audit_dicomdir'.
+    """
+    dataset = read_header(input_dicom, raw=True)
+    counts = {}
+    private_groups = set()
+    anonymizer.audit_dataset(dataset, counts, private_groups)
+    return counts, sorted(private_groups)
+
+
+def _list_dicoms(inputdir):
+    """ List the DICOM files of a directory: the hidden files and the non
+    DICOM files are not considered.
     """
-    # Load the first dataset
-    # Do not consider hidden files
     input_dicoms = [os.path.join(inputdir, fname)
                     for fname in os.listdir(inputdir)
                     if not fname.startswith(".")]
-    dataset = dicom.read_file(input_dicoms[0], force=True)
-
-    # Load the tags to anonymize
-    filedir = os.path.dirname(os.path.realpath(__file__))
-    with open(os.path.join(filedir, "deidentify.json"), "r") as open_file:
-        anon_tags = json.load(open_file)[1:]
-
-    # Set up the desired callbacks and tags to be anonymized
-    # Iterate over all the tag to anonymize according to PS 3.15-2008 and
-    # supplement 142
-    for tag_item in anon_tags:
-        tag_repr = tag_item["Tag"][1:-1]
-        action = tag_item["Basic Profile"]
-        group, element = tag_repr.split(",", 1)
-
-        # Deal with special tags
-        if "xx" in group or "xx" in element:
-            pattern = re.compile(tag_repr.replace("x", "[0-9A-Fa-f]"))
-            CALLBACKS[tag_repr] = [pattern, callback_xxxx]
-
-        # Deal with private tags
-        elif "gggg" in group:
-            if (0x0008, 0x0070) in dataset:
-                MANUFACTURER.append(dataset[0x0008, 0x0070].value)
-            if len(MANUFACTURER) > 0:
-                CALLBACKS[tag_repr] = [None, callback_private]
-            else:
-                raise Exception(
-                    "The '(0008,0070)' manufacturer tag is not specified and "
-                    "is required to anonymize private tags.")
+    input_dicoms = [path for path in input_dicoms
+                    if os.path.isfile(path) and is_dicom_file(path)]
+    if len(input_dicoms) == 0:
+        raise ValueError(
+            "'{0}' does not contain DICOM files.".format(inputdir))
+    return input_dicoms
 
-        # Deal with standard tags
-        else:
-            TAGS[tag_repr] = (int(group, 16), int(element, 16)), action
 
-    # Now compile the diffusion private tags patterns
-    filedir = os.path.dirname(os.path.realpath(__file__))
-    if remove_all_private_tags:
-        private_anons = {}
+def anonymize_dicomtree(inputdir, outdir, write_log=True,
+                        use_dicom_names=False, remove_all_private_tags=False,
+                        n_jobs=1, queue_size=256, stream_pixel_data=False,
+                        uid_key=None):
+    """ Anonymize all DICOM files of a directory tree, mirroring the tree in
+    the output directory.
+
+    The tree is scanned lazily and the DICOM files are anonymized while
+    the scan goes on: at most 'queue_size' files are queued for the
+    workers, so that the memory does not depend on the number of files.
+
+    Parameters
+    ----------
+    inputdir: str (mandatory)
+        A folder that contains the DICOM files to be anonymized, the hidden
+        files and folders and the files without the DICOM magic bytes are
+        not considered, see 'is_dicom'.
+    outdir: str (mandatory)
+        The anonimized DICOM files folder.
+    write_log: bool (optional, default True)
+        If True write the aggregated 'anonymization.jsonl' log of all the
+        DICOM files, see 'AnonymizationLog'.
+    use_dicom_names: bool (optional, default False)
+        If set use the input DICOM file names as anonymized DICOM file names
+        (removing the file extension), otherwise just use a numbering.
+    remove_all_private_tags: bool (optional, default False)
+        If set remove all the private tags in the DICOM files, otherwise
+        apply the mapping available in the 'private_deidentify' file.
+    n_jobs: int (optional, default 1)
+        the number of processes used to anonymize the files.
+    queue_size: int (optional, default 256)
+        the maximum number of files queued for the processes.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM headers are decoded and the pixel data are
+        copied unchanged, see 'anonymize_dicomfile'.
+    uid_key: str or bytes (optional, default None)
+        the secret key of the UIDs mapping, see 'Anonymizer'.
+
+    Returns
+    -------
+    nb_files: int
+        The number of anonymized DICOM files.
+    log_file: str
+        The anonymization log, None if 'write_log' is not set.
+    """
+    # Load the first dataset header up to the manufacturer tag
+    if not os.path.isdir(inputdir):
+        raise ValueError("'{0}' is not a valid directory.".format(inputdir))
+    jobs = _iter_tree_jobs(inputdir, outdir, use_dicom_names)
+    first_job = next(jobs, None)
+    if first_job is None:
+        raise ValueError(
+            "'{0}' does not contain DICOM files.".format(inputdir))
+    jobs = itertools.chain([first_job], jobs)
+
+    # Compile the anonymization rules for the first dataset manufacturer
+    anonymizer = Anonymizer.from_header(
+        first_job[0], remove_all_private_tags=remove_all_private_tags,
+        repr_length=LOG_REPR_LENGTH if write_log else None,
+        uid_key=uid_key)
+
+    # Process the DICOM files through a bounded queue, in parallel if
+    # requested
+    worker = functools.partial(
+        _anonymize_tree_job, anonymizer=anonymizer,
+        stream_pixel_data=stream_pixel_data)
+    run_log = None
+    if write_log:
+        run_log = AnonymizationLog(os.path.join(outdir, "anonymization.jsonl"))
+    nb_files = 0
+    pool = None
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(processes=n_jobs)
+        results = _bounded_imap(pool, worker, jobs, queue_size)
     else:
-        with open(os.path.join(filedir, "private_deidentify.json"),
-                  "r") as open_file:
-            private_anons = json.load(open_file)
-    for key, values in private_anons.items():
-        for value in values:
-            pattern = re.compile(value["Tag"].replace("x", "[0-9A-Fa-f]"))
-            PRIVATE_DEIDENTIFY.setdefault(key, []).append(pattern)
-
-    # Process all DICOM files
-    dcmfiles = []
-    logfiles = []
-    with progressbar.ProgressBar(max_value=len(input_dicoms),
-                                 redirect_stdout=True) as bar:
-        for cnt, input_dicom in enumerate(input_dicoms):
+        results = (worker(job) for job in jobs)
+    try:
+        with progressbar.ProgressBar(max_value=progressbar.UnknownLength,
+                                     redirect_stdout=True) as bar:
+            for input_dicom, output_dicom, sop_instance_uid, log in results:
+                if run_log is not None:
+                    run_log.add(input_dicom, output_dicom, sop_instance_uid,
+                                log)
+                nb_files += 1
+                bar.update(nb_files)
+    finally:
+        if run_log is not None:
+            run_log.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return nb_files, None if run_log is None else run_log.log_file
+
+
+def _iter_tree_jobs(inputdir, outdir, use_dicom_names):
+    """ Generator that scans a directory tree and yields the (input DICOM
+    file, output directory, output name) jobs, see 'anonymize_dicomtree':
+    the output directories are created on the fly and the output tree is
+    not scanned if located in the input tree. The tree is walked lazily,
+    one directory listing at a time, and the symbolic links to directories
+    are not followed so that a link to an ancestor can not loop forever.
+    """
+    cnt = 0
+    real_outdir = os.path.realpath(outdir)
+    for dirpath, dirnames, filenames in os.walk(inputdir):
+        dirnames[:] = [
+            name for name in dirnames if not name.startswith(".") and
+            os.path.realpath(os.path.join(dirpath, name)) != real_outdir]
+        job_outdir = os.path.normpath(os.path.join(
+            outdir, os.path.relpath(dirpath, inputdir)))
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if (name.startswith(".") or not os.path.isfile(path) or
+                    not is_dicom_file(path)):
+                continue
+            if not os.path.isdir(job_outdir):
+                os.makedirs(job_outdir)
             if use_dicom_names:
-                otuname = os.path.basename(input_dicom).rsplit(".", 1)[0]
+                outname = name.rsplit(".", 1)[0]
             else:
-                otuname = str(cnt)
-            output_dicom, output_log = anonymize_dicomfile(
-                input_dicom, outdir, outname=otuname, write_log=write_logs)
-            dcmfiles.append(output_dicom)
-            logfiles.append(output_log)
-            bar.update(cnt)
+                outname = str(cnt)
+            cnt += 1
+            yield path, job_outdir, outname
 
-    return dcmfiles, logfiles
+
+def _bounded_imap(pool, worker, jobs, queue_size):
+    """ Generator that yields the results of a worker applied on jobs in a
+    pool, in the jobs order: the jobs are consumed lazily and at most
+    'queue_size' jobs are pending.
+    """
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(worker, (job, )))
+        if len(pending) >= queue_size:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _anonymize_tree_job(job, anonymizer, stream_pixel_data):
+    """ Anonymize a DICOM file in a worker, see 'anonymize_dicomtree'.
+    """
+    input_dicom, outdir, outname = job
+    output_dicom, _ = anonymizer.anonymize_file(
+        input_dicom, outdir, outname=outname, write_log=False,
+        stream_pixel_data=stream_pixel_data)
+    return (input_dicom, output_dicom, anonymizer.sop_instance_uid,
+            anonymizer.log)
+
+
+def _is_seekable(stream):
+    """ Check if a file-like object supports random access.
+    """
+    seekable = getattr(stream, "seekable", None)
+    if seekable is not None:
+        return seekable()
+    try:
+        stream.tell()
+    except (AttributeError, IOError):
+        return False
+    return True
+
+
+def _stop_after_manufacturer(tag, VR, length):
+    """ Stop the DICOM file parsing after the manufacturer tag.
+    """
+    return tag > MANUFACTURER_TAG
 
 
-def anonymize_dicomfile(input_dicom, outdir, outname=None, write_log=True):
+def _element_vr(tag, data_element):
+    """ Return the VR of a data element, possibly raw: the VR of an implicit
+    VR raw data element is found in the DICOM dictionary.
+    """
+    VR = data_element.VR
+    if VR is None:
+        try:
+            VR = dicom.datadict.dictionaryVR(tag)
+        except KeyError:
+            VR = "UN"
+    return VR
+
+
+def _stop_at_pixel_data(tag, VR, length):
+    """ Stop the DICOM file parsing at the pixel data.
+    """
+    return tag == PIXEL_DATA_TAG
+
+
+def anonymize_dicomfile(input_dicom, outdir, outname=None, write_log=True,
+                        anonymizer=None, stream_pixel_data=False):
     """ Anonymize DICOMs
 
     According to PS 3.15-2008, basic application level de-indentification of
@@ -174,6 +1061,12 @@ def anonymize_dicomfile(input_dicom, outdir, outname=None, write_log=True):
         name.
     write_log: bool (optional, default True)
         If True write the anonimization log.
+    anonymizer: Anonymizer (optional, default None)
+        the anonymizer to use, by default an anonymizer is created for the
+        'input_dicom' manufacturer.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM header is decoded and anonymized, the pixel
+        data bytes being copied unchanged in the anonymized file.
 
     Returns
     -------
@@ -182,104 +1075,265 @@ def anonymize_dicomfile(input_dicom, outdir, outname=None, write_log=True):
     output_log: str
         If 'write_log' is set, the path to the anonimization log.
     """
-    # Clean global log
-    for key in ANON_LOG.keys():
-        ANON_LOG.pop(key)
-
-    # Load the DICOM dataset to anonymize
-    if outname is None:
-        basedicom = os.path.basename(input_dicom)
-        outname = basedicom.split(".")[0]
+    if anonymizer is None:
+        anonymizer = Anonymizer.from_header(input_dicom)
+    return anonymizer.anonymize_file(
+        input_dicom, outdir, outname=outname, write_log=write_log,
+        stream_pixel_data=stream_pixel_data)
+
+
+def anonymize_stream(input_stream, output_stream=None, anonymizer=None,
+                     stream_pixel_data=False):
+    """ Anonymize a DICOM file-like object in memory, see
+    'anonymize_dicomfile'.
+
+    Parameters
+    ----------
+    input_stream: file-like (mandatory)
+        a DICOM file-like object opened in binary mode, like a socket file:
+        the non seekable objects are read in memory.
+    output_stream: file-like (optional, default None)
+        the file-like object where the anonymized DICOM is written, by
+        default the anonymized DICOM bytes are returned.
+    anonymizer: Anonymizer (optional, default None)
+        the anonymizer to use, by default an anonymizer is created for the
+        DICOM manufacturer.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM header is decoded and anonymized, the pixel
+        data bytes being copied unchanged.
+
+    Returns
+    -------
+    output: bytes or file-like
+        the anonymized DICOM bytes, or 'output_stream' if specified.
+    log: dict
+        the anonymization operations.
+    """
+    if not _is_seekable(input_stream):
+        input_stream = io.BytesIO(input_stream.read())
+    if anonymizer is None:
+        anonymizer = Anonymizer.from_header(input_stream)
+    return anonymizer.anonymize_stream(
+        input_stream, output_stream=output_stream,
+        stream_pixel_data=stream_pixel_data)
+
+
+def anonymize_bytes(data, anonymizer=None, stream_pixel_data=False):
+    """ Anonymize DICOM bytes in memory, see 'anonymize_stream'.
+
+    Parameters
+    ----------
+    data: bytes (mandatory)
+        the DICOM file content.
+    anonymizer: Anonymizer (optional, default None)
+        the anonymizer to use, by default an anonymizer is created for the
+        DICOM manufacturer.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM header is decoded and anonymized, the pixel
+        data bytes being copied unchanged.
+
+    Returns
+    -------
+    output: bytes
+        the anonymized DICOM bytes.
+    log: dict
+        the anonymization operations.
+    """
+    return anonymize_stream(io.BytesIO(data), anonymizer=anonymizer,
+                            stream_pixel_data=stream_pixel_data)
+
+
+def anonymize_archive(in_archive, out_archive, write_log=True,
+                      use_dicom_names=False, remove_all_private_tags=False,
+                      stream_pixel_data=False, uid_key=None):
+    """ Anonymize all DICOM files of a tar or zip archive in a new archive.
+
+    The members are read one by one from the input archive, anonymized in
+    memory, see 'anonymize_stream', and written in the output archive
+    without temporary files. Hidden members and members without the DICOM
+    magic bytes are not considered, see 'is_dicom'.
+
+    Parameters
+    ----------
+    in_archive: str (mandatory)
+        a tar archive, possibly compressed, or a zip archive containing the
+        DICOM files to be anonymized.
+    out_archive: str (mandatory)
+        the anonymized DICOM files archive, its format is defined by its
+        extension: '.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2' or '.tbz2'.
+    write_log: bool (optional, default True)
+        If True write the anonymization log in an 'anonymization.jsonl'
+        member with its 'anonymization.index.json' index, see
+        'AnonymizationLog': the log is kept in memory up to
+        'LOG_SPOOL_SIZE' bytes, then in a temporary file.
+    use_dicom_names: bool (optional, default False)
+        If set use the input members names as anonymized DICOM members names
+        (replacing the file extension), otherwise just use a numbering.
+    remove_all_private_tags: bool (optional, default False)
+        If set remove all the private tags in the DICOM files, otherwise
+        apply the mapping available in the 'private_deidentify' file.
+    stream_pixel_data: bool (optional, default False)
+        If set only the DICOM headers are decoded and the pixel data are
+        copied unchanged.
+    uid_key: str or bytes (optional, default None)
+        the secret key of the UIDs mapping, see 'Anonymizer'.
+
+    Returns
+    -------
+    dcm_members: list of str
+        the anonymized DICOM members names.
+    log_members: list of str
+        the anonymization log members names.
+    """
+    # Check the archives formats
+    if zipfile.is_zipfile(in_archive):
+        members = _iter_zip_members(in_archive)
+    elif tarfile.is_tarfile(in_archive):
+        members = _iter_tar_members(in_archive)
+    else:
+        raise ValueError(
+            "'{0}' is not a valid tar or zip archive.".format(in_archive))
+    for extension, mode in ARCHIVE_MODES:
+        if out_archive.endswith(extension):
+            break
     else:
-        basedicom = outname + ".dcm"
-    dataset = dicom.read_file(input_dicom, force=True)
+        raise ValueError("'{0}' is not a supported archive name.".format(
+            out_archive))
+
+    # Anonymize the members in the output archive
+    anonymizer = None
+    run_log = None
+    log_stream = tempfile.SpooledTemporaryFile(max_size=LOG_SPOOL_SIZE)
+    dcm_members = []
+    log_members = []
+    if mode == "zip":
+        archive = zipfile.ZipFile(out_archive, "w", zipfile.ZIP_DEFLATED,
+                                  allowZip64=True)
+        write_member = archive.writestr
+    else:
+        archive = tarfile.open(out_archive, mode)
+        write_member = functools.partial(_write_tar_member, archive)
+    try:
+        for name, data in members:
+            if not is_dicom(data):
+                continue
+            if anonymizer is None:
+                anonymizer = Anonymizer.from_header(
+                    io.BytesIO(data),
+                    remove_all_private_tags=remove_all_private_tags,
+                    repr_length=LOG_REPR_LENGTH if write_log else None,
+                    uid_key=uid_key)
+                if write_log:
+                    run_log = AnonymizationLog(log_stream)
+            if use_dicom_names:
+                out_name = posixpath.splitext(name)[0] + ".dcm"
+            else:
+                out_name = "{0}.dcm".format(len(dcm_members))
+            output, log = anonymizer.anonymize_stream(
+                io.BytesIO(data), stream_pixel_data=stream_pixel_data)
+            write_member(out_name, output)
+            dcm_members.append(out_name)
+            if run_log is not None:
+                run_log.add(name, out_name, anonymizer.sop_instance_uid, log)
 
-    # Anonymize the dataset
-    anonymize_dataset(dataset)
+        # Save the anonymization log
+        if run_log is not None:
+            run_log.close()
+            log_size = log_stream.tell()
+            log_stream.seek(0)
+            _write_file_member(archive, "anonymization.jsonl", log_stream,
+                               log_size)
+            write_member("anonymization.index.json",
+                         json.dumps(run_log.index()).encode("ascii"))
+            log_members = ["anonymization.jsonl", "anonymization.index.json"]
+    finally:
+        archive.close()
+        log_stream.close()
 
-    # Save the anonymized DICOM
-    output_dicom = os.path.join(outdir, basedicom)
-    dataset.save_as(output_dicom)
+    return dcm_members, log_members
+
+
+def _iter_zip_members(in_archive):
+    """ Generator that yields the (name, content) of the zip archive
+    regular non hidden members.
+    """
+    with zipfile.ZipFile(in_archive, "r") as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if name.endswith("/") or posixpath.basename(name).startswith("."):
+                continue
+            with archive.open(info) as open_file:
+                data = open_file.read()
+            yield name, data
+
+
+def _iter_tar_members(in_archive):
+    """ Generator that yields the (name, content) of the tar archive regular
+    non hidden members: the archive is read as a stream.
+    """
+    with tarfile.open(in_archive, "r|*") as archive:
+        for member in archive:
+            if (not member.isfile() or
+                    posixpath.basename(member.name).startswith(".")):
+                continue
+            yield member.name, archive.extractfile(member).read()
+
+
+def _write_tar_member(archive, name, data):
+    """ Write a member in a tar archive.
+    """
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = time.time()
+    archive.addfile(info, io.BytesIO(data))
 
-    # Save the anonimized log
-    output_log = None
-    if write_log:
-        output_log = os.path.join(outdir, outname + ".json")
-        with open(output_log, "w") as open_file:
-            json.dump(ANON_LOG, open_file, indent=4)
 
-    return output_dicom, output_log
+def _write_file_member(archive, name, fileobj, size):
+    """ Write a member in a tar or zip archive from a binary file, with a
+    bounded buffer.
+    """
+    # COMPATIBILITY: zip members can only be written from a stream since
+    # python 3.6, spool the stream to a temporary file otherwise
+    if isinstance(archive, zipfile.ZipFile) and sys.version_info < (3, 6):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as open_file:
+                copy_bytes(fileobj, open_file, size)
+            archive.write(path, name)
+        finally:
+            os.remove(path)
+    elif isinstance(archive, zipfile.ZipFile):
+        with archive.open(name, "w",
+                          force_zip64=(size > zipfile.ZIP64_LIMIT)) as member:
+            copy_bytes(fileobj, member, size)
+    else:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = time.time()
+        archive.addfile(info, fileobj)
 
 
-def anonymize_dataset(dataset, level=1):
+def anonymize_dataset(dataset, level=1, anonymizer=None):
     """ Anonymize a pydicom dataset.
 
     Parameters
     ----------
     dataset: dicom.dataset.Dataset (mandatory)
         a dataset to anonymize.
+    level: int (optional, default 1)
+        the dataset nesting level: the de-identification method is only
+        added to the top level dataset.
+    anonymizer: Anonymizer (optional, default None)
+        the anonymizer to use, by default an anonymizer is created for the
+        dataset manufacturer.
+
+    Returns
+    -------
+    log: dict
+        the anonymization operations.
     """
-    # Anonymize the registered tags
-    for tag, action in TAGS.values():
-        if tag in dataset:
-            data_element = dataset[tag]
-            tag_repr = repr(data_element.tag)[1:-1].replace(" ", "")
-            value = data_element.value
-            anon_value = replace_by(value, data_element.VR, action)
-            value_repr = repr_dataelement(data_element)
-            ANON_LOG.setdefault(tag_repr, []).append((value_repr, anon_value))
-            if anon_value is None:
-                dataset.pop(data_element.tag)
-            else:
-                data_element.value = anon_value
-
-    # Anonymize the current dataset applying the registered callbacks
-    dataset.walk(callback_main)
-
-    # In supplement 142 the attribute Patient Identity Removed shall be
-    # replaced or added to the dataset and the method used for identification
-    # need to be specified
-    if level == 1:
-        add_dataelement(dataset, (0x0012, 0x0062), "YES", "CS")
-        add_dataelement(dataset, (0x0012, 0x0063), [
-            "Basic Application Confidentiality Profil",
-            "Clean Graphics Option",
-            "Retain Device Identity Option"], "LO")
-        sqdataset = []
-        for value, desc in [
-                ("113100", "Basic Application Confidentiality Profil"),
-                ("113103", "Clean Graphics Option"),
-                ("113103", "Retain Device Identity Option")]:
-            sqdataset.append((
-                ((0x0008, 0x0100), value, "CS"),
-                ((0x0008, 0x0104), desc, "LO"),
-                ((0x0008, 0x0102), "DCM", "CS")))
-        add_dataelement(dataset, (0x0012, 0x0064), sqdataset, "SQ")
-
-    # Check that all tags with 'VR' 'PN' has been anonymized
-    # dataset.walk(callback_patient_name)
-
-
-def callback_main(dataset, data_element):
-    """ Called from the dataset 'walk' recursive function, will anonymize
-    all DICOM fields by applying all the declared callbacks."""
-    # Deal with sequence
-    if data_element.VR == "SQ":
-        for inner_dataset in data_element.value:
-            anonymize_dataset(inner_dataset, level=2)
-
-    # Deal with typed tags
-    else:
-        for pattern, callback in CALLBACKS.values():
-
-            # Form kwargs
-            kwargs = {
-                "dataset": dataset,
-                "data_element": data_element
-            }
-            if pattern is not None:
-                kwargs["pattern"] = pattern
-
-            # Call the callback
-            if callback(**kwargs):
-                break
+    if anonymizer is None:
+        anonymizer = Anonymizer(manufacturer=dataset.get("Manufacturer"))
+    anonymizer.log = {}
+    anonymizer.anonymize_dataset(dataset, level=level)
+    return anonymizer.log
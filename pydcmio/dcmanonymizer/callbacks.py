@@ -14,89 +14,31 @@ Module that provides DICOM anonymization callbacks.
 # Dcmio import
 from .utils import replace_by
 from .utils import repr_dataelement
+from .utils import repr_tag
 
-# Define global log variable
-ANON_LOG = {}
-MANUFACTURER = []
-CALLBACKS = {}
-TAGS = {}
-PRIVATE_DEIDENTIFY = {}
 
+def callback_tag(anonymizer, dataset, data_element, action):
+    """ Called from the anonymizer dispatch, will anonymize a data element
+    applying the 'action' de-identification code."""
+    tag_repr = repr_tag(data_element.tag)
+    value = data_element.value
+    anon_value = replace_by(value, data_element.VR, action,
+                            uid_mapper=anonymizer.uid_mapper)
+    value_repr = repr_dataelement(data_element, anonymizer.repr_length)
+    anonymizer.log.setdefault(tag_repr, []).append((value_repr, anon_value))
+    if anon_value is None:
+        dataset.pop(data_element.tag)
+    else:
+        data_element.value = anon_value
 
-def callback_private(dataset, data_element):
-    """ Called from the dataset 'walk' recursive function, will anonymize
-    all the private fields."""
-    # Deal with private tags only
-    if data_element.tag.is_private:
+    return True
 
-        # Check if this private tag needs to be removed
-        tag_repr = repr(data_element.tag)[1:-1].replace(" ", "")
-        keep_private_tag = False
-        for pattern in PRIVATE_DEIDENTIFY.get(MANUFACTURER[0], []):
-            if pattern.match(tag_repr):
-                keep_private_tag = True
-                break
 
-        # Remove tag if requested
-        if not keep_private_tag:
-            dataset.pop(data_element.tag)
-            value = data_element.value
-            anon_value = replace_by(value, data_element.VR, "X")
-            value_repr = repr_dataelement(data_element)
-            ANON_LOG.setdefault(tag_repr, []).append((value_repr, anon_value))
-        else:
-            print(tag_repr, repr_dataelement(data_element))
-
-        return True
-
-    return False
-
-
-def callback_tag(dataset, data_element, pattern):
-    """ Called from the dataset 'walk' recursive function, will anonymize
-    all the tag 'tag'."""
-    tag, action = pattern
-    if tag in dataset:
-        tag_repr = repr(data_element.tag)[1:-1].replace(" ", "")
-        value = data_element.value
-        anon_value = replace_by(value, data_element.VR, action)
-        value_repr = repr_dataelement(data_element)
-        ANON_LOG.setdefault(tag_repr, []).append((value_repr, anon_value))
-        if anon_value is None:
-            dataset.pop(data_element.tag)
-        else:
-            data_element.value = anon_value
-
-        return True
-
-    return False
-
-
-def callback_xxxx(dataset, data_element, pattern):
-    """ Called from the dataset 'walk' recursive function, will anonymize
-    all the '50xx,xxx' fields."""
-    tag_repr = repr(data_element.tag)[1:-1].replace(" ", "")
-
-    if pattern.match(tag_repr):
-        value = data_element.value
-        anon_value = replace_by(value, data_element.VR, "X")
-        value_repr = repr_dataelement(data_element)
-        ANON_LOG.setdefault(tag_repr, []).append((value_repr, anon_value))
-        if anon_value is None:
-            dataset.pop(data_element.tag)
-        else:
-            data_element.value = anon_value
-
-        return True
-
-    return False
-
-
-def callback_patient_name(dataset, data_element):
+def callback_patient_name(anonymizer, dataset, data_element):
     """ Called from the dataset 'walk' recursive function, will set
     a new identitiy to the subject."""
-    tag_repr = repr(data_element.tag)[1:-1].replace(" ", "")
+    tag_repr = repr_tag(data_element.tag)
     if data_element.VR == "PN":
-        if tag_repr not in ANON_LOG:
+        if tag_repr not in anonymizer.log:
             raise Exception("Tag '({0})' contains patient information and "
                             "has not been anonymized.".format(tag_repr))
@@ -0,0 +1,219 @@
+##########################################################################
+# NSAP - Copyright (C) CEA, 2015
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Module that provides a manifest of the anonymized files to skip the
+unchanged files when an anonymization is run again.
+"""
+
+# System import
+import os
+import json
+import hashlib
+
+
+class Manifest(object):
+    """ Manifest of the anonymized DICOM files.
+
+    For each input DICOM file the manifest records its size, modification
+    time and content hash, and the anonymized DICOM file and log. An input
+    is unchanged if its size and modification time, or its content hash,
+    are the recorded ones and if its anonymized file exists. The manifest
+    is only valid for a version of the anonymization rules and settings:
+    a manifest with another version is discarded, and the records of the
+    deleted input files are dropped when the manifest is loaded.
+
+    Attributes
+    ----------
+    manifest_file: str
+        the JSON file where the manifest is persisted.
+    version: dict
+        the anonymization rules and settings version.
+    files: dict
+        the input DICOM files records.
+    """
+    def __init__(self, manifest_file, version):
+        """ Initialize the Manifest class.
+
+        Parameters
+        ----------
+        manifest_file: str (mandatory)
+            the JSON file where the manifest is persisted, loaded if it
+            exists.
+        version: dict (mandatory)
+            the anonymization rules and settings version.
+        """
+        self.manifest_file = manifest_file
+        self.version = version
+        self.files = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file, "rt") as open_file:
+                content = json.load(open_file)
+            if content.get("version") == version:
+                self.files = dict(
+                    (input_dicom, record)
+                    for input_dicom, record in content["files"].items()
+                    if os.path.isfile(input_dicom))
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, input_dicom):
+        """ Get the record of an unchanged input DICOM file.
+
+        Parameters
+        ----------
+        input_dicom: str (mandatory)
+            the input DICOM file path.
+
+        Returns
+        -------
+        record: dict
+            the input file record, None if the file is not recorded or has
+            changed.
+        """
+        record = self.files.get(input_dicom)
+        if record is None or not os.path.isfile(record["output"]):
+            return None
+        stat = os.stat(input_dicom)
+        if record["size"] != stat.st_size:
+            return None
+        if record["mtime"] != stat.st_mtime:
+            if record["hash"] != file_hash(input_dicom):
+                return None
+            record["mtime"] = stat.st_mtime
+        return record
+
+    def add(self, input_dicom, output_dicom, output_log, digest=None):
+        """ Record an anonymized DICOM file.
+
+        Parameters
+        ----------
+        input_dicom: str (mandatory)
+            the input DICOM file path.
+        output_dicom: str (mandatory)
+            the anonymized DICOM file path.
+        output_log: str (mandatory)
+            the anonymization log path, may be None.
+        digest: str (optional, default None)
+            the input file content hash computed while it was anonymized,
+            see 'HashingFile', by default the file is read again.
+        """
+        stat = os.stat(input_dicom)
+        if digest is None:
+            digest = file_hash(input_dicom)
+        self.files[input_dicom] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": digest,
+            "output": output_dicom,
+            "log": output_log}
+
+    def save(self):
+        """ Persist the manifest: the file is replaced at once.
+        """
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "wt") as open_file:
+            json.dump({"version": self.version, "files": self.files},
+                      open_file)
+        os.rename(tmp_file, self.manifest_file)
+
+
+def file_hash(path, buffer_size=1048576):
+    """ Compute the SHA-1 hash of a file content.
+
+    Parameters
+    ----------
+    path: str (mandatory)
+        the file path.
+    buffer_size: int (optional, default 1048576)
+        the size of the blocks read at once.
+
+    Returns
+    -------
+    digest: str
+        the hexadecimal hash.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as open_file:
+        while True:
+            buf = open_file.read(buffer_size)
+            if not buf:
+                break
+            sha1.update(buf)
+    return sha1.hexdigest()
+
+
+class HashingFile(object):
+    """ Binary file wrapper that computes the SHA-1 hash of the file content
+    from the bytes read through it.
+
+    The bytes are hashed in the file order: the bytes read again after a
+    backward seek are not hashed twice, and the bytes skipped by a forward
+    seek are read when the bytes after them are read.
+    """
+    def __init__(self, fileobj, buffer_size=1048576):
+        """ Initialize the HashingFile class.
+
+        Parameters
+        ----------
+        fileobj: file (mandatory)
+            a seekable binary file, positioned at its start.
+        buffer_size: int (optional, default 1048576)
+            the size of the skipped blocks read at once.
+        """
+        self._fileobj = fileobj
+        self._buffer_size = buffer_size
+        self._sha1 = hashlib.sha1()
+        self._hashed = 0
+
+    def read(self, size=-1):
+        start = self._fileobj.tell()
+        if start > self._hashed:
+            self._hash_until(start)
+        data = self._fileobj.read(size)
+        end = start + len(data)
+        if end > self._hashed:
+            self._sha1.update(data[self._hashed - start:])
+            self._hashed = end
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self._fileobj.tell()
+
+    def _hash_until(self, position):
+        """ Hash the file bytes up to a position, the file is then positioned
+        there.
+        """
+        self._fileobj.seek(self._hashed)
+        while self._hashed < position:
+            buf = self._fileobj.read(
+                min(self._buffer_size, position - self._hashed))
+            if not buf:
+                break
+            self._sha1.update(buf)
+            self._hashed += len(buf)
+        self._fileobj.seek(position)
+
+    def hexdigest(self):
+        """ Return the hash of the whole file content: the bytes that have
+        not been read yet are read.
+
+        Returns
+        -------
+        digest: str
+            the hexadecimal hash, see 'file_hash'.
+        """
+        position = self._fileobj.tell()
+        self._fileobj.seek(0, os.SEEK_END)
+        self._hash_until(self._fileobj.tell())
+        self._fileobj.seek(position)
+        return self._sha1.hexdigest()
@@ -0,0 +1,237 @@
+##########################################################################
+# NSAP - Copyright (C) CEA, 2015
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Module that provides an aggregated log of an anonymization run.
+"""
+
+# System import
+import os
+import json
+
+
+# The maximum length of the anonymized values representation stored in an
+# aggregated log
+LOG_REPR_LENGTH = 256
+
+
+class AnonymizationLog(object):
+    """ An append-only JSON lines log of an anonymization run.
+
+    Each line is a JSON object: a value record '{"value": id, "repr": repr}'
+    stores the representation of an anonymized value the first time it is
+    seen, a file record '{"file": path, "output": path, "sop_instance_uid":
+    uid, "tags": {tag: [[id, anon_value], ...]}}' stores the anonymization
+    operations of a file, the values being referenced by their identifiers.
+    When the log is closed, an index file mapping the SOP instance UIDs to
+    the file records positions and the value identifiers to the value
+    records positions is written next to the log.
+
+    Attributes
+    ----------
+    log_file: str
+        the JSON lines log path, None if the log is written in a file-like
+        object.
+    index_file: str
+        the log index path, None if the log is written in a file-like
+        object.
+    """
+    def __init__(self, log_file, append=False):
+        """ Initialize the AnonymizationLog class.
+
+        Parameters
+        ----------
+        log_file: str or file-like (mandatory)
+            the JSON lines log path, or a binary file-like object where the
+            log is written: the index is then not written, see 'index', and
+            the object is not closed.
+        append: bool (optional, default False)
+            if set the records are appended to an existing log, otherwise
+            the log is overwritten.
+        """
+        self._values = {}
+        self._value_offsets = []
+        self._uid_offsets = {}
+        self._closed = False
+        if hasattr(log_file, "write"):
+            self.log_file = None
+            self.index_file = None
+            self._open_file = log_file
+            return
+        self.log_file = log_file
+        self.index_file = index_path(log_file)
+        if append and os.path.isfile(log_file):
+            with open(log_file, "rb") as open_file:
+                offset = 0
+                for line in open_file:
+                    record = json.loads(line.decode("ascii"))
+                    if "value" in record:
+                        self._values[json.dumps(
+                            record["repr"], sort_keys=True)] = record["value"]
+                        self._value_offsets.append(offset)
+                    elif record["sop_instance_uid"] is not None:
+                        self._uid_offsets[record["sop_instance_uid"]] = offset
+                    offset += len(line)
+            self._open_file = open(log_file, "ab")
+        else:
+            self._open_file = open(log_file, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, input_dicom, output_dicom, sop_instance_uid, log):
+        """ Append the anonymization operations of a DICOM file.
+
+        Parameters
+        ----------
+        input_dicom: str (mandatory)
+            the DICOM file path.
+        output_dicom: str (mandatory)
+            the anonymized DICOM file path.
+        sop_instance_uid: str (mandatory)
+            the DICOM file SOP instance UID, may be None.
+        log: dict (mandatory)
+            the anonymization operations, see 'Anonymizer'.
+        """
+        tags = {}
+        for tag_repr, operations in log.items():
+            tags[tag_repr] = [
+                [self._value_id(value_repr), anon_value]
+                for value_repr, anon_value in operations]
+        offset = self._write({
+            "file": input_dicom,
+            "output": output_dicom,
+            "sop_instance_uid": sop_instance_uid,
+            "tags": tags})
+        if sop_instance_uid is not None:
+            self._uid_offsets[sop_instance_uid] = offset
+
+    def index(self):
+        """ Return the log index.
+
+        Returns
+        -------
+        index: dict
+            the positions of the file records indexed by SOP instance UID
+            in 'sop_instance_uids' and the positions of the value records in
+            'values'.
+        """
+        return {"sop_instance_uids": self._uid_offsets,
+                "values": self._value_offsets}
+
+    def close(self):
+        """ Close the log and write its index.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self.log_file is None:
+            return
+        self._open_file.close()
+        with open(self.index_file, "w") as open_file:
+            json.dump(self.index(), open_file)
+
+    def _value_id(self, value_repr):
+        """ Get the identifier of a value representation, the value record
+        is appended the first time the value is seen.
+        """
+        key = json.dumps(value_repr, sort_keys=True)
+        value_id = self._values.get(key)
+        if value_id is None:
+            value_id = len(self._value_offsets)
+            self._value_offsets.append(self._write(
+                {"value": value_id, "repr": value_repr}))
+            self._values[key] = value_id
+        return value_id
+
+    def _write(self, record):
+        """ Append a record and return its position.
+        """
+        offset = self._open_file.tell()
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self._open_file.write(line.encode("ascii"))
+        return offset
+
+
+def index_path(log_file):
+    """ Get the index path of an aggregated anonymization log.
+
+    Parameters
+    ----------
+    log_file: str (mandatory)
+        the JSON lines log path.
+
+    Returns
+    -------
+    index_file: str
+        the log index path.
+    """
+    return os.path.splitext(log_file)[0] + ".index.json"
+
+
+def read_anonymization_log(log_file, sop_instance_uid=None):
+    """ Read an aggregated anonymization log.
+
+    Parameters
+    ----------
+    log_file: str (mandatory)
+        the JSON lines log path, see 'AnonymizationLog'.
+    sop_instance_uid: str (optional, default None)
+        if set only return the record of this SOP instance UID, found
+        with the log index.
+
+    Returns
+    -------
+    records: list of dict or dict
+        the file records, the value identifiers being replaced by the values
+        representation. If 'sop_instance_uid' is set, the record of this
+        SOP instance, None if not found.
+    """
+    # Look up a single record
+    if sop_instance_uid is not None:
+        with open(index_path(log_file), "r") as open_file:
+            index = json.load(open_file)
+        offset = index["sop_instance_uids"].get(sop_instance_uid)
+        if offset is None:
+            return None
+        with open(log_file, "rb") as open_file:
+            record = _read_record(open_file, offset)
+            values = {}
+            for operations in record["tags"].values():
+                for operation in operations:
+                    value_id = operation[0]
+                    if value_id not in values:
+                        values[value_id] = _read_record(
+                            open_file, index["values"][value_id])["repr"]
+                    operation[0] = values[value_id]
+        return record
+
+    # Read all the records
+    records = []
+    values = []
+    with open(log_file, "rb") as open_file:
+        for line in open_file:
+            record = json.loads(line.decode("ascii"))
+            if "value" in record:
+                values.append(record["repr"])
+                continue
+            for operations in record["tags"].values():
+                for operation in operations:
+                    operation[0] = values[operation[0]]
+            records.append(record)
+    return records
+
+
+def _read_record(open_file, offset):
+    """ Read the log record at the specified position.
+    """
+    open_file.seek(offset)
+    return json.loads(open_file.readline().decode("ascii"))
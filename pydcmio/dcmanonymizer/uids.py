@@ -0,0 +1,96 @@
+##########################################################################
+# NSAP - Copyright (C) CEA, 2015
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Module that provides a deterministic DICOM UID remapping.
+"""
+
+# System import
+import hmac
+import hashlib
+import collections
+
+
+# The root of the UIDs derived from 128-bit numbers (PS 3.5 B.2)
+UID_ROOT = "2.25."
+
+
+class UIDMapper(object):
+    """ Keyed deterministic DICOM UID remapping.
+
+    A UID is replaced by the 128 first bits of its HMAC-SHA256 keyed digest
+    rendered under the '2.25' root: the same UID is mapped to the same new
+    UID in any process sharing the key, without any shared table, which
+    keeps the study, series and instance references consistent. The last
+    mapped UIDs are kept in a bounded LRU cache.
+
+    Attributes
+    ----------
+    maxsize: int
+        the maximum number of cached UIDs, 0 disables the cache.
+    hits: int
+        the number of UIDs served from the cache.
+    misses: int
+        the number of hashed UIDs.
+    """
+    def __init__(self, key, maxsize=1024):
+        """ Initialize the UIDMapper class.
+
+        Parameters
+        ----------
+        key: str or bytes (mandatory)
+            the secret mapping key: share this key to map the UIDs
+            consistently on all the processes and nodes.
+        maxsize: int (optional, default 1024)
+            the maximum number of cached UIDs, 0 disables the cache.
+        """
+        if not isinstance(key, bytes):
+            key = key.encode("utf-8")
+        self._key = key
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._uids = collections.OrderedDict()
+
+    def get(self, uid):
+        """ Return the new UID of a UID.
+
+        Parameters
+        ----------
+        uid: str (mandatory)
+            the UID to replace, the padding is not considered.
+
+        Returns
+        -------
+        new_uid: str
+            the new UID.
+        """
+        uid = uid.rstrip(" \x00")
+        new_uid = self._uids.pop(uid, None)
+        if new_uid is None:
+            self.misses += 1
+            digest = hmac.new(self._key, uid.encode("ascii"),
+                              hashlib.sha256).hexdigest()
+            new_uid = UID_ROOT + str(int(digest[:32], 16))
+        else:
+            self.hits += 1
+        if self.maxsize > 0:
+            self._uids[uid] = new_uid
+            while len(self._uids) > self.maxsize:
+                self._uids.popitem(last=False)
+        return new_uid
+
+    def clear(self):
+        """ Remove all the cached UIDs and reset the counters.
+        """
+        self._uids.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._uids)
@@ -12,17 +12,151 @@ Module that provides tools to anonymize DICOM files.
 
 
 # System import
+import struct
 import dicom
 from dicom.dataelem import DataElement_from_raw, RawDataElement
 
 
-def repr_dataelement(data_element):
+# The explicit VRs encoded with a 4 bytes length, the undefined length and
+# the encapsulated items delimitation tags
+LONG_LENGTH_VRS = (b"OB", b"OW", b"OF", b"SQ", b"UT", b"UN")
+UNDEFINED_LENGTH = 0xffffffff
+ITEM_TAG = (0xfffe, 0xe000)
+SEQUENCE_DELIMITER_TAG = (0xfffe, 0xe0dd)
+
+# The DICOM magic bytes located after the 128 bytes preamble, and the first
+# groups of the DICOM files written without preamble
+DICOM_MAGIC = b"DICM"
+PREAMBLE_LENGTH = 128
+FIRST_GROUPS = (0x0002, 0x0008)
+
+# The de-identification actions removing a data element
+REMOVE_ACTIONS = ("X", "X/Z", "X/D", "X/Z/D", "X/Z/U*")
+
+
+def is_dicom(header):
+    """ Check if a content starts like a DICOM file.
+
+    Parameters
+    ----------
+    header: bytes (mandatory)
+        the first 132 bytes of the content, at least.
+
+    Returns
+    -------
+    is_dicom: bool
+        True if the 'DICM' magic bytes follow the preamble, or if the
+        content starts with a file meta or identifying data element for the
+        files without preamble.
+    """
+    if header[PREAMBLE_LENGTH: PREAMBLE_LENGTH + 4] == DICOM_MAGIC:
+        return True
+    if len(header) < 8:
+        return False
+    return struct.unpack("<H", header[:2])[0] in FIRST_GROUPS
+
+
+def is_dicom_file(path):
+    """ Check if a file is a DICOM file from its magic bytes, see
+    'is_dicom'.
+
+    Parameters
+    ----------
+    path: str (mandatory)
+        the file path.
+
+    Returns
+    -------
+    is_dicom: bool
+        True if the file is a DICOM file.
+    """
+    with open(path, "rb") as open_file:
+        return is_dicom(open_file.read(PREAMBLE_LENGTH + 4))
+
+
+def repr_tag(tag):
+    """ Compute the 'gggg,eeee' representation of a tag.
+
+    Parameters
+    ----------
+    tag: int (mandatory)
+        a 32-bit DICOM tag.
+
+    Returns
+    -------
+    tag_repr: str
+        the tag representation.
+    """
+    return "{0:04x},{1:04x}".format(tag >> 16, tag & 0xffff)
+
+
+def compile_tag_patterns(patterns):
+    """ Compile tag patterns in bitmask tests.
+
+    A pattern is a 'gggg,eeee' tag representation where each 'x' is an any
+    hexadecimal digit wildcard. A 32-bit tag matches a pattern if
+    'tag & mask == value'.
+
+    Parameters
+    ----------
+    patterns: list of 2-uplet (mandatory)
+        the (pattern, item) 2-uplets.
+
+    Returns
+    -------
+    compiled_patterns: dict
+        the items indexed by pattern mask and value: {mask: {value: item}}.
+        The first item is kept for a duplicated pattern.
+    """
+    compiled_patterns = {}
+    for pattern, item in patterns:
+        digits = pattern.replace(",", "").lower()
+        if len(digits) != 8:
+            raise ValueError("'{0}' is not a valid tag pattern.".format(
+                pattern))
+        mask = int("".join("0" if digit == "x" else "f"
+                           for digit in digits), 16)
+        value = int(digits.replace("x", "0"), 16)
+        compiled_patterns.setdefault(mask, {}).setdefault(value, item)
+    return compiled_patterns
+
+
+def match_tag(compiled_patterns, tag, default=None):
+    """ Match a tag against compiled tag patterns.
+
+    Parameters
+    ----------
+    compiled_patterns: dict (mandatory)
+        the compiled patterns, see 'compile_tag_patterns'.
+    tag: int (mandatory)
+        a 32-bit DICOM tag.
+    default: object (optional, default None)
+        the value returned if no pattern matches.
+
+    Returns
+    -------
+    item: object
+        the item of the first matching mask.
+    """
+    for mask, values in compiled_patterns.items():
+        item = values.get(tag & mask, default)
+        if item is not default:
+            return item
+    return default
+
+
+def repr_dataelement(data_element, max_length=None):
     """ Compute the representation of a data element.
 
     Parameters
     ----------
     data_element: dicom.dataset.DataElement (mandatory)
         a data element to be represented.
+    max_length: int (optional, default None)
+        if set, bound the representation: the values are truncated to
+        'max_length' characters and the sequence items are not represented
+        once the items representation exceeds 'max_length' characters, the
+        missing parts being marked with '...'.
 
     Returns
     -------
@@ -33,16 +167,29 @@ def repr_dataelement(data_element):
     if data_element.VR == "SQ":
         if isinstance(data_element, RawDataElement):
             data_element = DataElement_from_raw(data_element)
+        size = 0
         for inner_dataset in data_element.value:
+            if max_length is not None and size > max_length:
+                desc.append("...")
+                break
             inner_desc = []
             for inner_tag, innerdata_element in inner_dataset.items():
-                inner_repr = repr_dataelement(innerdata_element)
+                inner_repr = repr_dataelement(innerdata_element, max_length)
                 if isinstance(inner_repr, list):
                     inner_repr = repr(inner_repr)
+                size += len(inner_repr)
                 inner_desc.append([inner_tag, inner_repr])
             desc.append(inner_desc)
     else:
-        desc = repr(data_element.value)
+        value = data_element.value
+        if max_length is None:
+            desc = repr(value)
+        elif isinstance(value, bytes) and len(value) > max_length:
+            desc = repr(value[:max_length]) + "..."
+        else:
+            desc = repr(value)
+            if len(desc) > max_length:
+                desc = desc[:max_length] + "..."
     return desc
 
 
@@ -61,17 +208,16 @@ def add_dataelement(dataset, tag, value, VR=None):
         the DICOM value representation: expected if the tag does not exist in
         the current dataset.
     """
-    if tag in dataset:
-        dataset[tag].value = value
-    elif VR is "SQ":
+    if VR == "SQ":
         sequence = []
         for sqvalue in value:
             sqdataset = dicom.dataset.Dataset()
             for sqtag, sqvalue, sqVR in sqvalue:
                 add_dataelement(sqdataset, sqtag, sqvalue, sqVR)
             sequence.append(sqdataset)
-        element = dicom.dataset.DataElement(tag, VR, sequence)
-        dataset.add(element)
+        value = sequence
+    if tag in dataset:
+        dataset[tag].value = value
     elif VR is not None:
         element = dicom.dataset.DataElement(tag, VR, value)
         dataset.add(element)
@@ -90,7 +236,8 @@ def replace_by(value, VR, action,
                default_age="000M",
                default_decimal="0.0",
                default_integer="0",
-               default_uid="000.000.0"):
+               default_uid="000.000.0",
+               uid_mapper=None):
     """ Replace a 'value' depending of the input 'action' and the value
     representation 'VR'.
 
@@ -119,8 +266,12 @@ def replace_by(value, VR, action,
       sequences containing UID references)
 
     We use here the PS 3.6 convention.
+
+    If a 'uid_mapper' is specified, the UIDs replaced with the U or D actions
+    are remapped with it, see 'UIDMapper', otherwise they are replaced by
+    'default_uid'.
     """
-    if action in ["X", "X/Z", "X/D", "X/Z/D", "X/Z/U*"]:
+    if action in REMOVE_ACTIONS:
         return None
     elif action in ["U", "D", "Z", "Z/D"]:
         if VR == "DA":
@@ -144,7 +295,11 @@ def replace_by(value, VR, action,
         elif VR == "PN":
             return default_name
         elif VR == "UI":
-            return default_uid
+            if uid_mapper is None or action not in ["U", "D"] or not value:
+                return default_uid
+            if isinstance(value, str):
+                return uid_mapper.get(value)
+            return [uid_mapper.get(item) for item in value]
         elif VR == "CS":
             return default_code
         elif VR in ["LO", "LT", "ST", "SH"]:
@@ -156,3 +311,71 @@ def replace_by(value, VR, action,
                             "'{1}'.".format(VR, value))
     else:
         raise Exception("Action '{0}' is not yet supported.".format(action))
+
+
+def skip_dataelement(fp, is_implicit_VR, is_little_endian):
+    """ Skip the raw data element starting at the current file position.
+
+    The undefined length data elements, like the encapsulated pixel data,
+    are skipped item by item up to their sequence delimiter.
+
+    Parameters
+    ----------
+    fp: file (mandatory)
+        a binary file positioned at the start of a data element.
+    is_implicit_VR: bool (mandatory)
+        the file value representation encoding.
+    is_little_endian: bool (mandatory)
+        the file byte ordering.
+
+    Returns
+    -------
+    tag: 2-uplet
+        the skipped data element tag.
+    """
+    endian = "<" if is_little_endian else ">"
+    tag = struct.unpack(endian + "HH", fp.read(4))
+    if is_implicit_VR:
+        length, = struct.unpack(endian + "I", fp.read(4))
+    else:
+        vr = fp.read(2)
+        if vr in LONG_LENGTH_VRS:
+            length, = struct.unpack(endian + "2xI", fp.read(6))
+        else:
+            length, = struct.unpack(endian + "H", fp.read(2))
+    if length != UNDEFINED_LENGTH:
+        fp.seek(length, 1)
+        return tag
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            raise ValueError("Truncated undefined length data element.")
+        group, element, length = struct.unpack(endian + "HHI", header)
+        if (group, element) == SEQUENCE_DELIMITER_TAG:
+            return tag
+        if (group, element) != ITEM_TAG or length == UNDEFINED_LENGTH:
+            raise ValueError("Unexpected item in undefined length data "
+                             "element.")
+        fp.seek(length, 1)
+
+
+def copy_bytes(src, dst, size, buffer_size=1048576):
+    """ Copy bytes from a file to another with a bounded buffer.
+
+    Parameters
+    ----------
+    src: file (mandatory)
+        the source binary file.
+    dst: file (mandatory)
+        the destination binary file.
+    size: int (mandatory)
+        the number of bytes to copy.
+    buffer_size: int (optional, default 1MiB)
+        the size of the copied blocks.
+    """
+    while size > 0:
+        buffer = src.read(min(size, buffer_size))
+        if not buffer:
+            raise ValueError("Unexpected end of file.")
+        dst.write(buffer)
+        size -= len(buffer)
@@ -19,13 +19,13 @@ import json
 import time
 
 # Third party import
-import dicom
 import nibabel
 import numpy
 
 # Dcmio import
 from pydcmio.dcmreader.reader import get_values
 from pydcmio.dcmreader.reader import walk
+from pydcmio.dcmreader.reader import get_index
 from pydcmio.dcm2nii.wrapper import Dcm2NiiWrapper
 
 
@@ -331,10 +331,10 @@ def add_meta_to_nii(nii_file, dicom_dir, dcm_tags, outdir, prefix="f",
     if not os.path.isdir(outdir):
         os.makedirs(outdir)
 
-    # Load the first listed dicom image
+    # Load and index the first listed dicom image header: all the tag
+    # lookups share a single traversal
     dicom_files = os.listdir(dicom_dir)
-    dataset = dicom.read_file(os.path.join(dicom_dir, dicom_files[0]),
-                              force=True)
+    index = get_index(os.path.join(dicom_dir, dicom_files[0]))
 
     # Load the nifti1 image
     niiimage = nibabel.load(nii_file)
@@ -347,7 +347,7 @@ def add_meta_to_nii(nii_file, dicom_dir, dcm_tags, outdir, prefix="f",
         header = niiimage.get_header()
 
         # > slice_duration: Time for 1 slice
-        repetition_time = get_values(dataset, "get_repetition_time")
+        repetition_time = get_values(index, "get_repetition_time")
         if repetition_time is not None and len(niiimage.shape) > 2:
             repetition_time = float(repetition_time)
             header.set_dim_info(slice=2)
@@ -360,7 +360,7 @@ def add_meta_to_nii(nii_file, dicom_dir, dcm_tags, outdir, prefix="f",
         # of sequence
         content = {}
         for name, tag, stack_values in dcm_tags:
-            content[str(name)] = walk(dataset, tag, stack_values=stack_values)
+            content[str(name)] = walk(index, tag, stack_values=stack_values)
 
         # > add/update free content
         content.update(additional_information)
@@ -21,7 +21,13 @@ import traceback
 
 # Third party import
 import progressbar
-import dicom
+
+# Dcmio import
+from pydcmio.dcmreader.reader import get_index
+
+
+# The last top level tag used to split the DICOM files
+SPLIT_STOP_AFTER_TAG = (0x0020, 0x0011)
 
 
 def decode(attribute):
@@ -141,9 +147,10 @@ def _split(dicom_file, acquisition_datetime, outdir, skip_non_dicom_files,
     # Get the time of last modification
     mtime = os.path.getmtime(dicom_file)
 
-    # Read DICOM dataset
+    # Read DICOM dataset header until the last tag used to split the files
     try:
-        dataset = dicom.read_file(dicom_file)
+        index = get_index(dicom_file, stop_after_tag=SPLIT_STOP_AFTER_TAG,
+                          force=False)
     except:
         if skip_non_dicom_files:
             return
@@ -154,8 +161,8 @@ def _split(dicom_file, acquisition_datetime, outdir, skip_non_dicom_files,
     # Find character encoding of DICOM attributes:
     # we currently expect encoding to be ISO_IR 100
     if check_encoding:
-        if (0x0008, 0x0005) in dataset:
-            SpecificCharacterSet = dataset[0x0008, 0x0005].value
+        SpecificCharacterSet = index.get((0x0008, 0x0005))
+        if SpecificCharacterSet is not None:
             if SpecificCharacterSet != "ISO_IR 100":
                 print("'{0}' file encoding is not ISO_IR 100 as "
                       "expected.".format(dicom_file))
@@ -166,28 +173,27 @@ def _split(dicom_file, acquisition_datetime, outdir, skip_non_dicom_files,
 
     # Process other DICOM attributes:
     # decode strings assuming 'ISO_IR 100'
-    SeriesDescription = None
-    if (0x0008, 0x0018) not in dataset:
+    SOPInstanceUID = index.get((0x0008, 0x0018))
+    if SOPInstanceUID is None:
         if skip_non_dicom_files:
             return
         raise ValueError(
             "'{0}' does not contain a SOPInstanceUID.".format(
                 dicom_file))
-    SOPInstanceUID = dataset[0x0008, 0x0018].value
-    if (0x0008, 0x103e) in dataset:
-        SeriesDescription = cleanup(
-            decode(dataset[0x0008, 0x103e].value))
+    SeriesDescription = index.get((0x0008, 0x103e))
+    if SeriesDescription is not None:
+        SeriesDescription = cleanup(decode(SeriesDescription))
     if check_session:
-        SeriesNumber = dataset[0x0020, 0x0011].value
-        if (0x0018, 0x0081) in dataset:
-            EchoTime = dataset[0x0018, 0x0081].value
-        else:
-            EchoTime = "NA"
+        SeriesNumber = index.get((0x0020, 0x0011))
+        if SeriesNumber is None:
+            raise ValueError(
+                "'{0}' does not contain a SeriesNumber.".format(dicom_file))
+        EchoTime = index.get((0x0018, 0x0081), "NA")
 
     # Check the session time
     if check_session:
-        current_acquisition_datetime = (dataset[0x0008, 0x0020].value +
-                                        dataset[0x0008, 0x0030].value)
+        current_acquisition_datetime = (index.get((0x0008, 0x0020)) +
+                                        index.get((0x0008, 0x0030)))
         if acquisition_datetime is None:
             acquisition_datetime = current_acquisition_datetime
         elif acquisition_datetime != current_acquisition_datetime:
@@ -0,0 +1,276 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2013 - 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Persistent on-disk cache of the Dicom file headers.
+"""
+
+# System import
+import os
+import pickle
+import sqlite3
+
+# Third party import
+import dicom
+
+# Dcmio import
+from pydcmio.dcmreader import reader
+from pydcmio.dcmreader.reader import TagIndex
+from pydcmio.dcmreader.reader import read_header
+
+
+# Marker of a content missing from the cache
+_MISSING = object()
+
+
+class CachedTagIndex(TagIndex):
+    """ Tag index restored from the header cache: the indexed data elements
+    are stored in their raw form and the index is not linked to a dataset.
+    """
+    def __init__(self, occurrences):
+        """ Initialize the CachedTagIndex class.
+
+        Parameters
+        ----------
+        occurrences: dict (mandatory)
+            the ordered occurrences of each tag as (sequence path, (data
+            element, character set)) 2-uplets, see 'index_data_elements'.
+        """
+        self.dataset = None
+        self._occurrences = dict(
+            (dicom.tag.Tag(tag), items) for tag, items in occurrences.items())
+
+    def _resolve(self, tag, location):
+        """ Return the value of an indexed data element: here the location
+        is the raw or converted data element and the character set of its
+        dataset, the raw data element is converted as a dataset does.
+        """
+        data_element, character_set = location
+        if isinstance(data_element, tuple):
+            data_element = dicom.dataelem.DataElement_from_raw(
+                data_element, character_set)
+        return data_element.value
+
+
+def index_data_elements(index):
+    """ Return the storable occurrences of the data elements of a tag index.
+
+    The data elements are kept in their raw form with the character set of
+    their dataset, so that the restored values have the pydicom types of
+    the uncached lookups. The deferred data elements, whose values have
+    not been read, are skipped.
+
+    Parameters
+    ----------
+    index: TagIndex (mandatory)
+        the tag index of a dataset.
+
+    Returns
+    -------
+    occurrences: dict
+        the ordered occurrences of each tag as (sequence path, (data
+        element, character set)) 2-uplets.
+    """
+    occurrences = {}
+    for tag, locations in index._occurrences.items():
+        items = []
+        for sequence_path, dataset in locations:
+            data_element = dict.__getitem__(dataset, tag)
+            if isinstance(data_element, tuple) and data_element.value is None:
+                continue
+            if tag != (0x0008, 0x0005):
+                character_set = dataset._character_set
+            else:
+                character_set = dicom.charset.default_encoding
+            items.append((sequence_path, (data_element, character_set)))
+        if len(items) > 0:
+            occurrences[int(tag)] = items
+    return occurrences
+
+
+class HeaderCache(object):
+    """ SQLite cache of the Dicom file headers.
+
+    Each cached content is keyed by the file path, size and modification
+    time: a file that has been modified is read again.
+    """
+    def __init__(self, cachedir):
+        """ Initialize the HeaderCache class.
+
+        Parameters
+        ----------
+        cachedir: str (mandatory)
+            the directory where the cache database is stored.
+        """
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        self.cachefile = os.path.join(cachedir, "pydcmio_headers.db")
+        self._connection = None
+        self._pid = None
+        with self.connection as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS headers ("
+                "path TEXT, kind TEXT, size INTEGER, mtime_ns INTEGER, "
+                "content BLOB, PRIMARY KEY (path, kind))")
+
+    @property
+    def connection(self):
+        """ The database connection, one per process.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.cachefile, timeout=60)
+            self._pid = os.getpid()
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    def get(self, path, kind, default=None):
+        """ Return a file cached content.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the path to a Dicom file.
+        kind: str (mandatory)
+            the name of the content.
+        default: object (optional, default None)
+            the value returned if the content has not been cached or if the
+            file has changed.
+
+        Returns
+        -------
+        content: object
+            the cached content.
+        """
+        path, size, mtime_ns = file_key(path)
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, content FROM headers WHERE path = ? AND "
+            "kind = ?", (path, kind)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime_ns:
+            return default
+        return pickle.loads(bytes(row[2]))
+
+    def set(self, path, kind, content):
+        """ Cache a file content.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the path to a Dicom file.
+        kind: str (mandatory)
+            the name of the content.
+        content: object (mandatory)
+            the content to be cached: it must be picklable.
+        """
+        path, size, mtime_ns = file_key(path)
+        blob = sqlite3.Binary(pickle.dumps(content, protocol=2))
+        with self.connection as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO headers VALUES (?, ?, ?, ?, ?)",
+                (path, kind, size, mtime_ns, blob))
+
+    def cached(self, path, kind, func):
+        """ Return a file cached content, computing it when needed.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the path to a Dicom file.
+        kind: str (mandatory)
+            the name of the content.
+        func: callable (mandatory)
+            a function that computes the content from the file path.
+
+        Returns
+        -------
+        content: object
+            the file content.
+        """
+        content = self.get(path, kind, default=_MISSING)
+        if content is _MISSING:
+            content = func(path)
+            self.set(path, kind, content)
+        return content
+
+    def get_index(self, dcmpath, force=True):
+        """ Return the tag index of a Dicom file.
+
+        Parameters
+        ----------
+        dcmpath: str (mandatory)
+            the path to a Dicom file: the whole header is read and cached,
+            except the deferred values larger than 'HEADER_DEFER_SIZE'.
+        force: bool (optional, default True)
+            if set, read the file even if no Dicom header is found: the
+            forced and unforced indices are cached separately.
+
+        Returns
+        -------
+        index: CachedTagIndex
+            the file tag index.
+        """
+        def index_file(path):
+            return index_data_elements(TagIndex(read_header(
+                path, force=force, raw=True)))
+
+        kind = "raw_index" if force else "raw_index_unforced"
+        return CachedTagIndex(self.cached(dcmpath, kind, index_file))
+
+    def clear(self):
+        """ Remove all the cached contents.
+        """
+        with self.connection as connection:
+            connection.execute("DELETE FROM headers")
+
+
+def file_key(path):
+    """ Return the cache key of a file.
+
+    Parameters
+    ----------
+    path: str (mandatory)
+        the path to a file.
+
+    Returns
+    -------
+    key: 3-uplet
+        the file real path, size and modification time in nanoseconds.
+    """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    mtime_ns = getattr(stat, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return path, stat.st_size, mtime_ns
+
+
+def enable_header_cache(cachedir):
+    """ Enable the persistent header cache: the Dicom files read by the
+    reader functions are served from the cache when unchanged.
+
+    Parameters
+    ----------
+    cachedir: str (mandatory)
+        the directory where the cache database is stored.
+
+    Returns
+    -------
+    cache: HeaderCache
+        the enabled header cache.
+    """
+    reader.HEADER_CACHE = HeaderCache(cachedir)
+    return reader.HEADER_CACHE
+
+
+def disable_header_cache():
+    """ Disable the persistent header cache.
+    """
+    reader.HEADER_CACHE = None
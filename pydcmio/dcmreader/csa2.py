@@ -12,46 +12,239 @@ Parse private Siemens CSA2 header field.
 
 # System import
 import os
-import ast
-import dicom
 import struct
+import collections
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
+# Dcmio import
+from pydcmio.dcmreader.reader import load_dataset
+from pydcmio.dcmreader.reader import get_header_cache
 
-def get_siemens_csa2_header(dataset_or_dcmpath):
+
+# The Siemens private tags containing the CSA2 headers, and the last tag
+# of their private group
+CSA2_TAGS = [(0x0029, 0x1010), (0x0029, 0x1020), (0x0029, 0x1210),
+             (0x0029, 0x1110)]
+CSA2_SERIES_TAGS = [(0x0029, 0x1020), (0x0029, 0x1220), (0x0029, 0x1120)]
+CSA2_STOP_AFTER_TAG = (0x0029, 0xffff)
+
+# The little endian CSA2 header structures, an element header may be read
+# with the header of its first item
+CSA2_HEADER = struct.Struct(
+    "<"   # Little-endian
+    "4s"  # SV10
+    "4s"  # \x04\x03\x02\x01
+    "I"   # Number of items
+    "I"   # Unknown
+)
+CSA2_ELEMENT = struct.Struct(
+    "<"    # Little endian
+    "64s"  # Name
+    "I"    # VM
+    "2s"   # VR
+    "2x"   # Unknown (end of VR ?)
+    "I"    # Syngo datatype
+    "I"    # Number of items
+    "I"    # Unknown
+)
+CSA2_ELEMENT_ITEM = struct.Struct(
+    "<"    # Little endian
+    "64s"  # Name
+    "I"    # VM
+    "2s"   # VR
+    "2x"   # Unknown (end of VR ?)
+    "I"    # Syngo datatype
+    "I"    # Number of items
+    "I"    # Unknown
+    "4x"   # First item unknown
+    "I"    # First item length
+    "8x"   # First item unknown (ignored)
+)
+CSA2_ITEM = struct.Struct(
+    "<"   # Little endian
+    "4I"  # Length
+)
+CSA2_CONVERTERS = {
+    b"DS": float, b"FL": float, b"FD": float,
+    b"IS": int, b"SS": int, b"US": int, b"SL": int, b"UL": int
+}
+
+# Bound unpackers and the cache of the consecutive item length structures
+_unpack_element = CSA2_ELEMENT.unpack_from
+_element_size = CSA2_ELEMENT.size
+_unpack_element_item = CSA2_ELEMENT_ITEM.unpack_from
+_element_item_size = CSA2_ELEMENT_ITEM.size
+_unpack_item_length = struct.Struct("<4xI").unpack_from
+_item_size = CSA2_ITEM.size
+_ITEM_LENGTHS = {}
+
+
+def get_siemens_csa2_header(dataset_or_dcmpath, series=False):
     """ Return a dictionary with the Siemens CSA2 Header.
 
+    The identical headers, like the series header shared by all the slices
+    of a series, are parsed once: see 'CSA2_CACHE'.
+
     Parameters
     ----------
     dataset_or_dcmpath: dataset or str (mandatory)
-        a pydicom dataset structure or a path to a valid Dicom file.
+        a pydicom dataset structure or a path to a valid Dicom file: the
+        file parsing stops after the Siemens private group, and the header
+        is served from the header cache if enabled.
+    series: bool (optional, default False)
+        if set return the CSA2 series header, otherwise the first CSA2
+        header found, usually the image header.
 
     Returns
     -------
-    content: dict
-        a dictionnary containing the Siemens CSA2 header as (tag, values)
-        items.
+    content: CSA2Header
+        a lazy mapping containing the Siemens CSA2 header as (tag, values)
+        items: the values are decoded when accessed. The mapping may be
+        shared with other files and must not be modified.
     """
-    # Deal with input parameters
-    if isinstance(dataset_or_dcmpath, str):
-        if not os.path.isfile(dataset_or_dcmpath):
-            raise ValueError("'{0}' is not a valid Dicom file.".format(
-                dataset_or_dcmpath))
-        dataset = dicom.read_file(dataset_or_dcmpath, force=True)
-    else:
-        if not isinstance(dataset_or_dcmpath, dicom.dataset.Dataset):
-            raise ValueError("'{0}' is not a 'pydicom' Dataset.".format(
-                dataset_or_dcmpath))
-        dataset = dataset_or_dcmpath
-
-    # Get the csa2 header representation
-    content = None
-    for tag in [(0x0029, 0x1010), (0x0029, 0x1020), (0x0029, 0x1210),
-                (0x0029, 0x1110)]:
-        if tag in dataset:
-            content = parse_csa2(dataset[tag])
-            break
+    tags = CSA2_SERIES_TAGS if series else CSA2_TAGS
 
-    return content
+    def read_csa2(dataset_or_dcmpath):
+        dataset = load_dataset(dataset_or_dcmpath,
+                               stop_after_tag=CSA2_STOP_AFTER_TAG)
+        content = None
+        for tag in tags:
+            if tag in dataset:
+                content = CSA2_CACHE.get(dataset[tag].value)
+                break
+        return content
+
+    # Use the header cache if enabled
+    cache = get_header_cache()
+    if (cache is not None and isinstance(dataset_or_dcmpath, str) and
+            os.path.isfile(dataset_or_dcmpath)):
+        kind = "csa2_series" if series else "csa2"
+        return cache.cached(dataset_or_dcmpath, kind, read_csa2)
+    return read_csa2(dataset_or_dcmpath)
+
+
+class CSA2Cache(object):
+    """ Bounded LRU cache of the parsed Siemens CSA2 headers.
+
+    The headers are keyed by their raw bytes: the dictionary lookup hashes
+    the bytes, and a hit is confirmed by comparing them.
+
+    Attributes
+    ----------
+    maxsize: int
+        the maximum number of cached headers, 0 disables the cache.
+    hits: int
+        the number of headers served from the cache.
+    misses: int
+        the number of parsed headers.
+    """
+    def __init__(self, maxsize=128):
+        """ Initialize the CSA2Cache class.
+
+        Parameters
+        ----------
+        maxsize: int (optional, default 128)
+            the maximum number of cached headers, 0 disables the cache.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._headers = collections.OrderedDict()
+
+    def get(self, csa):
+        """ Return a parsed Siemens CSA2 header.
+
+        Parameters
+        ----------
+        csa: binary (mandatory)
+            the Siemens CSA2 Header.
+
+        Returns
+        -------
+        content: CSA2Header
+            the lazy mapping containing the Siemens CSA2 header.
+        """
+        if not isinstance(csa, bytes):
+            csa = bytes(csa)
+        content = self._headers.pop(csa, None)
+        if content is None:
+            self.misses += 1
+            content = CSA2Header(csa)
+        else:
+            self.hits += 1
+        if self.maxsize > 0:
+            self._headers[csa] = content
+            while len(self._headers) > self.maxsize:
+                self._headers.popitem(last=False)
+        return content
+
+    def resize(self, maxsize):
+        """ Change the maximum number of cached headers.
+
+        Parameters
+        ----------
+        maxsize: int (mandatory)
+            the maximum number of cached headers, 0 disables the cache.
+        """
+        self.maxsize = maxsize
+        while len(self._headers) > max(maxsize, 0):
+            self._headers.popitem(last=False)
+
+    def clear(self):
+        """ Remove all the cached headers and reset the counters.
+        """
+        self._headers.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._headers)
+
+
+class CSA2Header(Mapping):
+    """ Lazy mapping containing the Siemens CSA2 header as (tag, values)
+    items.
+
+    On construction only the element headers are scanned to locate each
+    element, the element items are decoded on first access and memoized.
+    """
+    def __init__(self, csa):
+        """ Initialize the CSA2Header class.
+
+        Parameters
+        ----------
+        csa: binary (mandatory)
+            the Siemens CSA2 Header.
+        """
+        if not isinstance(csa, bytes):
+            csa = bytes(csa)
+        self._csa = csa
+        self._offsets = {}
+        self._items = {}
+        version, _, number_of_elements, _ = CSA2_HEADER.unpack_from(csa, 0)
+        start = CSA2_HEADER.size
+        for _ in range(number_of_elements):
+            name, size = scan_element(csa, start)
+            self._offsets[name] = start
+            start += size
+
+    def __getitem__(self, name):
+        if name not in self._items:
+            (_, items), _ = parse_element(self._csa, self._offsets[name])
+            self._items[name] = items
+        return self._items[name]
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __repr__(self):
+        return "<CSA2Header {0} elements>".format(len(self))
 
 
 def parse_csa2(csa):
@@ -60,6 +253,9 @@ def parse_csa2(csa):
     Siemens CSA Header tag is (0x0029, 0x1020).
     See also http://nipy.org/nibabel/dicom/siemens_csa.html.
 
+    The header is decoded in place with precompiled structures: only the
+    element names and the item values are copied.
+
     Parameters
     ----------
     csa: binary (mandatory)
@@ -71,17 +267,11 @@ def parse_csa2(csa):
         a dictionnary containing the Siemens CSA2 header as (tag, values)
         items.
     """
-    format = ("<"   # Little-endian
-              "4s"  # SV10
-              "4s"  # \x04\x03\x02\x01
-              "I"   # Number of items
-              "I"   # Unknown
-              )
-    size = struct.calcsize(format)
+    if not isinstance(csa, bytes):
+        csa = bytes(csa)
+    version, _, number_of_elements, _ = CSA2_HEADER.unpack_from(csa, 0)
 
-    version, _, number_of_elements, _ = struct.unpack(format, csa[:size])
-
-    start = size
+    start = CSA2_HEADER.size
     content = {}
     for _ in range(number_of_elements):
         (name, items), size = parse_element(csa, start)
@@ -95,42 +285,87 @@ def parse_element(csa, start):
     """ Return a pair (name, items), total_size.
 
     See also http://nipy.org/nibabel/dicom/siemens_csa.html.
+
+    The items are decoded inline: the numeric items are converted without
+    their null terminator, the other items are decoded as strings up to
+    their first null character. Empty numeric items are skipped.
     """
-    format = ("<"    # Little endian
-              "64s"  # Name
-              "I"    # VM
-              "2s"   # VR
-              "2s"   # Unknown (end of VR ?)
-              "I"    # Syngo datatype
-              "I"    # Number of items
-              "I"    # Unknown
-              )
-    size = struct.calcsize(format)
-
-    name, vm, vr, _, syngo_datatype, number_of_items, _ = struct.unpack(
-        format, csa[start:start + size])
-    name = name.split("\x00")[0]
-
-    total_size = size
-    start += size
+    # The element header is unpacked with the length of its first item
+    if len(csa) - start >= _element_item_size:
+        name, vm, vr, _, number_of_items, _, length = _unpack_element_item(
+            csa, start)
+    else:
+        name, vm, vr, _, number_of_items, _ = _unpack_element(csa, start)
+        length = 0
+    name = name.partition(b"\x00")[0].decode("latin_1")
+    converter = CSA2_CONVERTERS.get(vr)
+
+    # Decode the items within the VM
+    offset = start + _element_size
     items = []
-    for i in range(number_of_items):
-        item, size = parse_item(csa, start)
-        if i < vm:
-            if vr in ["DS", "FL", "FD"]:
-                item = float(item[:-1])
-            elif vr in ["IS", "SS", "US", "SL", "UL"]:
-                item = int(item[:-1])
-            else:
-                try:
-                    item = ast.literal_eval(item)
-                except:
-                    pass
-            items.append(item)
-        start += size
-        total_size += size
+    number_of_values = vm if vm < number_of_items else number_of_items
+    for cnt in range(number_of_values):
+        if cnt > 0:
+            length, = _unpack_item_length(csa, offset)
+        offset += _item_size
+        if converter is None:
+            end = csa.find(b"\x00", offset, offset + length)
+            if end < 0:
+                end = offset + length
+            items.append(csa[offset:end].decode("latin_1"))
+        elif length > 0:
+            items.append(converter(csa[offset:offset + length - 1]))
+        offset += (length + 3) & ~3
+
+    # Skip the remaining items, usually empty
+    offset = skip_items(csa, offset, number_of_items - number_of_values)
 
-    return (name, items), total_size
+    return (name, items), offset - start
+
+
+def scan_element(csa, start):
+    """ Return a pair name, total_size without decoding the element items.
+
+    See also http://nipy.org/nibabel/dicom/siemens_csa.html.
+    """
+    name, vm, _, _, number_of_items, _ = _unpack_element(csa, start)
+    name = name.split(b"\x00", 1)[0].decode("latin_1")
+
+    # Walk the items within the VM and skip the remaining ones
+    offset = start + _element_size
+    number_of_values = min(vm, number_of_items)
+    for _ in range(number_of_values):
+        length, = _unpack_item_length(csa, offset)
+        offset += _item_size + ((length + 3) & ~3)
+    offset = skip_items(csa, offset, number_of_items - number_of_values)
+
+    return name, offset - start
+
+
+def skip_items(csa, start, number_of_items):
+    """ Return the offset after several consecutive items.
+
+    The items are usually empty: their lengths are first checked at once.
+    """
+    if number_of_items <= 0:
+        return start
+    if not any(_item_lengths(number_of_items).unpack_from(csa, start)):
+        return start + _item_size * number_of_items
+    offset = start
+    for _ in range(number_of_items):
+        length, = _unpack_item_length(csa, offset)
+        offset += _item_size + ((length + 3) & ~3)
+    return offset
+
+
+def _item_lengths(number_of_items):
+    """ Return the structure of the lengths of several consecutive items.
+    """
+    structure = _ITEM_LENGTHS.get(number_of_items)
+    if structure is None:
+        structure = struct.Struct("<" + "4xI8x" * number_of_items)
+        _ITEM_LENGTHS[number_of_items] = structure
+    return structure
 
 
 def parse_item(csa, start):
@@ -138,20 +373,12 @@ def parse_item(csa, start):
 
     See also http://nipy.org/nibabel/dicom/siemens_csa.html.
     """
-    format = ("<"   # Little endian
-              "4I"  # Length
-              )
-    header_size = struct.calcsize(format)
-
-    length = struct.unpack(format, csa[start:start + header_size])
-
-    format = ("<"     # Little endian
-              "{0}s"  # Content
-              "{1}s"  # Padding (?)
-              ).format(length[1], (4 - length[1] % 4) % 4)
-    content_size = struct.calcsize(format)
-    content, padding = struct.unpack(
-        format,
-        csa[start + header_size:start + header_size + content_size])
-
-    return content, header_size + content_size
+    length, = _unpack_item_length(csa, start)
+    content_start = start + _item_size
+    content = csa[content_start:content_start + length]
+
+    return content, _item_size + ((length + 3) & ~3)
+
+
+# The process wide cache of the parsed CSA2 headers
+CSA2_CACHE = CSA2Cache()
@@ -0,0 +1,182 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2013 - 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Extract the diffusion table of a Dicom series.
+"""
+
+# System import
+import os
+
+# Third party import
+import dicom
+import numpy
+import progressbar
+
+# Dcmio import
+from pydcmio.dcmreader.reader import get_index
+from pydcmio.dcmreader.reader import STANDARD_EXTRACTOR
+from pydcmio.dcmreader.csa2 import CSA2_TAGS
+from pydcmio.dcmreader.csa2 import CSA2_CACHE
+
+
+# The tags used to sort the images and to locate the enhanced Dicom
+# per-frame diffusion description
+ACQUISITION_NUMBER_TAG = (0x0020, 0x0012)
+INSTANCE_NUMBER_TAG = (0x0020, 0x0013)
+NUMBER_OF_FRAMES_TAG = (0x0028, 0x0008)
+PER_FRAME_TAG = dicom.tag.Tag(0x5200, 0x9230)
+
+
+def get_diffusion_table(series_dir_or_files):
+    """ Extract the diffusion table of a Dicom series.
+
+    The diffusion description is read from the enhanced Dicom tags or from
+    the Siemens CSA2 image header (B_value and DiffusionGradientDirection
+    fields). The table contains one row for each image, ie. one for each
+    frame of an enhanced multi-frame file, ordered by acquisition number,
+    instance number and frame. Images without gradient direction, like the
+    b0 images, have a null b-vector.
+
+    Parameters
+    ----------
+    series_dir_or_files: str or list of str (mandatory)
+        a folder containing the Dicom files of a series, hidden files are
+        not considered, or the list of these files.
+
+    Returns
+    -------
+    bvals: array (N, )
+        the b-values.
+    bvecs: array (N, 3)
+        the b-vectors.
+    """
+    # Deal with input parameters
+    if isinstance(series_dir_or_files, str):
+        if not os.path.isdir(series_dir_or_files):
+            raise ValueError(
+                "'{0}' is not a valid directory.".format(series_dir_or_files))
+        dicom_files = [
+            os.path.join(series_dir_or_files, basename)
+            for basename in sorted(os.listdir(series_dir_or_files))
+            if not basename.startswith(".")]
+    else:
+        dicom_files = list(series_dir_or_files)
+
+    # Fill the preallocated table: one row for each file, the table grows
+    # with the enhanced multi-frame files
+    size = len(dicom_files)
+    bvals = numpy.zeros((size, ), dtype=float)
+    bvecs = numpy.zeros((size, 3), dtype=float)
+    keys = numpy.zeros((size, 2), dtype=float)
+    nb_rows = 0
+    with progressbar.ProgressBar(max_value=len(dicom_files),
+                                 redirect_stdout=True) as bar:
+        for cnt, dicom_file in enumerate(dicom_files):
+            index = get_index(dicom_file)
+            source = diffusion_source(index)
+            if source is None:
+                raise ValueError("'{0}' does not contain a diffusion "
+                                 "description.".format(dicom_file))
+            nb_frames, header = source
+            stop = nb_rows + nb_frames
+            if stop > len(bvals):
+                size = max(2 * len(bvals), stop)
+                bvals = numpy.resize(bvals, (size, ))
+                bvecs = numpy.resize(bvecs, (size, 3))
+                keys = numpy.resize(keys, (size, 2))
+            fill_diffusion_rows(index, header, bvals[nb_rows: stop],
+                                bvecs[nb_rows: stop])
+            for key_cnt, tag in enumerate((ACQUISITION_NUMBER_TAG,
+                                           INSTANCE_NUMBER_TAG)):
+                value = index.get(tag)
+                keys[nb_rows: stop, key_cnt] = (
+                    0 if value is None else float(value))
+            nb_rows = stop
+            bar.update(cnt)
+
+    # Order the rows by acquisition: the sort is stable and keeps the
+    # frames order
+    order = numpy.lexsort((keys[:nb_rows, 1], keys[:nb_rows, 0]))
+
+    return bvals[order], bvecs[order]
+
+
+def diffusion_source(index):
+    """ Locate the diffusion description of a Dicom file.
+
+    Parameters
+    ----------
+    index: TagIndex (mandatory)
+        the Dicom file tag index.
+
+    Returns
+    -------
+    source: 2-uplet
+        the number of images in the file and the Siemens CSA2 image header,
+        None for an enhanced Dicom file. None if the file does not contain a
+        diffusion description.
+    """
+    # Enhanced Dicom
+    if STANDARD_EXTRACTOR["get_b_values"][0] in index:
+        nb_frames = index.get(NUMBER_OF_FRAMES_TAG)
+        return (1 if nb_frames is None else int(nb_frames)), None
+
+    # Siemens CSA2 image header
+    for tag in CSA2_TAGS:
+        csa = index.get(tag)
+        if csa is not None:
+            header = CSA2_CACHE.get(csa)
+            if "B_value" in header:
+                return 1, header
+            break
+    return None
+
+
+def fill_diffusion_rows(index, header, bvals, bvecs):
+    """ Fill the diffusion table rows of a Dicom file.
+
+    Parameters
+    ----------
+    index: TagIndex (mandatory)
+        the Dicom file tag index.
+    header: CSA2Header (mandatory)
+        the Siemens CSA2 image header, None for an enhanced Dicom file.
+    bvals: array (M, ) (mandatory)
+        the b-values of the file images, filled inplace.
+    bvecs: array (M, 3) (mandatory)
+        the b-vectors of the file images, filled inplace.
+    """
+    bvals[:] = 0
+    bvecs[:] = 0
+
+    # Siemens CSA2 image header
+    if header is not None:
+        bval = header["B_value"]
+        bvec = header.get("DiffusionGradientDirection", [])
+        if len(bval) > 0:
+            bvals[0] = bval[0]
+        if len(bvec) == 3:
+            bvecs[0] = bvec
+        return
+
+    # Enhanced Dicom: the description of a frame is located in its
+    # per-frame functional group item, other descriptions apply to all the
+    # frames and are overridden by the per-frame ones
+    for tag, array in ((STANDARD_EXTRACTOR["get_b_values"][0], bvals),
+                       (STANDARD_EXTRACTOR["get_b_vectors"][0], bvecs)):
+        for path, value in index.occurrences(tag):
+            frame = slice(None)
+            if len(path) > 0 and path[0][0] == PER_FRAME_TAG:
+                frame = path[0][1]
+                if frame >= len(array):
+                    continue
+            if array.ndim == 2:
+                array[frame] = [float(item) for item in value]
+            else:
+                array[frame] = float(value)
@@ -0,0 +1,237 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2013 - 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Compiled path queries to extract values at a known location of a Dicom
+dataset, like the enhanced Dicom per-frame functional groups.
+"""
+
+# System import
+import re
+import numbers
+import collections
+
+# Third party import
+import dicom
+import numpy
+
+# Dcmio import
+from pydcmio.dcmreader.reader import load_dataset
+
+
+# A query step: a Dicom tag followed by an optional sequence item selector
+QUERY_STEP = re.compile(
+    r"^\(([0-9a-fA-F]{4}),([0-9a-fA-F]{4})\)(?:\[(\*|\d+)\])?$")
+
+# The maximum number of cached compiled queries, and the LRU cache of the
+# compiled queries
+QUERY_CACHE_SIZE = 128
+_QUERIES = collections.OrderedDict()
+
+
+class PathQuery(object):
+    """ A compiled path query.
+
+    A query is a list of steps separated by dots: each step is a Dicom tag
+    '(gggg,eeee)' and the sequence steps select all the sequence items with
+    '[*]' or a single item with '[n]'. For instance
+    '(5200,9230)[*].(0018,9117)[0].(0018,9087)' selects the b-value of each
+    frame of an enhanced Dicom dataset.
+
+    Attributes
+    ----------
+    path: str
+        the query.
+    steps: list of 2-uplet
+        the query steps as (tag, item selector) 2-uplets, where the item
+        selector is None for the last step, '*' or an item index.
+    """
+    def __init__(self, path):
+        """ Initialize the PathQuery class.
+
+        Parameters
+        ----------
+        path: str (mandatory)
+            the query.
+        """
+        self.path = path
+        self.steps = []
+        items = path.split(".")
+        for cnt, item in enumerate(items):
+            match = QUERY_STEP.match(item.strip())
+            if match is None:
+                raise ValueError("'{0}' is not a valid path query.".format(
+                    path))
+            group, element, selector = match.groups()
+            if (selector is None) != (cnt == len(items) - 1):
+                raise ValueError(
+                    "'{0}' is not a valid path query: only the sequence "
+                    "steps select items.".format(path))
+            if selector is not None and selector != "*":
+                selector = int(selector)
+            self.steps.append(
+                (dicom.tag.Tag(int(group, 16), int(element, 16)), selector))
+
+    def __repr__(self):
+        return "<PathQuery '{0}'>".format(self.path)
+
+    def iter_values(self, dataset):
+        """ Generator that yields the query selected values.
+
+        Parameters
+        ----------
+        dataset: dataset (mandatory)
+            a pydicom dataset structure.
+
+        Returns
+        -------
+        values: generator
+            the selected values in the sequences order, None if a selected
+            item does not contain the requested data element.
+        """
+        datasets = [dataset]
+        for tag, selector in self.steps[:-1]:
+            sub_datasets = []
+            for dataset in datasets:
+                if dataset is None or tag not in dataset:
+                    sub_datasets.append(None)
+                    continue
+                items = dataset[tag].value
+                if selector == "*":
+                    sub_datasets.extend(items)
+                else:
+                    sub_datasets.append(
+                        items[selector] if selector < len(items) else None)
+            datasets = sub_datasets
+        tag = self.steps[-1][0]
+        for dataset in datasets:
+            if dataset is None or tag not in dataset:
+                yield None
+            else:
+                yield dataset[tag].value
+
+    def __call__(self, dataset_or_dcmpath):
+        """ Return the query selected values.
+
+        Parameters
+        ----------
+        dataset_or_dcmpath: dataset or str (mandatory)
+            a pydicom dataset structure or a path to a valid Dicom file: the
+            file parsing stops after the first step data element.
+
+        Returns
+        -------
+        values: array
+            the selected values in the sequences order: a float array when
+            all the values are numbers or None (set to NaN), with one column
+            for each item of the multi-valued data elements, otherwise an
+            object array.
+        """
+        dataset = load_dataset(dataset_or_dcmpath,
+                               stop_after_tag=self.steps[0][0])
+        values = list(self.iter_values(dataset))
+        return values_to_array(values)
+
+
+def compile_query(path):
+    """ Compile a path query.
+
+    The last 'QUERY_CACHE_SIZE' compiled queries are cached and reused.
+
+    Parameters
+    ----------
+    path: str (mandatory)
+        the query, see 'PathQuery'.
+
+    Returns
+    -------
+    query: PathQuery
+        the compiled query.
+    """
+    query = _QUERIES.pop(path, None)
+    if query is None:
+        query = PathQuery(path)
+    _QUERIES[path] = query
+    while len(_QUERIES) > QUERY_CACHE_SIZE:
+        _QUERIES.popitem(last=False)
+    return query
+
+
+def query(dataset_or_dcmpath, path_or_query):
+    """ Return the values selected by a path query.
+
+    Parameters
+    ----------
+    dataset_or_dcmpath: dataset or str (mandatory)
+        a pydicom dataset structure or a path to a valid Dicom file.
+    path_or_query: str or PathQuery (mandatory)
+        the query, see 'PathQuery'.
+
+    Returns
+    -------
+    values: array
+        the selected values in the sequences order, see 'PathQuery'.
+    """
+    if not isinstance(path_or_query, PathQuery):
+        path_or_query = compile_query(path_or_query)
+    return path_or_query(dataset_or_dcmpath)
+
+
+def values_to_array(values, stack_items=True):
+    """ Convert the values selected by a query, or a table column, to a
+    numpy array.
+
+    Parameters
+    ----------
+    values: list (mandatory)
+        the selected values.
+    stack_items: bool (optional, default True)
+        if set, the multi-valued values with the same number of numeric
+        items are stacked in columns, otherwise they are kept as objects.
+
+    Returns
+    -------
+    array: array
+        a float array when all the values are numbers or None (set to NaN),
+        with one column for each item of the multi-valued data elements if
+        'stack_items' is set, otherwise an object array.
+    """
+    # Find the number of items of the selected values
+    nb_items = None
+    is_numeric = True
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, dicom.multival.MultiValue)):
+            if not stack_items:
+                is_numeric = False
+                break
+            items = value
+            size = len(value)
+        else:
+            items = [value]
+            size = 0
+        if nb_items is None:
+            nb_items = size
+        if (size != nb_items or not all(
+                isinstance(item, numbers.Number) and
+                not isinstance(item, bool) for item in items)):
+            is_numeric = False
+            break
+
+    # Fill the preallocated array
+    if nb_items is not None and is_numeric:
+        shape = (len(values), nb_items) if nb_items > 0 else (len(values), )
+        array = numpy.empty(shape, dtype=float)
+        for cnt, value in enumerate(values):
+            array[cnt] = numpy.nan if value is None else value
+    else:
+        array = numpy.empty((len(values), ), dtype=object)
+        for cnt, value in enumerate(values):
+            array[cnt] = value
+    return array
@@ -13,6 +13,8 @@ Diverse Dicom reading functions to extract precise information.
 # System import
 import dicom
 import os
+import numbers
+import itertools
 
 
 # Map known request: name: (tag, stack_values)
@@ -55,87 +57,503 @@ PRIVATE_FIELDS = {
     "get_serie_instance_uid": []
 }
 
+# Header reads: the pixel data tag and the size in bytes above which a
+# data element value is only read from the file when accessed
+PIXEL_DATA_TAG = (0x7fe0, 0x0010)
+HEADER_DEFER_SIZE = 262144
 
-def walk(dataset_or_dcmpath, tag, stack_values=False):
-    """ Function to extract a tag associated value(s) from a Dicom dataset.
+# The persistent header cache used when reading files, disabled by default
+HEADER_CACHE = None
+
+
+def read_header(dcmpath, stop_after_tag=None, defer_size=HEADER_DEFER_SIZE,
+                force=True, raw=False):
+    """ Read the header of a Dicom file.
+
+    The parsing stops before the pixel data, and in raw mode the large data
+    element values are deferred: they are read from the file only if
+    accessed.
 
     .. note::
 
-        Recusrive function is required as new enhanced storage presents only
-        one Dicom containing several sub-sequence of fields.
-        The walked is called on each sub-sequence.
+        The stop condition is only checked on the top level data elements:
+        a tag nested in a sequence is read with its top level sequence, that
+        is the tag to consider for the 'stop_after_tag' parameter.
+
+    Parameters
+    ----------
+    dcmpath: str (mandatory)
+        the path to a Dicom file.
+    stop_after_tag: 2-uplet (optional, default None)
+        if specified, stop the parsing once this top level tag has been
+        passed.
+    defer_size: int (optional, default HEADER_DEFER_SIZE)
+        in raw mode, the size in bytes above which a data element value is
+        deferred. If None all the values are loaded. The converted datasets
+        always load all the values.
+    force: bool (optional, default True)
+        if set, read the file even if no Dicom header is found.
+    raw: bool (optional, default False)
+        if set, the data elements are returned as read, without converting
+        their values: a data element is converted when accessed with the
+        dataset item getter, and the file meta information, the transfer
+        syntax and the file attributes used to read the deferred values are
+        set as attributes of a plain dataset. The deflated files are always
+        converted.
+
+    Returns
+    -------
+    dataset: dataset
+        the pydicom dataset structure with the header data elements.
+    """
+    stop_tag = dicom.tag.Tag(PIXEL_DATA_TAG)
+    if stop_after_tag is not None:
+        stop_tag = min(stop_tag, dicom.tag.Tag(stop_after_tag) + 1)
+
+    def stop_when(tag, VR, length):
+        return tag >= stop_tag
+
+    # The pydicom file datasets convert all the data elements on
+    # construction, before the file attributes needed to read the deferred
+    # values are set: only the raw datasets defer the large values
+    with open(dcmpath, "rb") as open_file:
+        if not raw:
+            return dicom.filereader.read_partial(
+                open_file, stop_when=stop_when, force=force)
+
+        # Read the file meta information only, the file is then positioned
+        # on the first data element
+        file_dataset = dicom.filereader.read_partial(
+            open_file, stop_when=lambda tag, VR, length: True, force=force)
+        file_meta = file_dataset.file_meta
+        if (file_meta.get("TransferSyntaxUID") ==
+                dicom.UID.DeflatedExplicitVRLittleEndian):
+            open_file.seek(0)
+            return dicom.filereader.read_partial(
+                open_file, stop_when=stop_when, force=force)
+
+        # The pydicom file dataset would convert all the data elements
+        dataset = dicom.filereader.read_dataset(
+            open_file, file_dataset.is_implicit_VR,
+            file_dataset.is_little_endian, stop_when=stop_when,
+            defer_size=defer_size)
+    dataset.preamble = file_dataset.preamble
+    dataset.file_meta = file_meta
+    dataset.is_implicit_VR = file_dataset.is_implicit_VR
+    dataset.is_little_endian = file_dataset.is_little_endian
+    dataset.filename = file_dataset.filename
+    dataset.fileobj_type = file_dataset.fileobj_type
+    dataset.timestamp = file_dataset.timestamp
+    return dataset
+
+
+def load_dataset(dataset_or_dcmpath, stop_after_tag=None, force=True):
+    """ Load a Dicom dataset.
 
     Parameters
     ----------
     dataset_or_dcmpath: dataset or str (mandatory)
-        a pydicom dataset structure or a path to a valid Dicom file.
-    tag: 2-uplet (mandatory)
-        the Dicom tag of the field containing the value to extract.
-    stack_values: bool (optional, default False)
-        if set to True, returns all the detected occurences, otherwise the
-        first occurence only.
+        a pydicom dataset structure or a path to a valid Dicom file: only
+        the file header is read, see 'read_header'.
+    stop_after_tag: 2-uplet (optional, default None)
+        if specified and a file is read, stop the parsing once this top
+        level tag has been passed.
+    force: bool (optional, default True)
+        if set and a file is read, read it even if no Dicom header is found.
 
     Returns
     -------
-    values: list
-        the tag associated value(s). None if the field has not been found in
-        the dataset.
+    dataset: dataset
+        the pydicom dataset structure.
     """
-    # Deal with input parameters
     if isinstance(dataset_or_dcmpath, str):
         if not os.path.isfile(dataset_or_dcmpath):
             raise ValueError("'{0}' is not a valid Dicom file.".format(
                 dataset_or_dcmpath))
-        dataset = dicom.read_file(dataset_or_dcmpath, force=True)
+        dataset = read_header(dataset_or_dcmpath,
+                              stop_after_tag=stop_after_tag, force=force)
     else:
         if not isinstance(dataset_or_dcmpath, dicom.dataset.Dataset):
             raise ValueError("'{0}' is not a 'pydicom' Dataset.".format(
                 dataset_or_dcmpath))
         dataset = dataset_or_dcmpath
+    return dataset
 
-    # Go through each dataset tags
-    values = []
-
-    # Case 1: the desired tag is accessbile in the current dataset level
-    if tag in dataset:
-        if dataset[tag].VR != "SQ":
-            values.append(dataset[tag].value)
-            if not stack_values:
-                return values
-        else:
-            sequence = dataset[tag].value
-            for sub_dataset in sequence:
-                values.extend(
-                    walk(dataset=sub_dataset, tag=tag,
-                         stack_values=stack_values))
-                if not stack_values and len(values) > 0:
-                    return values
-
-    # Case 2: go deeper and check tag in Dicom sequences
-    for inner_tag in dataset.keys():
-        if dataset[inner_tag].VR == "SQ":
-            sequence = dataset[inner_tag].value
-            for sub_dataset in sequence:
-                sub_values = walk(sub_dataset, tag, stack_values=stack_values)
-                if sub_values is not None:
-                    values.extend(sub_values)
-                if not stack_values and len(values) > 0:
-                    return values
-
-    # Finally: if no match return None
-    if len(values) == 0:
-        values = None
 
-    return values
+class TagIndex(object):
+    """ Index of the data elements of a Dicom dataset.
 
+    The dataset is explored recursively in a single pass, and each tag is
+    mapped to its ordered occurrences. Many lookups can then share the same
+    traversal.
 
-def get_values(dataset_or_dcmpath, extractor):
-    """ Get an extractor associated value(s).
+    .. note::
+
+        The values are resolved from the indexed dataset when requested, so
+        that the data elements that are never looked up are not converted.
+        The index has to be rebuilt if data elements are added or removed
+        from the dataset.
+
+    Attributes
+    ----------
+    dataset: dataset
+        the indexed pydicom dataset structure.
+    """
+    def __init__(self, dataset):
+        """ Initialize the TagIndex class.
+
+        Parameters
+        ----------
+        dataset: dataset (mandatory)
+            a pydicom dataset structure.
+        """
+        self.dataset = dataset
+        self._occurrences = {}
+        self._index(dataset, ())
+
+    def _index(self, dataset, path):
+        """ Index recursively a dataset and its sequences.
+
+        At each dataset level, the non sequence data elements are indexed
+        before exploring the sequences in tag order, which is the order in
+        which the values are returned by the walk.
+
+        Parameters
+        ----------
+        dataset: dataset (mandatory)
+            a pydicom dataset structure.
+        path: tuple (mandatory)
+            the sequence path of the dataset as (sequence tag, item index)
+            2-uplets.
+        """
+        sequences = []
+        for tag in sorted(dataset.keys()):
+            if element_vr(dataset, tag) == "SQ":
+                sequences.append(tag)
+            else:
+                self._occurrences.setdefault(tag, []).append((path, dataset))
+        for tag in sequences:
+            for cnt, sub_dataset in enumerate(dataset[tag].value):
+                self._index(sub_dataset, path + ((tag, cnt), ))
+
+    def __contains__(self, tag):
+        return dicom.tag.Tag(tag) in self._occurrences
+
+    def tags(self):
+        """ Return the indexed tags.
+
+        Returns
+        -------
+        tags: list of Tag
+            the sorted indexed tags.
+        """
+        return sorted(self._occurrences.keys())
+
+    def occurrences(self, tag):
+        """ Return a tag occurrences.
+
+        Parameters
+        ----------
+        tag: 2-uplet (mandatory)
+            the Dicom tag of the field to be found.
+
+        Returns
+        -------
+        occurrences: list of 2-uplet
+            the tag ordered occurrences as (sequence path, value) 2-uplets.
+        """
+        tag = dicom.tag.Tag(tag)
+        return [(path, self._resolve(tag, location))
+                for path, location in self._occurrences.get(tag, [])]
+
+    def values(self, tag, stack_values=False):
+        """ Return a tag associated value(s).
+
+        Parameters
+        ----------
+        tag: 2-uplet (mandatory)
+            the Dicom tag of the field containing the value to extract.
+        stack_values: bool (optional, default False)
+            if set to True, returns all the detected occurences, otherwise the
+            first occurence only.
+
+        Returns
+        -------
+        values: list
+            the tag associated value(s). None if the field has not been found
+            in the dataset.
+        """
+        tag = dicom.tag.Tag(tag)
+        occurrences = self._occurrences.get(tag)
+        if occurrences is None:
+            return None
+        if not stack_values:
+            occurrences = occurrences[:1]
+        return [self._resolve(tag, location) for _, location in occurrences]
+
+    def get(self, tag, default=None):
+        """ Return the value of a top level data element.
+
+        Parameters
+        ----------
+        tag: 2-uplet (mandatory)
+            the Dicom tag of the field containing the value to extract.
+        default: object (optional, default None)
+            the value returned if the tag is not a top level data element.
+
+        Returns
+        -------
+        value: object
+            the tag associated value.
+        """
+        tag = dicom.tag.Tag(tag)
+        occurrences = self._occurrences.get(tag)
+        if occurrences is None or len(occurrences[0][0]) > 0:
+            return default
+        return self._resolve(tag, occurrences[0][1])
+
+    def _resolve(self, tag, location):
+        """ Return the value of an indexed data element: here the location
+        is the dataset containing the data element.
+        """
+        return location[tag].value
+
+
+def element_vr(dataset, tag):
+    """ Return the value representation of a dataset data element.
+
+    The raw data elements are not converted when their value representation
+    can be determined from the file or from the Dicom dictionary.
+
+    Parameters
+    ----------
+    dataset: dataset (mandatory)
+        a pydicom dataset structure.
+    tag: Tag (mandatory)
+        the Dicom tag of a data element of the dataset.
+
+    Returns
+    -------
+    vr: str
+        the data element value representation.
+    """
+    data_element = dict.__getitem__(dataset, tag)
+    if data_element.VR is not None:
+        return data_element.VR
+    try:
+        return dicom.datadict.dictionaryVR(tag)
+    except KeyError:
+        return dataset[tag].VR
+
+
+def get_index(dataset_or_dcmpath, stop_after_tag=None, force=True):
+    """ Return the tag index of a Dicom dataset.
+
+    Parameters
+    ----------
+    dataset_or_dcmpath: TagIndex, dataset or str (mandatory)
+        a tag index, a pydicom dataset structure or a path to a valid Dicom
+        file: only the file header is read, see 'read_header'.
+    stop_after_tag: 2-uplet (optional, default None)
+        if specified and a file is read, stop the parsing once this top
+        level tag has been passed. Ignored if the header cache is enabled:
+        the whole file header is then cached.
+    force: bool (optional, default True)
+        if set and a file is read, read it even if no Dicom header is found.
+
+    Returns
+    -------
+    index: TagIndex
+        the dataset tag index.
+    """
+    if isinstance(dataset_or_dcmpath, TagIndex):
+        return dataset_or_dcmpath
+    if (HEADER_CACHE is not None and isinstance(dataset_or_dcmpath, str) and
+            os.path.isfile(dataset_or_dcmpath)):
+        return HEADER_CACHE.get_index(dataset_or_dcmpath, force=force)
+    dataset = load_dataset(dataset_or_dcmpath, stop_after_tag=stop_after_tag,
+                           force=force)
+    return TagIndex(dataset)
+
+
+def get_header_cache():
+    """ Return the enabled header cache.
+
+    Returns
+    -------
+    cache: HeaderCache
+        the header cache, None if not enabled, see
+        'pydcmio.dcmreader.cache.enable_header_cache'.
+    """
+    return HEADER_CACHE
+
+
+def plain_value(value):
+    """ Convert a data element value to builtin Python types.
+
+    The pydicom value types, like multi-valued or decimal string values,
+    are not all serializable: the plain values can be pickled or stored.
+
+    Parameters
+    ----------
+    value: object (mandatory)
+        a non sequence data element value.
+
+    Returns
+    -------
+    value: object
+        the value as a builtin Python object, multi-valued items are
+        returned as a list.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [plain_value(item) for item in value]
+    for plain_type in (int, float, bytes, str):
+        if isinstance(value, plain_type):
+            return plain_type(value)
+    return str(value)
+
+
+def walk(dataset_or_dcmpath, tag, stack_values=False):
+    """ Function to extract a tag associated value(s) from a Dicom dataset.
+
+    .. note::
+
+        A recursive exploration is required as new enhanced storage presents
+        only one Dicom containing several sub-sequence of fields.
+        The exploration is done once when building the dataset 'TagIndex':
+        give a 'TagIndex' to share it between several lookups.
+
+    Parameters
+    ----------
+    dataset_or_dcmpath: TagIndex, dataset or str (mandatory)
+        a tag index, a pydicom dataset structure or a path to a valid Dicom
+        file.
+    tag: 2-uplet (mandatory)
+        the Dicom tag of the field containing the value to extract.
+    stack_values: bool (optional, default False)
+        if set to True, returns all the detected occurences, otherwise the
+        first occurence only.
+
+    Returns
+    -------
+    values: list
+        the tag associated value(s). None if the field has not been found in
+        the dataset.
+    """
+    index = get_index(dataset_or_dcmpath)
+    return index.values(tag, stack_values=stack_values)
+
+
+def iterwalk(dataset_or_dcmpath, tags, max_depth=None, sequences=None,
+             max_hits=None):
+    """ Generator that yields lazily the occurrences of Dicom tags.
+
+    The dataset is explored in tag order, depth first: the sequences are
+    only converted and explored when reached, and the exploration stops as
+    soon as the generator is not consumed anymore.
+
+    A field can also be requested with its tag path, the tags of the nested
+    sequences containing it followed by its tag, like
+    '[(0x5200, 0x9230), (0x0018, 0x9117), (0x0018, 0x9087)]': it is then
+    only found at this location, and when only tag paths are requested the
+    sequences outside these paths are not explored.
 
     Parameters
     ----------
     dataset_or_dcmpath: dataset or str (mandatory)
         a pydicom dataset structure or a path to a valid Dicom file.
+    tags: tag or list of tags or tag paths (mandatory)
+        the Dicom tag of the field to be found as a (group, element) tuple
+        or an integer, or a list of the Dicom tags or tag paths of the
+        fields to be found.
+    max_depth: int (optional, default None)
+        the maximum number of nested sequences explored, 0 to explore only
+        the top level data elements. None explores all the sequences.
+    sequences: list of 2-uplet (optional, default None)
+        the Dicom tags of the sequences that may contain the requested
+        fields: the other sequences are not explored, except the ones of
+        the requested tag paths. None explores all the sequences.
+    max_hits: int (optional, default None)
+        stop after this number of occurrences.
+
+    Returns
+    -------
+    occurrences: generator of 3-uplet
+        the tags occurrences as (sequence path, tag, value) 3-uplets, where
+        the sequence path is a tuple of (sequence tag, item index) 2-uplets.
+    """
+    # Deal with input parameters: the tag paths are stored in a tree of
+    # (requested tags, sub sequences) nodes
+    if _is_tag(tags):
+        tags = [tags]
+    any_level_tags = set()
+    tree = (set(), {})
+    for tag_path in tags:
+        if _is_tag(tag_path):
+            tag_path = [tag_path]
+        tag_path = [dicom.tag.Tag(tag) for tag in tag_path]
+        if len(tag_path) == 1:
+            any_level_tags.add(tag_path[0])
+            continue
+        node = tree
+        for tag in tag_path[:-1]:
+            node = node[1].setdefault(tag, (set(), {}))
+        node[0].add(tag_path[-1])
+    if sequences is not None:
+        sequences = set(dicom.tag.Tag(tag) for tag in sequences)
+    dataset = load_dataset(dataset_or_dcmpath)
+
+    # Explore the dataset, the generator stops after 'max_hits' occurrences
+    occurrences = _iterwalk(dataset, (), any_level_tags, max_depth, sequences,
+                            tree)
+    if max_hits is not None:
+        occurrences = itertools.islice(occurrences, max_hits)
+    for occurrence in occurrences:
+        yield occurrence
+
+
+def _is_tag(tag):
+    """ Check if an object is a single Dicom tag, an integer or a (group,
+    element) tuple, rather than a list of tags.
+    """
+    if isinstance(tag, tuple) and len(tag) == 2:
+        return all(isinstance(item, numbers.Integral) and 0 <= item <= 0xffff
+                   for item in tag)
+    return isinstance(tag, numbers.Integral)
+
+
+def _iterwalk(dataset, path, tags, max_depth, sequences, node):
+    """ Generator that yields recursively the occurrences of Dicom tags, see
+    'iterwalk': 'tags' are requested at any level and 'node' is the tag
+    paths tree node of the dataset, None outside the tag paths.
+    """
+    for tag in sorted(dataset.keys()):
+        if tag in tags or node is not None and tag in node[0]:
+            yield path, tag, dataset[tag].value
+        sub_node = None if node is None else node[1].get(tag)
+        if max_depth is not None and len(path) >= max_depth:
+            continue
+        if sub_node is None and (len(tags) == 0 or (
+                sequences is not None and tag not in sequences)):
+            continue
+        if element_vr(dataset, tag) != "SQ":
+            continue
+        for cnt, sub_dataset in enumerate(dataset[tag].value):
+            for occurrence in _iterwalk(sub_dataset, path + ((tag, cnt), ),
+                                        tags, max_depth, sequences, sub_node):
+                yield occurrence
+
+
+def get_values(dataset_or_dcmpath, extractor):
+    """ Get an extractor associated value(s).
+
+    Parameters
+    ----------
+    dataset_or_dcmpath: TagIndex, dataset or str (mandatory)
+        a tag index, a pydicom dataset structure or a path to a valid Dicom
+        file.
     extractor: str (mandatory)
         the name of the extractor specified in the 'STANDARD_EXTRACTOR'
         global variable.
@@ -165,3 +583,38 @@ def get_values(dataset_or_dcmpath, extractor):
             values *= 1000.
 
     return values
+
+
+def get_values_many(dataset_or_dcmpath, extractors):
+    """ Get several extractors associated value(s).
+
+    The Dicom file is read and explored once for all the extractors.
+
+    Parameters
+    ----------
+    dataset_or_dcmpath: TagIndex, dataset or str (mandatory)
+        a tag index, a pydicom dataset structure or a path to a valid Dicom
+        file.
+    extractors: list of str (mandatory)
+        the names of the extractors specified in the 'STANDARD_EXTRACTOR'
+        global variable.
+
+    Returns
+    -------
+    values: dict
+        the extractors associated value(s) (none if not found).
+    """
+    # Deal with input parameters
+    for extractor in extractors:
+        if extractor not in STANDARD_EXTRACTOR:
+            raise ValueError("'{0}' is not a valid extractor, registered "
+                             "extractor are in {1}.".format(
+                                 extractor, STANDARD_EXTRACTOR.keys()))
+
+    # Get the extractors associated values from a single tag index
+    index = get_index(dataset_or_dcmpath)
+    values = {}
+    for extractor in extractors:
+        values[extractor] = get_values(index, extractor)
+
+    return values
@@ -14,7 +14,14 @@ Diverse RTstruct Dicom reading functions to extract precise information.
 from __future__ import print_function
 import dicom
 import os
+import json
+import tarfile
+import collections
 from pprint import pprint
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 # Third party import
 import numpy as np
@@ -22,14 +29,212 @@ import nibabel
 from pyfreesurfer.utils.surftools import apply_affine_on_mesh
 from pyconnectome.utils.reorient import swap_affine
 
+# Dcmio import
+from pydcmio.dcmreader.reader import load_dataset
+from pydcmio.dcmreader.query import compile_query
+
+
+# The RTstruct tags
+ROI_NUMBER_TAG = dicom.tag.Tag(0x3006, 0x0022)
+REFERENCED_ROI_NUMBER_TAG = dicom.tag.Tag(0x3006, 0x0084)
+CONTOUR_SEQUENCE_TAG = dicom.tag.Tag(0x3006, 0x0040)
+CONTOUR_DATA_TAG = dicom.tag.Tag(0x3006, 0x0050)
+CONTOUR_IMAGE_SEQUENCE_TAG = dicom.tag.Tag(0x3006, 0x0016)
+REFERENCED_FRAME_NUMBER_TAG = dicom.tag.Tag(0x0008, 0x1160)
+CONTOUR_IMAGES_QUERY = compile_query(
+    "(3006,0010)[0].(3006,0012)[0].(3006,0014)[0].(3006,0016)[*]."
+    "(0008,1155)")
+
+
+class ROI(object):
+    """ The contours of a RTstruct region of interest.
+
+    The points of all the contours are stored in a single array, the i-th
+    contour points being 'points[offsets[i]: offsets[i + 1]]'.
+
+    Attributes
+    ----------
+    name: str
+        the ROI name.
+    number: int
+        the ROI number.
+    method: str
+        the ROI generation algorithm.
+    points: array (M, 3)
+        the contours points in physical space.
+    offsets: array (N + 1, )
+        the index of the first point of each contour.
+    geometric_types: list of str
+        the contours geometric types.
+    frames: list of int
+        the frame numbers referenced by the contours.
+    """
+    def __init__(self, name, number, method, contour_items):
+        """ Initialize the ROI class.
+
+        Parameters
+        ----------
+        name: str
+            the ROI name.
+        number: int
+            the ROI number.
+        method: str
+            the ROI generation algorithm.
+        contour_items: list of dataset
+            the contour sequence items of the ROI.
+        """
+        self.name = name
+        self.number = number
+        self.method = method
+        self.geometric_types = []
+        self.frames = []
+        contours_data = []
+        sizes = []
+        for item in contour_items:
+            self.geometric_types.append(item.get("ContourGeometricType"))
+            if CONTOUR_IMAGE_SEQUENCE_TAG in item:
+                for image_item in item[CONTOUR_IMAGE_SEQUENCE_TAG].value:
+                    if REFERENCED_FRAME_NUMBER_TAG in image_item:
+                        self.frames.append(int(
+                            image_item[REFERENCED_FRAME_NUMBER_TAG].value))
+            # > keep the raw decimal strings to convert them in bulk
+            data = b""
+            if CONTOUR_DATA_TAG in item:
+                data = dict.__getitem__(item, CONTOUR_DATA_TAG).value
+                if not isinstance(data, bytes):
+                    data = b"\\".join(
+                        str(value).encode("ascii") for value in data)
+            contours_data.append(data)
+            sizes.append((data.count(b"\\") + 1) // 3 if data else 0)
+        data = b"\\".join(data for data in contours_data if data)
+        self.points = np.array(data.split(b"\\") if data else [],
+                               dtype=float).reshape(-1, 3)
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(int)
+
+    def __len__(self):
+        return len(self.geometric_types)
+
+    def __repr__(self):
+        return "<ROI '{0}' {1} contours>".format(self.name, len(self))
+
+    def contour(self, index):
+        """ Return the points of a contour.
+
+        Parameters
+        ----------
+        index: int
+            the contour index.
+
+        Returns
+        -------
+        points: array (N, 3)
+            a view on the contour points in physical space.
+        """
+        return self.points[self.offsets[index]: self.offsets[index + 1]]
+
+    def contours(self, geometric_type=None):
+        """ Return the contours points.
+
+        Parameters
+        ----------
+        geometric_type: str, default None
+            if specified return only the contours of this geometric type.
+
+        Returns
+        -------
+        contours: list of array (N, 3)
+            views on the contours points in physical space.
+        """
+        return [self.contour(cnt) for cnt in range(len(self))
+                if geometric_type in (None, self.geometric_types[cnt])]
+
+    def tolist(self, geometric_type=None):
+        """ Return the contours points as lists, for instance for JSON
+        logging.
+
+        Parameters
+        ----------
+        geometric_type: str, default None
+            if specified return only the contours of this geometric type.
+
+        Returns
+        -------
+        contours: list of list
+            the contours points in physical space.
+        """
+        return [contour.tolist() for contour in self.contours(
+            geometric_type=geometric_type)]
+
+
+class RTStruct(Mapping):
+    """ A RTstruct Dicom file parsed once: a mapping between the ROI names
+    and their contours.
+
+    The ROIs contours are only decoded when a ROI is accessed.
+
+    Attributes
+    ----------
+    dataset: dataset
+        the RTstruct pydicom dataset.
+    institution: str
+        the name of the institution in charge of the segmentation.
+    operator: str
+        the name of the person in charge of the segmentation.
+    sop_instance_uids: list of str
+        the associated volume slice SOP instance UIDs.
+    """
+    def __init__(self, dataset_or_dcmpath):
+        """ Initialize the RTStruct class.
+
+        Parameters
+        ----------
+        dataset_or_dcmpath: dataset or str
+            a pydicom dataset structure or a path to a RTstruct Dicom file.
+        """
+        self.dataset = load_dataset(dataset_or_dcmpath)
+        self.institution = self.dataset.get("InstitutionName")
+        self.operator = self.dataset.get("OperatorsName")
+        self.sop_instance_uids = [
+            uid for uid in CONTOUR_IMAGES_QUERY.iter_values(self.dataset)
+            if uid is not None]
+        self._structures = collections.OrderedDict()
+        for item in self.dataset.get("StructureSetROISequence", []):
+            self._structures[item.ROIName] = (
+                int(item[ROI_NUMBER_TAG].value),
+                item.get("ROIGenerationAlgorithm"))
+        self._contour_items = {}
+        for item in self.dataset.get("ROIContourSequence", []):
+            self._contour_items[int(item[REFERENCED_ROI_NUMBER_TAG].value)] = (
+                item[CONTOUR_SEQUENCE_TAG].value
+                if CONTOUR_SEQUENCE_TAG in item else [])
+        self._rois = {}
+
+    def __getitem__(self, name):
+        roi = self._rois.get(name)
+        if roi is None:
+            number, method = self._structures[name]
+            roi = ROI(name, number, method,
+                      self._contour_items.get(number, []))
+            self._rois[name] = roi
+        return roi
+
+    def __iter__(self):
+        return iter(self._structures)
+
+    def __len__(self):
+        return len(self._structures)
+
+    def __repr__(self):
+        return "<RTStruct {0} ROIs>".format(len(self))
+
 
 def regions_of_interest(rtstruct_file):
     """ Return list of all structure names.
 
     Parameters
     ----------
-    rtstruct_file: str
-        the RTstruct Dicom files.
+    rtstruct_file: str or RTStruct
+        the RTstruct Dicom files, or the already parsed file.
 
     Returns
     -------
@@ -37,21 +242,14 @@ def regions_of_interest(rtstruct_file):
         the ROI information: name, number of point, number of slices.
     """
     rois = {}
-    dataset = dicom.read_file(rtstruct_file)
-    rois_struct = dataset.StructureSetROISequence
-    names = [rois_struct[idx].ROIName for idx in range(len(rois_struct))]
-    for cnt, name in enumerate(names):
-        slices = dataset.ROIContours[cnt].Contours
-        num_slices = len(slices)
-        if slices[0].ContourGeometricType == "CLOSED_PLANAR":
-            num_pts = [slices[idx].NumberOfContourPoints
-                       for idx in range(num_slices)]
-            num_pts = np.array(num_pts).astype(int)
-            num_pts = np.sum(num_pts)
+    if not isinstance(rtstruct_file, RTStruct):
+        rtstruct_file = RTStruct(rtstruct_file)
+    for name, roi in rtstruct_file.items():
+        if len(roi) > 0 and roi.geometric_types[0] == "CLOSED_PLANAR":
             rois.update({
                 name: {
-                    "num_slices": num_slices,
-                    "num_pts": num_pts}
+                    "num_slices": len(roi),
+                    "num_pts": len(roi.points)}
             })
     return rois
 
@@ -61,14 +259,16 @@ def points_of_interest(rtstruct_file):
 
     Parameters
     ----------
-    rtstruct_file: str
-        the RTstruct dicom files.
+    rtstruct_file: str or RTStruct
+        the RTstruct dicom files, or the already parsed file.
 
 
     Returns
     -------
     rois: dict
-        the ROI information: name, points in physical space, method.
+        the ROI information: name, CLOSED_PLANAR contours points in physical
+        space as a list of arrays, method, referenced frames (None if not
+        specified).
     sop_instance_uids: list of str
         the associated volume slice SOp instance UIDs.
     institution: str
@@ -77,42 +277,194 @@ def points_of_interest(rtstruct_file):
         the name of the person in charge of the segmentation.
     """
     rois = {}
-    dataset = dicom.read_file(rtstruct_file)
-    operator = dataset.OperatorsName
-    institution = dataset.InstitutionName
-    rois_struct = dataset.StructureSetROISequence
-    names = [rois_struct[idx].ROIName for idx in range(len(rois_struct))]
-    for cnt, name in enumerate(names):
-        cntr = dataset.ROIContours[cnt].Contours[0]
-        method = rois_struct[cnt].ROIGenerationAlgorithm
-        num_pts = cntr.NumberOfContourPoints
-        if cntr.ContourGeometricType == "CLOSED_PLANAR":
-            try:
-                frames = []
-                for cntr_seq in cntr.ContourImageSequence:
-                    frames.append(int(cntr_seq.RefdFrameNumber))
-            except:
-                frames = None
-            pt_loc = np.asarray([float(xyz) for xyz in cntr.ContourData])
-            pt_loc = pt_loc.reshape(-1, 3)
+    if not isinstance(rtstruct_file, RTStruct):
+        rtstruct_file = RTStruct(rtstruct_file)
+    for name, roi in rtstruct_file.items():
+        contours = roi.contours(geometric_type="CLOSED_PLANAR")
+        if len(contours) > 0:
             rois.update({
-                name: (pt_loc.tolist(), method, frames)
+                name: (contours, roi.method, roi.frames or None)
             })
-    sop_instance_uids = []
-    for slice_struct in (dataset.ReferencedFrameOfReferenceSequence[0].
-                         RTReferencedStudySequence[0].
-                         RTReferencedSeriesSequence[0].ContourImageSequence):
-        sop_instance_uids.append(slice_struct.ReferencedSOPInstanceUID)
-    return rois, sop_instance_uids, institution, operator
+    return (rois, rtstruct_file.sop_instance_uids, rtstruct_file.institution,
+            rtstruct_file.operator)
+
+
+class UIDIndex(object):
+    """ Index of the SOP instance UIDs of reference series.
+
+    Each reference is a Nifti file and the Dicom folder or tarball it has
+    been converted from, the Dicom files being named with their SOP
+    instance UID. The index can be persisted in a JSON file, and an
+    unchanged Dicom folder or tarball is not listed again. The persisted
+    references whose Dicom folder or tarball no longer exists are dropped
+    when the index is loaded.
+
+    Attributes
+    ----------
+    index_file: str
+        the JSON file where the index is persisted.
+    references: list of 2-uplet
+        the indexed references as (Nifti file, Dicom folder or tarball)
+        2-uplets.
+    """
+    def __init__(self, index_file=None):
+        """ Initialize the UIDIndex class.
+
+        Parameters
+        ----------
+        index_file: str, default None
+            the JSON file where the index is persisted, loaded if it exists.
+        """
+        self.index_file = index_file
+        self.references = []
+        self._stamps = []
+        self._uids = {}
+        if index_file is not None and os.path.isfile(index_file):
+            with open(index_file, "rt") as open_file:
+                content = json.load(open_file)
+            new_indices = {}
+            for ref_idx, (nii_file, dcm_item, stamp) in enumerate(
+                    content["references"]):
+                if os.path.exists(dcm_item):
+                    new_indices[ref_idx] = len(self.references)
+                    self.references.append((nii_file, dcm_item))
+                    self._stamps.append(stamp)
+            for uid, ref_indices in content["uids"].items():
+                if not isinstance(ref_indices, list):
+                    ref_indices = [ref_indices]
+                ref_indices = [new_indices[idx] for idx in ref_indices
+                               if idx in new_indices]
+                if len(ref_indices) > 0:
+                    self._uids[uid] = ref_indices
 
+    def add(self, nii_file, dcm_item):
+        """ Index a reference series.
 
-def generate_masks(rois, ref_file, outdir, axes="RAS", fname="mask"):
+        Parameters
+        ----------
+        nii_file: str
+            the reference Nifti file.
+        dcm_item: str
+            the reference Dicom folder or tarball, the Dicom files being
+            named with their SOP instance UID.
+        """
+        if not os.path.exists(dcm_item):
+            raise ValueError("'{0}' is not a valid Dicom directory or "
+                             "tarball.".format(dcm_item))
+        stamp = [os.path.getsize(dcm_item), os.path.getmtime(dcm_item)]
+        reference = (nii_file, dcm_item)
+
+        # A changed reference owns its current UIDs only
+        if reference in self.references:
+            ref_idx = self.references.index(reference)
+            if self._stamps[ref_idx] == stamp:
+                return
+            self._stamps[ref_idx] = stamp
+            for uid in list(self._uids):
+                ref_indices = self._uids[uid]
+                if ref_idx in ref_indices:
+                    ref_indices.remove(ref_idx)
+                    if len(ref_indices) == 0:
+                        del self._uids[uid]
+        else:
+            ref_idx = len(self.references)
+            self.references.append(reference)
+            self._stamps.append(stamp)
+        for uid in list_sop_instance_uids(dcm_item):
+            self._uids.setdefault(uid, []).append(ref_idx)
+
+    def find(self, sop_instance_uids, references=None):
+        """ Find the reference containing SOP instance UIDs.
+
+        Parameters
+        ----------
+        sop_instance_uids: list of str
+            the SOP instance UIDs referenced by a RTstruct.
+        references: list of 2-uplet, default None
+            if specified, the candidate (Nifti file, Dicom folder or
+            tarball) references, otherwise all the indexed references are
+            considered.
+
+        Returns
+        -------
+        reference: 2-uplet
+            the first indexed candidate reference containing all the SOP
+            instance UIDs, None if not found.
+        """
+        if references is None:
+            ref_indices = set(range(len(self.references)))
+        else:
+            references = set(tuple(reference) for reference in references)
+            ref_indices = set(
+                ref_idx for ref_idx, reference in enumerate(self.references)
+                if reference in references)
+        for uid in sop_instance_uids:
+            ref_indices.intersection_update(self._uids.get(uid, []))
+        if len(sop_instance_uids) == 0 or len(ref_indices) == 0:
+            return None
+        return self.references[min(ref_indices)]
+
+    def save(self, index_file=None):
+        """ Persist the index in a JSON file.
+
+        Parameters
+        ----------
+        index_file: str, default None
+            the destination file, by default the index file.
+        """
+        index_file = index_file or self.index_file
+        if index_file is None:
+            raise ValueError("No index file has been specified.")
+        content = {
+            "references": [
+                list(reference) + [stamp]
+                for reference, stamp in zip(self.references, self._stamps)],
+            "uids": self._uids}
+        with open(index_file, "wt") as open_file:
+            json.dump(content, open_file)
+
+
+def list_sop_instance_uids(dcm_item):
+    """ List the SOP instance UIDs of a Dicom folder or tarball.
+
+    Parameters
+    ----------
+    dcm_item: str
+        a Dicom folder or tarball, the Dicom files being named with their
+        SOP instance UID.
+
+    Returns
+    -------
+    sop_instance_uids: list of str
+        the SOP instance UIDs.
+    """
+    if os.path.isfile(dcm_item):
+        with tarfile.open(dcm_item) as tar:
+            names = [name.split(os.sep)[-1] for name in tar.getnames()
+                     if os.sep in name]
+    elif os.path.isdir(dcm_item):
+        names = os.listdir(dcm_item)
+    else:
+        raise ValueError("'{0}' is not a valid Dicom directory or "
+                         "tarball.".format(dcm_item))
+    return [name.replace(".dcm", "") for name in names]
+
+
+def generate_masks(rois, ref_file, outdir, axes="RAS", fname="mask",
+                   output="4d"):
     """ Genrate Nifti masks from RTstruct data.
 
+    Each CLOSED_PLANAR contour is filled on its slice with an even-odd rule,
+    so that the contours nested in another contour of the same slice are
+    holes. The masks are written in a preallocated volume, the ROIs being
+    ordered as in the 'rois' dictionary.
+
     Parameters
     ----------
     rois: dict
-        the ROI information: name, points in physical space, method.
+        the ROI information: name, points in physical space, method. The
+        points are given for one contour as a list of 3D points, or for
+        several contours as a list of lists of 3D points.
     ref_file: str
         the Nifti mask reference file.
     outdir: str
@@ -121,31 +473,178 @@ def generate_masks(rois, ref_file, outdir, axes="RAS", fname="mask"):
         the ROIs points orientation axes.
     fname: str, default 'mask'
         the name of the generated mask file.
+    output: str, default '4d'
+        the generated masks format: '4d' a uint8 4D volume with one binary
+        mask for each ROI, 'labels' a label volume where the i-th ROI voxels
+        are set to i + 1 (the ROIs must not overlap), 'bits' a label volume
+        where the i-th ROI sets the i-th bit (at most 64 ROIs), 'rois' one
+        binary mask file for each ROI named '<fname>-<i>.nii.gz'.
 
     Returns
     -------
-    mask_file: str
-        the generated masks from the RTstruct: a 4D volume.
+    mask_file: str or list of str
+        the generated masks from the RTstruct, one file for each ROI if the
+        'rois' output is selected.
     """
+    # Check input parameters
+    if output not in ("4d", "labels", "bits", "rois"):
+        raise ValueError("'{0}' is not a valid masks output format.".format(
+            output))
+    if output == "bits" and len(rois) > 64:
+        raise ValueError("At most 64 ROIs can be stored in a bit-packed "
+                         "label volume.")
+
+    # Preallocate the masks: only the reference image header is read
     ref_im = nibabel.load(ref_file)
-    ref_data = ref_im.get_data()
-    shape = ref_data.shape
+    shape = ref_im.shape[:3]
     reorient_aff = swap_affine(axes)
     affine = np.dot(reorient_aff, ref_im.affine)
     inv_aff = np.linalg.inv(affine)
-    mask = None
-    for name, (pt_loc, method, frames) in rois.items():
-        cmask = np.zeros(shape + (1, ), dtype=int)
-        pt_loc = np.asarray(pt_loc)
-        pt_loc_vox = np.round(apply_affine_on_mesh(
-            pt_loc, inv_aff)).astype(int)
-        for pt in pt_loc_vox:
-            cmask[tuple(pt)] = 1
-        if mask is None:
-            mask = cmask
-        else:
-            mask = np.concatenate((mask, cmask), axis=-1)
-    mask_im = nibabel.Nifti1Image(mask, ref_im.affine)
     mask_file = os.path.join(outdir, "{0}.nii.gz".format(fname))
-    nibabel.save(mask_im, mask_file)
+    if output == "4d":
+        mask = np.zeros(shape + (len(rois), ), dtype=np.uint8)
+    elif output == "labels":
+        mask = np.zeros(shape, dtype=(
+            np.uint8 if len(rois) < 256 else np.uint16))
+    elif output == "bits":
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if len(rois) <= np.iinfo(dtype).bits:
+                break
+        mask = np.zeros(shape, dtype=dtype)
+    else:
+        mask = np.zeros(shape, dtype=np.uint8)
+        mask_file = []
+
+    # Fill the masks
+    for cnt, (name, (pt_loc, method, frames)) in enumerate(rois.items()):
+        if len(pt_loc) > 0 and np.ndim(pt_loc[0]) == 1:
+            pt_loc = [pt_loc]
+        contours = [
+            apply_affine_on_mesh(np.asarray(contour, dtype=float).reshape(
+                -1, 3), inv_aff) for contour in pt_loc]
+        if output == "4d":
+            rasterize_contours(contours, shape, mask=mask[..., cnt])
+        elif output == "rois":
+            mask[...] = 0
+            rasterize_contours(contours, shape, mask=mask)
+            roi_file = os.path.join(outdir, "{0}-{1}.nii.gz".format(
+                fname, cnt))
+            nibabel.save(nibabel.Nifti1Image(mask, ref_im.affine), roi_file)
+            mask_file.append(roi_file)
+        else:
+            cmask = rasterize_contours(contours, shape)
+            if output == "labels":
+                if np.any(mask[cmask]):
+                    raise ValueError(
+                        "The '{0}' ROI overlaps another ROI: use the 'bits' "
+                        "masks output.".format(name))
+                mask[cmask] = cnt + 1
+            else:
+                mask[cmask] |= mask.dtype.type(1 << cnt)
+    if output != "rois":
+        nibabel.save(nibabel.Nifti1Image(mask, ref_im.affine), mask_file)
     return mask_file
+
+
+def rasterize_contours(contours, shape, mask=None):
+    """ Fill planar contours in a volume.
+
+    The contours of all the slices are filled at once with an even-odd
+    scanline rule: a voxel is filled if its center is inside an odd number
+    of the contours of its slice. The voxels containing the contour points
+    are also filled, so that the contours thinner than a voxel are kept.
+
+    Parameters
+    ----------
+    contours: list of array (N, 3)
+        the closed planar contours points in voxel coordinates: the contour
+        plane is normal to the volume axis along which it has the smallest
+        extent.
+    shape: 3-uplet
+        the volume shape.
+    mask: array (optional, default None)
+        a volume where the filled voxels are set to 1 inplace, by default a
+        new boolean volume.
+
+    Returns
+    -------
+    mask: array
+        the filled contours mask.
+    """
+    # Concatenate the contours points
+    if mask is None:
+        mask = np.zeros(shape, dtype=bool)
+    contours = [np.asarray(contour, dtype=float).reshape(-1, 3)
+                for contour in contours if len(contour) > 0]
+    if len(contours) == 0:
+        return mask
+    points = np.concatenate(contours)
+    sizes = np.asarray([len(contour) for contour in contours])
+    offsets = np.cumsum(sizes) - sizes
+    contour_ids = np.repeat(np.arange(len(contours)), sizes)
+    shape = np.asarray(shape)
+
+    # Mark the contours points
+    vox = np.round(points).astype(int)
+    vox = vox[np.all((vox >= 0) & (vox < shape), axis=1)]
+    mask[tuple(vox.T)] = 1
+
+    # Find the plane of each contour: each point is joined to the next one
+    # of its contour
+    extents = (np.maximum.reduceat(points, offsets, axis=0) -
+               np.minimum.reduceat(points, offsets, axis=0))
+    normals = np.argmin(extents, axis=1)
+    centers = np.add.reduceat(points, offsets, axis=0) / sizes[:, None]
+    slices = np.round(centers[np.arange(len(contours)), normals]).astype(int)
+    next_points = np.arange(len(points)) + 1
+    next_points[offsets + sizes - 1] = offsets
+
+    # Fill the contours sharing the same normal axis
+    for normal in np.unique(normals):
+        u_axis, v_axis = [axis for axis in range(3) if axis != normal]
+        edges = np.where(normals[contour_ids] == normal)[0]
+        edge_slices = slices[contour_ids[edges]]
+        edges = edges[(edge_slices >= 0) & (edge_slices < shape[normal])]
+        edge_slices = slices[contour_ids[edges]]
+        u0, v0 = points[edges, u_axis], points[edges, v_axis]
+        u1 = points[next_points[edges], u_axis]
+        v1 = points[next_points[edges], v_axis]
+
+        # > intersect the edges with the voxel rows: an edge crosses the rows
+        # in [min(v0, v1), max(v0, v1)[, so that the horizontal edges are
+        # skipped and each row crosses a closed contour an even number of
+        # times
+        first_rows = np.maximum(np.ceil(np.minimum(v0, v1)), 0).astype(int)
+        last_rows = np.minimum(np.ceil(np.maximum(v0, v1)) - 1,
+                               shape[v_axis] - 1).astype(int)
+        counts = np.maximum(last_rows - first_rows + 1, 0)
+        crossing_edges = np.repeat(np.arange(len(edges)), counts)
+        rows = np.repeat(first_rows, counts) + _ranges(counts)
+        slope = ((u1 - u0) / np.where(v1 != v0, v1 - v0, 1))[crossing_edges]
+        crossings = u0[crossing_edges] + (
+            rows - v0[crossing_edges]) * slope
+        crossing_slices = edge_slices[crossing_edges]
+
+        # > fill the voxels between the sorted crossings pairs of each row
+        order = np.lexsort((crossings, rows, crossing_slices))
+        crossings = crossings[order]
+        rows = rows[order][::2]
+        crossing_slices = crossing_slices[order][::2]
+        first_cols = np.maximum(np.ceil(crossings[::2]), 0).astype(int)
+        last_cols = np.minimum(np.floor(crossings[1::2]),
+                               shape[u_axis] - 1).astype(int)
+        counts = np.maximum(last_cols - first_cols + 1, 0)
+        index = [None, None, None]
+        index[normal] = np.repeat(crossing_slices, counts)
+        index[v_axis] = np.repeat(rows, counts)
+        index[u_axis] = np.repeat(first_cols, counts) + _ranges(counts)
+        mask[tuple(index)] = 1
+
+    return mask
+
+
+def _ranges(counts):
+    """ Concatenate the ranges of the given lengths: [0, .., count - 1].
+    """
+    starts = np.cumsum(counts) - counts
+    return np.arange(np.sum(counts)) - np.repeat(starts, counts)
@@ -0,0 +1,147 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2013 - 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Extract Dicom header values from a directory tree in a columnar table.
+"""
+
+# System import
+import os
+import functools
+import multiprocessing
+
+# Third party import
+import progressbar
+
+# Dcmio import
+from pydcmio.dcmreader.reader import get_index
+from pydcmio.dcmreader.reader import get_values
+from pydcmio.dcmreader.reader import plain_value
+from pydcmio.dcmreader.reader import STANDARD_EXTRACTOR
+from pydcmio.dcmreader.query import values_to_array
+
+
+def extract_table(dicom_dir, fields, n_jobs=1, skip_non_dicom_files=True,
+                  as_arrays=True, chunksize=64):
+    """ Extract header values from all the Dicom files of a directory tree.
+
+    Dicom files are searched recursively in the input folder, hidden files
+    are not considered. Only the file headers are read, with a pool of
+    processes if requested.
+
+    Parameters
+    ----------
+    dicom_dir: str (mandatory)
+        a folder containing Dicom files.
+    fields: list of str or 2-uplet (mandatory)
+        the names of extractors specified in the 'STANDARD_EXTRACTOR'
+        global variable, or Dicom tags for which the first occurence is
+        extracted.
+    n_jobs: int (optional, default 1)
+        the number of processes used to read the files.
+    skip_non_dicom_files: bool (optional, default True)
+        if True skip the files that can't be read, otherwise raise an error.
+    as_arrays: bool (optional, default True)
+        if True return each column as a numpy array: a float array when all
+        the values are numbers (missing values are set to NaN), otherwise an
+        object array. If False return lists.
+    chunksize: int (optional, default 64)
+        the number of files sent at once to a process.
+
+    Returns
+    -------
+    table: dict
+        the extracted values with one column for each field and a 'path'
+        column containing the read files.
+    """
+    # Deal with input parameters
+    if not os.path.isdir(dicom_dir):
+        raise ValueError("'{0}' is not a valid directory.".format(dicom_dir))
+    for field in fields:
+        if not isinstance(field, tuple) and field not in STANDARD_EXTRACTOR:
+            raise ValueError("'{0}' is not a valid extractor, registered "
+                             "extractor are in {1}.".format(
+                                 field, STANDARD_EXTRACTOR.keys()))
+
+    # List the input files
+    dicom_files = []
+    for root, dirs, files in os.walk(dicom_dir):
+        dicom_files.extend([
+            os.path.join(root, basename) for basename in sorted(files)
+            if not basename.startswith(".")])
+
+    # Read the file headers, in parallel if requested
+    extractor = functools.partial(
+        extract_row, fields=fields,
+        skip_non_dicom_files=skip_non_dicom_files)
+    table = dict((field, []) for field in fields)
+    table["path"] = []
+    pool = None
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(processes=n_jobs)
+        rows = pool.imap(extractor, dicom_files, chunksize=chunksize)
+    else:
+        rows = map(extractor, dicom_files)
+    try:
+        with progressbar.ProgressBar(max_value=len(dicom_files),
+                                     redirect_stdout=True) as bar:
+            for cnt, row in enumerate(rows):
+                if row is not None:
+                    table["path"].append(dicom_files[cnt])
+                    for field, value in zip(fields, row):
+                        table[field].append(value)
+                bar.update(cnt)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # Format the columns
+    if as_arrays:
+        for key, values in table.items():
+            table[key] = values_to_array(values, stack_items=False)
+
+    return table
+
+
+def extract_row(dicom_file, fields, skip_non_dicom_files=True):
+    """ Extract header values from a Dicom file.
+
+    Parameters
+    ----------
+    dicom_file: str (mandatory)
+        the path to a Dicom file.
+    fields: list of str or 2-uplet (mandatory)
+        the names of extractors specified in the 'STANDARD_EXTRACTOR'
+        global variable, or Dicom tags for which the first occurence is
+        extracted.
+    skip_non_dicom_files: bool (optional, default True)
+        if True return None when the file can't be read, otherwise raise an
+        error.
+
+    Returns
+    -------
+    row: list
+        the fields values as builtin Python objects (None if not found).
+    """
+    try:
+        index = get_index(dicom_file)
+    except Exception:
+        if skip_non_dicom_files:
+            return None
+        raise ValueError(
+            "'{0}' is not a valid DICOM file.".format(dicom_file))
+    row = []
+    for field in fields:
+        if isinstance(field, tuple):
+            values = index.values(field)
+            value = values[0] if values is not None else None
+        else:
+            value = get_values(index, field)
+        row.append(plain_value(value))
+    return row
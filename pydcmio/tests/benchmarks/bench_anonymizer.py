@@ -0,0 +1,79 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Benchmark the header-only anonymization audit against the anonymization:
+
+    python bench_anonymizer.py [nb_files]
+"""
+
+# System import
+import os
+import sys
+import time
+import shutil
+import tempfile
+from pkg_resources import Requirement, resource_filename
+
+# Third party import
+import dicom
+
+# Pydcmio import
+from pydcmio.dcmanonymizer.anonymize import anonymize_dicomdir
+from pydcmio.dcmanonymizer.anonymize import audit_dicomdir
+
+
+def bench(nb_files=200, shape=(512, 512)):
+    """ Time the anonymization and the audit of DICOM files.
+
+    Parameters
+    ----------
+    nb_files: int (optional, default 200)
+        the number of DICOM files.
+    shape: 2-uplet (optional, default (512, 512))
+        the pixel data shape.
+
+    Returns
+    -------
+    timings: dict
+        the best timing of five runs in seconds indexed by step.
+    """
+    test_dir = resource_filename(Requirement.parse("pydicom"),
+                                 "dicom/testfiles")
+    dataset = dicom.read_file(os.path.join(test_dir, "MR_small.dcm"))
+    dataset.Rows, dataset.Columns = shape
+    dataset.PixelData = b"\x00\x01" * (shape[0] * shape[1])
+    inputdir = tempfile.mkdtemp()
+    outdir = tempfile.mkdtemp()
+    try:
+        for cnt in range(nb_files):
+            dataset.SOPInstanceUID = "1.2.3.{0}".format(cnt)
+            dataset.save_as(os.path.join(inputdir, "{0}.dcm".format(cnt)))
+        timings = {}
+        for name, func in (
+                ("anonymize", lambda: anonymize_dicomdir(
+                    inputdir, outdir)),
+                ("audit", lambda: audit_dicomdir(inputdir))):
+            timings[name] = float("inf")
+            for _ in range(5):
+                start = time.time()
+                func()
+                timings[name] = min(timings[name], time.time() - start)
+    finally:
+        shutil.rmtree(inputdir)
+        shutil.rmtree(outdir)
+    return timings
+
+
+if __name__ == "__main__":
+    nb_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    timings = bench(nb_files)
+    for name in ("anonymize", "audit"):
+        print("{0}: {1:.3f}s".format(name, timings[name]))
+    print("speedup: {0:.1f}x".format(
+        timings["anonymize"] / timings["audit"]))
@@ -0,0 +1,155 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+"""
+Benchmark the Siemens CSA2 header parser against the baseline parser it
+replaces, on a synthetic series header of about 10 KB:
+
+    python bench_csa2.py [nb_loops]
+"""
+
+# System import
+import ast
+import sys
+import struct
+import timeit
+
+# Pydcmio import
+from pydcmio.dcmreader.csa2 import parse_csa2
+
+
+def csa2_item(value):
+    """ Build a null terminated and padded CSA2 item.
+    """
+    content = b"" if value is None else value + b"\x00"
+    length = len(content)
+    return (struct.pack("<4I", length, length, 77, length) + content +
+            b"\x00" * ((4 - length % 4) % 4))
+
+
+def csa2_element(name, vr, values, number_of_items=6):
+    """ Build a CSA2 element.
+    """
+    element = struct.pack("<64sI4sIII", name, len(values), vr + b"\x00\x00",
+                          3, number_of_items, 77)
+    for cnt in range(number_of_items):
+        element += csa2_item(values[cnt] if cnt < len(values) else None)
+    return element
+
+
+def series_header(nb_elements=56):
+    """ Build a synthetic CSA2 series header: a mix of text, integer,
+    decimal and empty elements, each with 6 items.
+    """
+    templates = [
+        (b"SH", [b"ep_b1000#12"]),
+        (b"IS", [b"1000"]),
+        (b"FD", [b"0.5", b"-0.25", b"0.125"]),
+        (b"DS", []),
+        (b"LO", [b"SIEMENS"]),
+        (b"UL", [b"64", b"64"]),
+        (b"DS", [b"2.5"]),
+        (b"CS", [])]
+    elements = [
+        csa2_element("Element{0}".format(cnt).encode("ascii"),
+                     *templates[cnt % len(templates)])
+        for cnt in range(nb_elements)]
+    return (struct.pack("<4s4sII", b"SV10", b"\x04\x03\x02\x01",
+                        len(elements), 77) + b"".join(elements))
+
+
+def reference_parse_csa2(csa):
+    """ The baseline CSA2 parser, only ported to the python 3 bytes
+    literals: the structures are built for each element and item, the
+    items are sliced and the text items evaluated with 'ast.literal_eval'.
+    """
+    format = "<4s4sII"
+    size = struct.calcsize(format)
+    version, _, number_of_elements, _ = struct.unpack(format, csa[:size])
+    start = size
+    content = {}
+    for _ in range(number_of_elements):
+        (name, items), size = reference_parse_element(csa, start)
+        content[name] = items
+        start += size
+    return content
+
+
+def reference_parse_element(csa, start):
+    """ Return a pair (name, items), total_size with the baseline parser.
+    """
+    format = "<64sI2s2sIII"
+    size = struct.calcsize(format)
+    name, vm, vr, _, syngo_datatype, number_of_items, _ = struct.unpack(
+        format, csa[start:start + size])
+    name = name.split(b"\x00")[0].decode("latin_1")
+    total_size = size
+    start += size
+    items = []
+    for i in range(number_of_items):
+        item, size = reference_parse_item(csa, start)
+        if i < vm:
+            if vr in [b"DS", b"FL", b"FD"]:
+                item = float(item[:-1])
+            elif vr in [b"IS", b"SS", b"US", b"SL", b"UL"]:
+                item = int(item[:-1])
+            else:
+                try:
+                    item = ast.literal_eval(item)
+                except Exception:
+                    pass
+            items.append(item)
+        start += size
+        total_size += size
+    return (name, items), total_size
+
+
+def reference_parse_item(csa, start):
+    """ Return a pair content, size with the baseline parser.
+    """
+    format = "<4I"
+    header_size = struct.calcsize(format)
+    length = struct.unpack(format, csa[start:start + header_size])
+    format = "<{0}s{1}s".format(length[1], (4 - length[1] % 4) % 4)
+    content_size = struct.calcsize(format)
+    content, padding = struct.unpack(
+        format, csa[start + header_size:start + header_size + content_size])
+    return content, header_size + content_size
+
+
+def bench(nb_loops=500):
+    """ Time the CSA2 parsers.
+
+    Parameters
+    ----------
+    nb_loops: int (optional, default 500)
+        the number of parses timed together, the best of 20 timings is
+        kept.
+
+    Returns
+    -------
+    timings: dict
+        the best time of a parse in seconds indexed by parser.
+    """
+    csa = series_header()
+    timings = {}
+    for name, func in (("reference", reference_parse_csa2),
+                       ("parse_csa2", parse_csa2)):
+        timings[name] = min(timeit.repeat(
+            lambda: func(csa), number=nb_loops, repeat=20)) / nb_loops
+    return timings, len(csa)
+
+
+if __name__ == "__main__":
+    nb_loops = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    timings, size = bench(nb_loops)
+    print("header: {0} bytes".format(size))
+    for name in ("reference", "parse_csa2"):
+        print("{0}: {1:.1f}us".format(name, timings[name] * 1e6))
+    print("speedup: {0:.1f}x".format(
+        timings["reference"] / timings["parse_csa2"]))
@@ -10,6 +10,13 @@
 import unittest
 import sys
 import os
+import pickle
+import shutil
+import io
+import filecmp
+import tarfile
+import zipfile
+import tempfile
 from pkg_resources import Requirement, resource_filename
 # COMPATIBILITY: since python 3.3 mock is included in unittest module
 python_version = sys.version_info
@@ -22,8 +29,21 @@ else:
     from unittest.mock import patch
     mock_builtin = "builtins"
 
+# Third party import
+import dicom
+
 # Pydcmio import
 from pydcmio.dcmanonymizer.anonymize import anonymize_dicomdir
+from pydcmio.dcmanonymizer.anonymize import Anonymizer
+from pydcmio.dcmanonymizer.anonymize import anonymize_bytes
+from pydcmio.dcmanonymizer.anonymize import anonymize_stream
+from pydcmio.dcmanonymizer.anonymize import anonymize_archive
+from pydcmio.dcmanonymizer.anonymize import anonymize_dicomtree
+from pydcmio.dcmanonymizer.anonymize import audit_dicomdir
+from pydcmio.dcmanonymizer.runlog import read_anonymization_log
+from pydcmio.dcmanonymizer.uids import UIDMapper
+from pydcmio.dcmanonymizer.manifest import Manifest
+from pydcmio.dcmanonymizer.manifest import file_hash
 
 
 class PyDcmioAnon(unittest.TestCase):
@@ -60,6 +80,367 @@ class PyDcmioAnon(unittest.TestCase):
         self.assertEqual([mock.call(expected_dcmfiles[0])],
                          mock_saveas.call_args_list)
 
+    def test_anonymizer_execution(self):
+        """ Test the picklable anonymizer."""
+        # Test execution
+        anonymizer = pickle.loads(pickle.dumps(Anonymizer(
+            manufacturer="SIEMENS")))
+        self.assertTrue(len(anonymizer.private_keep) > 0)
+        dataset = dicom.read_file(self.dataset_or_dcmpath)
+        anonymizer.anonymize_dataset(dataset)
+        self.assertEqual(dataset.PatientName, "John Doe")
+        self.assertEqual(anonymizer.log["0010,0010"],
+                         [(repr("CompressedSamples^MR1"), "John Doe")])
+        self.assertRaises(Exception, Anonymizer)
+
+    def test_header_execution(self):
+        """ Test the anonymizer creation from a DICOM header."""
+        # Test execution
+        expected = Anonymizer(manufacturer="TOSHIBA_MEC", uid_key="secret")
+        anonymizer = Anonymizer.from_header(self.dataset_or_dcmpath,
+                                            uid_key="secret")
+        self.assertEqual(anonymizer.manufacturer, "TOSHIBA_MEC")
+        self.assertEqual(anonymizer.rules_version, expected.rules_version)
+        with open(self.dataset_or_dcmpath, "rb") as open_file:
+            stream = io.BytesIO(b"\0" * 4 + open_file.read())
+        stream.seek(4)
+        anonymizer = Anonymizer.from_header(stream, uid_key="secret")
+        self.assertEqual(anonymizer.rules_version, expected.rules_version)
+        self.assertEqual(stream.tell(), 4)
+
+    def test_private_execution(self):
+        """ Test the private tags anonymization: the manufacturer keep-list
+        matches the tags regardless of the hexadecimal digits case, and the
+        private creators of the kept tags are kept."""
+        # Test execution
+        anonymizer = Anonymizer(manufacturer="SIEMENS")
+        dataset = dicom.read_file(self.dataset_or_dcmpath)
+        dataset.add_new((0x0019, 0x0010), "LO", "SIEMENS MR HEADER")
+        dataset.add_new((0x0019, 0x100c), "IS", "1000")
+        dataset.add_new((0x0019, 0x1008), "CS", "IMAGE NUM 4")
+        dataset.add_new((0x0029, 0x0010), "LO", "SIEMENS CSA HEADER")
+        dataset.add_new((0x0029, 0x1008), "CS", "IMAGE NUM 4")
+        counts = {}
+        private_groups = set()
+        anonymizer.audit_dataset(dataset, counts, private_groups)
+        self.assertEqual(counts["0019,0010"], {"K": 1})
+        self.assertEqual(counts["0029,0010"], {"X": 1})
+        self.assertEqual(private_groups, set(["0019", "0029"]))
+        anonymizer.anonymize_dataset(dataset)
+        self.assertTrue((0x0019, 0x0010) in dataset)
+        self.assertTrue((0x0019, 0x100c) in dataset)
+        for tag in ((0x0019, 0x1008), (0x0029, 0x0010), (0x0029, 0x1008)):
+            self.assertFalse(tag in dataset)
+
+    def test_uid_execution(self):
+        """ Test the deterministic UIDs mapping."""
+        # Test execution
+        mapper = UIDMapper("secret", maxsize=1)
+        new_uid = mapper.get("1.2.3")
+        self.assertTrue(new_uid.startswith("2.25."))
+        self.assertTrue(len(new_uid) <= 64)
+        self.assertEqual(mapper.get("1.2.3\x00"), new_uid)
+        self.assertEqual((mapper.hits, mapper.misses), (1, 1))
+        self.assertEqual(UIDMapper(b"secret").get("1.2.3"), new_uid)
+        self.assertNotEqual(UIDMapper("other").get("1.2.3"), new_uid)
+        self.assertNotEqual(mapper.get("1.2.4"), new_uid)
+        self.assertEqual(len(mapper), 1)
+        anonymizer = Anonymizer(manufacturer="SIEMENS", uid_key="secret")
+        uids = []
+        for anonymizer in (anonymizer, pickle.loads(pickle.dumps(anonymizer))):
+            dataset = dicom.read_file(self.dataset_or_dcmpath)
+            anonymizer.anonymize_dataset(dataset)
+            self.assertEqual(dataset.file_meta.MediaStorageSOPInstanceUID,
+                             dataset.SOPInstanceUID)
+            uids.append((dataset.StudyInstanceUID, dataset.SOPInstanceUID))
+        self.assertEqual(uids[0], uids[1])
+        self.assertTrue(uids[0][0].startswith("2.25."))
+
+    def test_stream_execution(self):
+        """ Test the anonymization copying the raw pixel data."""
+        # Test execution
+        anonymizer = Anonymizer(manufacturer="SIEMENS")
+        outdirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        try:
+            for outdir, stream_pixel_data in zip(outdirs, (False, True)):
+                output_dicom, _ = anonymizer.anonymize_file(
+                    self.dataset_or_dcmpath, outdir, write_log=False,
+                    stream_pixel_data=stream_pixel_data)
+            self.assertTrue(filecmp.cmp(
+                os.path.join(outdirs[0], os.path.basename(output_dicom)),
+                output_dicom, shallow=False))
+        finally:
+            for outdir in outdirs:
+                shutil.rmtree(outdir)
+
+    def test_inmemory_execution(self):
+        """ Test the in-memory anonymization."""
+        # Test execution
+        outdir = tempfile.mkdtemp()
+        try:
+            anonymizer = Anonymizer(manufacturer="SIEMENS")
+            output_dicom, _ = anonymizer.anonymize_file(
+                self.dataset_or_dcmpath, outdir, write_log=False)
+            with open(output_dicom, "rb") as open_file:
+                expected = open_file.read()
+        finally:
+            shutil.rmtree(outdir)
+        with open(self.dataset_or_dcmpath, "rb") as open_file:
+            data = open_file.read()
+        for stream_pixel_data in (False, True):
+            output, log = anonymize_bytes(
+                data, stream_pixel_data=stream_pixel_data)
+            self.assertEqual(output, expected)
+            self.assertEqual(log["0010,0010"],
+                             [(repr("CompressedSamples^MR1"), "John Doe")])
+        stream = mock.Mock(spec=["read"])
+        stream.read.return_value = data
+        output_stream = io.BytesIO()
+        output, _ = anonymize_stream(stream, output_stream)
+        self.assertTrue(output is output_stream)
+        self.assertEqual(output_stream.getvalue(), expected)
+
+    def test_archive_execution(self):
+        """ Test the archive to archive anonymization."""
+        # Test execution
+        outdir = tempfile.mkdtemp()
+        try:
+            in_archive = os.path.join(outdir, "in.tar.gz")
+            with tarfile.open(in_archive, "w:gz") as archive:
+                for name in ("a.dcm", "b.dcm", ".hidden"):
+                    archive.add(self.dataset_or_dcmpath,
+                                arcname="session/" + name)
+            self.assertRaises(ValueError, anonymize_archive, in_archive,
+                              os.path.join(outdir, "out.rar"))
+            out_archive = os.path.join(outdir, "out.zip")
+            with patch("pydcmio.dcmanonymizer.anonymize.LOG_SPOOL_SIZE", 64):
+                dcm_members, log_members = anonymize_archive(
+                    in_archive, out_archive, uid_key="secret")
+            self.assertEqual(dcm_members, ["0.dcm", "1.dcm"])
+            self.assertEqual(log_members, ["anonymization.jsonl",
+                                           "anonymization.index.json"])
+            anonymizer = Anonymizer(manufacturer="SIEMENS",
+                                    uid_key="secret")
+            with open(self.dataset_or_dcmpath, "rb") as open_file:
+                expected, _ = anonymize_bytes(open_file.read(), anonymizer)
+            with zipfile.ZipFile(out_archive) as archive:
+                self.assertEqual(archive.namelist(),
+                                 dcm_members + log_members)
+                self.assertEqual(archive.read("1.dcm"), expected)
+                archive.extract("anonymization.jsonl", outdir)
+            records = read_anonymization_log(
+                os.path.join(outdir, "anonymization.jsonl"))
+            self.assertEqual([record["file"] for record in records],
+                             ["session/a.dcm", "session/b.dcm"])
+            # The log is spooled to a file before python 3.6
+            with open(os.path.join(outdir, "anonymization.jsonl"),
+                      "rb") as open_file:
+                expected = open_file.read()
+            with patch("pydcmio.dcmanonymizer.anonymize.sys",
+                       version_info=(2, 7, 18)):
+                anonymize_archive(in_archive, out_archive, uid_key="secret")
+            with zipfile.ZipFile(out_archive) as archive:
+                self.assertEqual(archive.namelist(),
+                                 dcm_members + log_members)
+                self.assertEqual(archive.read("anonymization.jsonl"),
+                                 expected)
+            out_archive = os.path.join(outdir, "out.tar")
+            dcm_members, log_members = anonymize_archive(
+                in_archive, out_archive, use_dicom_names=True,
+                write_log=False)
+            self.assertEqual(dcm_members, ["session/a.dcm", "session/b.dcm"])
+            self.assertEqual(log_members, [])
+            with tarfile.open(out_archive) as archive:
+                self.assertEqual(archive.getnames(), dcm_members)
+            out_archive = os.path.join(outdir, "out.tgz")
+            dcm_members, log_members = anonymize_archive(
+                in_archive, out_archive, uid_key="secret")
+            with open(os.path.join(outdir, "anonymization.jsonl"),
+                      "rb") as open_file:
+                expected = open_file.read()
+            with tarfile.open(out_archive) as archive:
+                self.assertEqual(archive.getnames(),
+                                 dcm_members + log_members)
+                self.assertEqual(archive.extractfile(
+                    "anonymization.jsonl").read(), expected)
+        finally:
+            shutil.rmtree(outdir)
+
+    def test_tree_execution(self):
+        """ Test the recursive anonymization."""
+        # Test execution
+        inputdir = tempfile.mkdtemp()
+        outdir = os.path.join(inputdir, "anon")
+        try:
+            for dirname in ("s1", os.path.join("s2", "t1")):
+                os.makedirs(os.path.join(inputdir, dirname))
+                shutil.copy(self.dataset_or_dcmpath,
+                            os.path.join(inputdir, dirname, "a.dcm"))
+            with open(os.path.join(inputdir, "s1", "notes.txt"),
+                      "wt") as open_file:
+                open_file.write("not a DICOM file")
+            # A link to an ancestor directory must not be followed
+            os.symlink(inputdir, os.path.join(inputdir, "s2", "t1", "up"))
+            for n_jobs in (1, 2):
+                nb_files, log_file = anonymize_dicomtree(
+                    inputdir, outdir, n_jobs=n_jobs, queue_size=1,
+                    use_dicom_names=True)
+                self.assertEqual(nb_files, 2)
+                for dirname in ("s1", os.path.join("s2", "t1")):
+                    self.assertTrue(os.path.isfile(
+                        os.path.join(outdir, dirname, "a.dcm")))
+                self.assertFalse(os.path.exists(
+                    os.path.join(outdir, "s1", "notes.txt")))
+                self.assertEqual(len(read_anonymization_log(log_file)), 2)
+            self.assertRaises(ValueError, anonymize_dicomtree,
+                              os.path.join(inputdir, "s2", "t1", "a.dcm"),
+                              outdir)
+        finally:
+            shutil.rmtree(inputdir)
+
+    def test_dryrun_execution(self):
+        """ Test the header-only anonymization audit."""
+        # Test execution
+        inputdir = tempfile.mkdtemp()
+        outdir = tempfile.mkdtemp()
+        try:
+            dataset = dicom.read_file(self.dataset_or_dcmpath)
+            dataset.save_as(os.path.join(inputdir, "a.dcm"))
+            dataset.add_new((0x0011, 0x0010), "LO", "ACME")
+            dataset.add_new((0x0011, 0x1001), "LO", "secret")
+            dataset.save_as(os.path.join(inputdir, "b.dcm"))
+            for n_jobs in (1, 2):
+                if n_jobs == 1:
+                    counts, private_files = audit_dicomdir(
+                        inputdir,
+                        os.path.join(outdir, "anonymization_audit.json"))
+                else:
+                    counts, private_files = anonymize_dicomdir(
+                        inputdir, outdir, n_jobs=n_jobs, dry_run=True)
+                self.assertEqual(counts["0010,0010"], {"Z": 2})
+                self.assertEqual(counts["0011,1001"], {"X": 1})
+                self.assertEqual(private_files, {
+                    os.path.join(inputdir, "b.dcm"): ["0011"]})
+            self.assertEqual(os.listdir(outdir),
+                             ["anonymization_audit.json"])
+            anonymizer = Anonymizer(manufacturer="SIEMENS")
+            anonymizer.anonymize_dataset(dataset)
+            # The padding after the pixel data is not audited
+            anonymizer.log.pop("fffc,fffc")
+            self.assertEqual(set(anonymizer.log), set(counts))
+        finally:
+            shutil.rmtree(inputdir)
+            shutil.rmtree(outdir)
+
+    def test_dryrun_sequence_execution(self):
+        """ Test the audit of a large sequence, deferred by the header
+        reader."""
+        # Test execution
+        inputdir = tempfile.mkdtemp()
+        try:
+            dataset = dicom.read_file(self.dataset_or_dcmpath)
+            items = []
+            for _ in range(12000):
+                item = dicom.dataset.Dataset()
+                item.add_new((0x0010, 0x0010), "PN", "Doe^John")
+                items.append(item)
+            dataset.add_new((0x5200, 0x9230), "SQ",
+                            dicom.sequence.Sequence(items))
+            dataset.save_as(os.path.join(inputdir, "a.dcm"))
+            counts, _ = audit_dicomdir(inputdir)
+            self.assertEqual(counts["0010,0010"], {"Z": 12001})
+        finally:
+            shutil.rmtree(inputdir)
+
+    def test_aggregate_execution(self):
+        """ Test the aggregated anonymization log."""
+        # Test execution
+        inputdir = tempfile.mkdtemp()
+        outdir = tempfile.mkdtemp()
+        try:
+            dataset = dicom.read_file(self.dataset_or_dcmpath)
+            uids = [dataset.SOPInstanceUID, "1.2.3"]
+            for basename, uid in zip(("a.dcm", "b.dcm"), uids):
+                dataset.SOPInstanceUID = uid
+                dataset.save_as(os.path.join(inputdir, basename))
+            dcmfiles, logfiles = anonymize_dicomdir(
+                inputdir, outdir, aggregate_logs=True)
+            self.assertEqual(logfiles,
+                             [os.path.join(outdir, "anonymization.jsonl")])
+            records = read_anonymization_log(logfiles[0])
+            self.assertEqual(len(records), 2)
+            self.assertEqual(
+                sorted(record["sop_instance_uid"] for record in records),
+                sorted(uids))
+            record = read_anonymization_log(logfiles[0], "1.2.3")
+            self.assertEqual(record["tags"]["0010,0010"],
+                             [[repr("CompressedSamples^MR1"), "John Doe"]])
+            self.assertEqual(record, [
+                item for item in records
+                if item["sop_instance_uid"] == "1.2.3"][0])
+            self.assertEqual(read_anonymization_log(logfiles[0], "1.2.4"),
+                             None)
+            with open(logfiles[0], "rt") as open_file:
+                nb_lines = len(open_file.readlines())
+            nb_values = sum(len(operations) for record in records
+                            for operations in record["tags"].values())
+            self.assertTrue(nb_lines < nb_values)
+        finally:
+            shutil.rmtree(inputdir)
+            shutil.rmtree(outdir)
+
+    def test_incremental_execution(self):
+        """ Test the anonymization of the new or changed files only."""
+        # Test execution
+        inputdir = tempfile.mkdtemp()
+        outdir = tempfile.mkdtemp()
+        try:
+            for basename in ("a.dcm", "b.dcm"):
+                shutil.copy(self.dataset_or_dcmpath,
+                            os.path.join(inputdir, basename))
+            os.mkdir(os.path.join(inputdir, "series"))
+            dcmfiles, logfiles = anonymize_dicomdir(
+                inputdir, outdir, incremental=True)
+            for path in dcmfiles:
+                os.utime(path, (0, 0))
+            with open(os.path.join(inputdir, "a.dcm"), "ab") as open_file:
+                open_file.write(b"\x00" * 4)
+            shutil.copy(self.dataset_or_dcmpath,
+                        os.path.join(inputdir, "c.dcm"))
+            new_dcmfiles, new_logfiles = anonymize_dicomdir(
+                inputdir, outdir, incremental=True)
+            self.assertEqual(len(new_dcmfiles), 3)
+            self.assertEqual(len(set(new_dcmfiles)), 3)
+            self.assertTrue(set(dcmfiles).issubset(new_dcmfiles))
+            self.assertTrue(all(os.path.isfile(path) for path in new_logfiles))
+            changed = [path for path in new_dcmfiles
+                       if os.path.getmtime(path) > 0]
+            self.assertEqual(len(changed), 2)
+
+            # The hashes are computed from the bytes read, with or without
+            # the pixel data streaming, and the deleted inputs are dropped
+            os.remove(os.path.join(inputdir, "c.dcm"))
+            for stream_pixel_data in (False, True):
+                anonymizer = Anonymizer.from_header(
+                    os.path.join(inputdir, "a.dcm"))
+                anonymizer.anonymize_file(
+                    os.path.join(inputdir, "a.dcm"), outdir, outname="a",
+                    write_log=False, stream_pixel_data=stream_pixel_data,
+                    hash_input=True)
+                self.assertEqual(anonymizer.input_hash, file_hash(
+                    os.path.join(inputdir, "a.dcm")))
+            manifest = Manifest(
+                os.path.join(outdir, "anonymization_manifest.json"), {
+                    "rules": anonymizer.rules_version, "logs": "files"})
+            self.assertEqual(sorted(manifest.files), [
+                os.path.join(inputdir, basename)
+                for basename in ("a.dcm", "b.dcm")])
+            for input_dicom, record in manifest.files.items():
+                self.assertEqual(record["hash"], file_hash(input_dicom))
+        finally:
+            shutil.rmtree(inputdir)
+            shutil.rmtree(outdir)
+
 
 if __name__ == "__main__":
     unittest.main()
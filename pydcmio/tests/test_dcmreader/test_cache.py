@@ -0,0 +1,109 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+from pkg_resources import Requirement, resource_filename
+# COMPATIBILITY: since python 3.3 mock is included in unittest module
+python_version = sys.version_info
+if python_version[:2] <= (3, 3):
+    import mock
+else:
+    import unittest.mock as mock
+
+# Third party import
+import dicom
+
+# Pydcmio import
+from pydcmio.dcmreader.reader import get_values
+from pydcmio.dcmreader.reader import load_dataset
+from pydcmio.dcmreader.reader import TagIndex
+from pydcmio.dcmreader.reader import HEADER_DEFER_SIZE
+from pydcmio.dcmreader.reader import walk
+from pydcmio.dcmreader.cache import enable_header_cache
+from pydcmio.dcmreader.cache import disable_header_cache
+from pydcmio.dcmreader.cache import CachedTagIndex
+
+
+class PyDcmioCache(unittest.TestCase):
+    """ Test the PyDcmio header cache:
+    'pydcmio.dcmreader.cache.HeaderCache'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        test_dir = resource_filename(Requirement.parse("pydicom"),
+                                     "dicom/testfiles")
+        self.tmpdir = tempfile.mkdtemp()
+        self.dcmpath = os.path.join(self.tmpdir, "MR_small.dcm")
+        shutil.copy(os.path.join(test_dir, "MR_small.dcm"), self.dcmpath)
+        self.cache = enable_header_cache(os.path.join(self.tmpdir, "cache"))
+
+    def tearDown(self):
+        """ Disable the cache and clean the generated files.
+        """
+        disable_header_cache()
+        shutil.rmtree(self.tmpdir)
+
+    @mock.patch("pydcmio.dcmreader.cache.read_header")
+    def test_normal_execution(self, mock_read):
+        """ Test the normal behaviour of the cache.
+        """
+        # Set the mocked functions returned values
+        from pydcmio.dcmreader.reader import read_header
+        mock_read.side_effect = read_header
+
+        # Test execution
+        self.assertEqual(get_values(self.dcmpath, "get_echo_time"), 240.)
+        self.assertEqual(walk(self.dcmpath, (0x0020, 0x0032)),
+                         [[-83.9063, -91.2, 6.6406]])
+        self.assertEqual(get_values(self.dcmpath, "get_b_values"), None)
+        self.assertEqual(mock_read.call_count, 1)
+        self.assertTrue(isinstance(self.cache.get_index(self.dcmpath),
+                                   CachedTagIndex))
+        self.assertEqual(mock_read.call_count, 1)
+
+        # The unforced reads are not served with the forced index
+        self.cache.get_index(self.dcmpath, force=False)
+        self.assertEqual(mock_read.call_count, 2)
+        self.assertEqual(mock_read.call_args[1], {"force": False,
+                                                  "raw": True})
+
+        # Modified files are read again
+        os.utime(self.dcmpath, (0, 0))
+        self.assertEqual(get_values(self.dcmpath, "get_echo_time"), 240.)
+        self.assertEqual(mock_read.call_count, 3)
+
+    def test_types_execution(self):
+        """ Test the cached values types and the deferred values.
+        """
+        # Test execution
+        dataset = dicom.read_file(self.dcmpath)
+        dataset.add_new((0x0019, 0x0010), "LO", "ACME")
+        dataset.add_new((0x0019, 0x1001), "OB",
+                        b"\0" * (HEADER_DEFER_SIZE + 2))
+        dataset.save_as(self.dcmpath)
+        expected = TagIndex(load_dataset(self.dcmpath))
+        for _ in range(2):
+            index = self.cache.get_index(self.dcmpath)
+        self.assertTrue(isinstance(index, CachedTagIndex))
+        for tag in ((0x0010, 0x0010), (0x0008, 0x0018), (0x0020, 0x0032),
+                    (0x0018, 0x0050)):
+            value = index.get(tag)
+            self.assertEqual(value, expected.get(tag))
+            self.assertTrue(type(value) is type(expected.get(tag)))
+        self.assertTrue((0x0019, 0x0010) in index)
+        self.assertFalse((0x0019, 0x1001) in index)
+
+
+if __name__ == "__main__":
+    unittest.main()
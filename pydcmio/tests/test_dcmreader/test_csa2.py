@@ -0,0 +1,102 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import struct
+
+# Pydcmio import
+from pydcmio.dcmreader.csa2 import parse_csa2
+from pydcmio.dcmreader.csa2 import CSA2Header
+from pydcmio.dcmreader.csa2 import CSA2Cache
+
+
+def csa2_item(value):
+    """ Build a null terminated and padded CSA2 item.
+    """
+    content = b"" if value is None else value + b"\x00"
+    length = len(content)
+    return (struct.pack("<4I", length, length, 77, length) + content +
+            b"\x00" * ((4 - length % 4) % 4))
+
+
+def csa2_element(name, vr, values, number_of_items=6):
+    """ Build a CSA2 element.
+    """
+    element = struct.pack("<64sI4sIII", name, len(values), vr + b"\x00\x00",
+                          3, number_of_items, 77)
+    for cnt in range(number_of_items):
+        element += csa2_item(values[cnt] if cnt < len(values) else None)
+    return element
+
+
+class PyDcmioCSA2(unittest.TestCase):
+    """ Test the PyDcmio Siemens CSA2 header parser:
+    'pydcmio.dcmreader.csa2.parse_csa2'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        elements = [
+            csa2_element(b"B_value", b"IS", [b"1000"]),
+            csa2_element(b"DiffusionGradientDirection", b"FD",
+                         [b"0.5", b"-0.25", b"0.125"]),
+            csa2_element(b"SequenceName", b"SH", [b"ep_b1000#12"]),
+            csa2_element(b"SliceMeasurementDuration", b"DS", []),
+            csa2_element(b"MosaicRefAcqTimes", b"FD", [], number_of_items=0)]
+        self.csa = (struct.pack("<4s4sII", b"SV10", b"\x04\x03\x02\x01",
+                                len(elements), 77) + b"".join(elements))
+
+    def test_normal_execution(self):
+        """ Test the normal behaviour of the function.
+        """
+        # Test execution
+        content = parse_csa2(self.csa)
+        self.assertEqual(content, {
+            "B_value": [1000],
+            "DiffusionGradientDirection": [0.5, -0.25, 0.125],
+            "SequenceName": ["ep_b1000#12"],
+            "SliceMeasurementDuration": [],
+            "MosaicRefAcqTimes": []})
+        self.assertEqual(parse_csa2(bytearray(self.csa)), content)
+
+    def test_lazy_execution(self):
+        """ Test the lazy CSA2 header mapping.
+        """
+        # Test execution
+        header = CSA2Header(self.csa)
+        self.assertEqual(len(header), 5)
+        self.assertEqual(header._items, {})
+        self.assertEqual(header["DiffusionGradientDirection"],
+                         [0.5, -0.25, 0.125])
+        self.assertEqual(list(header._items.keys()),
+                         ["DiffusionGradientDirection"])
+        self.assertRaises(KeyError, header.__getitem__, "WRONG")
+        self.assertEqual(header, parse_csa2(self.csa))
+
+    def test_cache_execution(self):
+        """ Test the bounded LRU cache of the CSA2 headers.
+        """
+        # Test execution
+        cache = CSA2Cache(maxsize=1)
+        header = cache.get(self.csa)
+        self.assertTrue(cache.get(bytearray(self.csa)) is header)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        other_csa = self.csa[:12] + b"\x00" * 4 + self.csa[16:]
+        self.assertTrue(cache.get(other_csa) is not header)
+        self.assertEqual(len(cache), 1)
+        self.assertTrue(cache.get(self.csa) is not header)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        cache.resize(0)
+        self.assertEqual(len(cache), 0)
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+
+# Third party import
+import dicom
+import numpy
+
+# Pydcmio import
+from pydcmio.dcmreader.diffusion import get_diffusion_table
+
+
+def siemens_csa2(bval, bvec):
+    """ Build a Siemens CSA2 header with a diffusion description.
+    """
+    elements = b""
+    for name, vr, values in [(b"B_value", b"IS", [bval]),
+                             (b"DiffusionGradientDirection", b"FD", bvec)]:
+        elements += struct.pack("<64sI4sIII", name, len(values),
+                                vr + b"\x00\x00", 3, len(values), 77)
+        for value in values:
+            length = len(value) + 1
+            elements += (struct.pack("<4I", length, length, 77, length) +
+                         value + b"\x00" * (1 + (4 - length % 4) % 4))
+    return struct.pack("<4s4sII", b"SV10", b"\x04\x03\x02\x01", 2,
+                       77) + elements
+
+
+def write_dicom(path, dataset):
+    """ Write a little endian explicit VR Dicom file.
+    """
+    file_meta = dicom.dataset.Dataset()
+    file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.4"
+    file_meta.MediaStorageSOPInstanceUID = "1.2.3"
+    file_meta.TransferSyntaxUID = "1.2.840.10008.1.2.1"
+    file_meta.ImplementationClassUID = "1.2.3.4"
+    output = dicom.dataset.FileDataset(path, dataset, file_meta=file_meta,
+                                       preamble=b"\x00" * 128)
+    output.is_little_endian = True
+    output.is_implicit_VR = False
+    output.save_as(path)
+
+
+class PyDcmioDiffusion(unittest.TestCase):
+    """ Test the PyDcmio diffusion table function:
+    'pydcmio.dcmreader.diffusion.get_diffusion_table'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        self.dicom_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Clean the generated files.
+        """
+        shutil.rmtree(self.dicom_dir)
+
+    def test_badfileparameters_raise(self):
+        """ A bad input parameter -> raise ValueError.
+        """
+        # Test execution
+        self.assertRaises(ValueError, get_diffusion_table,
+                          os.path.join(self.dicom_dir, "WRONG"))
+        write_dicom(os.path.join(self.dicom_dir, "a.dcm"),
+                    dicom.dataset.Dataset())
+        self.assertRaises(ValueError, get_diffusion_table, self.dicom_dir)
+
+    def test_siemens_execution(self):
+        """ Test the Siemens CSA2 diffusion description.
+        """
+        # Test execution
+        for basename, number, bval, bvec in [
+                ("a.dcm", "3", b"1000", [b"0", b"1", b"0"]),
+                ("b.dcm", "1", b"0", []),
+                ("c.dcm", "2", b"1000", [b"1", b"0", b"0"])]:
+            dataset = dicom.dataset.Dataset()
+            dataset.AcquisitionNumber = number
+            dataset.add_new((0x0029, 0x0010), "LO", "SIEMENS CSA HEADER")
+            dataset.add_new((0x0029, 0x1010), "OB", siemens_csa2(bval, bvec))
+            write_dicom(os.path.join(self.dicom_dir, basename), dataset)
+        bvals, bvecs = get_diffusion_table(self.dicom_dir)
+        numpy.testing.assert_allclose(bvals, [0, 1000, 1000])
+        numpy.testing.assert_allclose(bvecs, [[0, 0, 0], [1, 0, 0],
+                                              [0, 1, 0]])
+
+    def test_enhanced_execution(self):
+        """ Test the enhanced Dicom diffusion description.
+        """
+        # Test execution
+        frames = []
+        for bval, bvec in [(0., None), (1000., [0., 0., 1.]),
+                           (2000., [1., 0., 0.])]:
+            diffusion = dicom.dataset.Dataset()
+            diffusion.DiffusionBValue = bval
+            if bvec is not None:
+                direction = dicom.dataset.Dataset()
+                direction.DiffusionGradientOrientation = bvec
+                diffusion.DiffusionGradientDirectionSequence = [direction]
+            frame = dicom.dataset.Dataset()
+            frame.MRDiffusionSequence = [diffusion]
+            frames.append(frame)
+        dataset = dicom.dataset.Dataset()
+        dataset.NumberOfFrames = "3"
+        dataset.PerFrameFunctionalGroupsSequence = frames
+        dicom_file = os.path.join(self.dicom_dir, "a.dcm")
+        write_dicom(dicom_file, dataset)
+        bvals, bvecs = get_diffusion_table([dicom_file, dicom_file])
+        numpy.testing.assert_allclose(bvals, [0, 1000, 2000] * 2)
+        numpy.testing.assert_allclose(bvecs, [[0, 0, 0], [0, 0, 1],
+                                              [1, 0, 0]] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
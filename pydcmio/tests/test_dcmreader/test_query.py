@@ -0,0 +1,82 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import os
+from pkg_resources import Requirement, resource_filename
+
+# Third party import
+import dicom
+import numpy
+
+# Pydcmio import
+from pydcmio.dcmreader.query import query
+from pydcmio.dcmreader.query import compile_query
+from pydcmio.dcmreader.query import QUERY_CACHE_SIZE
+
+
+class PyDcmioQuery(unittest.TestCase):
+    """ Test the PyDcmio path query function:
+    'pydcmio.dcmreader.query.query'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        test_dir = resource_filename(Requirement.parse("pydicom"),
+                                     "dicom/testfiles")
+        self.rtplan_file = os.path.join(test_dir, "rtplan.dcm")
+        frames = []
+        for bval, position in [(0., None), (1000., [1., 2., 3.]),
+                               (2000., [4., 5., 6.])]:
+            diffusion = dicom.dataset.Dataset()
+            diffusion.DiffusionBValue = bval
+            frame = dicom.dataset.Dataset()
+            frame.MRDiffusionSequence = [diffusion]
+            if position is not None:
+                plane = dicom.dataset.Dataset()
+                plane.ImagePositionPatient = position
+                frame.PlanePositionSequence = [plane]
+            frames.append(frame)
+        self.dataset = dicom.dataset.Dataset()
+        self.dataset.PerFrameFunctionalGroupsSequence = frames
+
+    def test_badquery_raise(self):
+        """ A bad query -> raise ValueError.
+        """
+        # Test execution
+        for path in ["(5200,9230).(0018,9087)", "(5200,9230)[a]",
+                     "(5200,9230)[*].(0018,9087)[0]", "(5200,92)[*]"]:
+            self.assertRaises(ValueError, query, self.dataset, path)
+
+    def test_normal_execution(self):
+        """ Test the normal behaviour of the function.
+        """
+        # Test execution
+        bvals = query(self.dataset,
+                      "(5200,9230)[*].(0018,9117)[0].(0018,9087)")
+        numpy.testing.assert_allclose(bvals, [0, 1000, 2000])
+        positions = query(self.dataset,
+                          "(5200,9230)[*].(0020,9113)[0].(0020,0032)")
+        numpy.testing.assert_allclose(
+            positions, [[numpy.nan] * 3, [1, 2, 3], [4, 5, 6]])
+        compiled_query = compile_query("(300a,0010)[*].(300a,0016)")
+        self.assertTrue(
+            compile_query("(300a,0010)[*].(300a,0016)") is compiled_query)
+        self.assertEqual(query(self.rtplan_file, compiled_query).tolist(),
+                         ["iso", "PTV"])
+
+        # The compiled queries cache is bounded
+        for cnt in range(QUERY_CACHE_SIZE):
+            compile_query("(0008,{0:04x})".format(cnt))
+        self.assertFalse(
+            compile_query("(300a,0010)[*].(300a,0016)") is compiled_query)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,11 +10,22 @@
 import unittest
 import sys
 import os
+import shutil
+import tempfile
+
+# Third party import
+import dicom
 
 # Pydcmio import
 from pydcmio.dcmreader.reader import walk
 from pydcmio.dcmreader.reader import get_values
+from pydcmio.dcmreader.reader import get_values_many
 from pydcmio.dcmreader.reader import STANDARD_EXTRACTOR
+from pydcmio.dcmreader.reader import TagIndex
+from pydcmio.dcmreader.reader import iterwalk
+from pydcmio.dcmreader.reader import read_header
+from pydcmio.dcmreader.reader import PIXEL_DATA_TAG
+from pydcmio.dcmreader.reader import HEADER_DEFER_SIZE
 from pkg_resources import Requirement, resource_filename
 
 
@@ -30,6 +41,7 @@ class PyDcmioReader(unittest.TestCase):
         test_dir = resource_filename(Requirement.parse("pydicom"),
                                      "dicom/testfiles")
         self.dataset_or_dcmpath = os.path.join(test_dir, "MR_small.dcm")
+        self.rtplan_file = os.path.join(test_dir, "rtplan.dcm")
 
     def test_badextractor_raise(self):
         """ Bad extractor -> raise ValueError.
@@ -62,6 +74,124 @@ class PyDcmioReader(unittest.TestCase):
         values = walk(self.dataset_or_dcmpath, tag, stack_values=True)
         self.assertEqual(values, [240.])
 
+    def test_many_execution(self):
+        """ Test the batch extraction of several extractors.
+        """
+        # Test execution
+        self.assertRaises(ValueError, get_values_many,
+                          self.dataset_or_dcmpath, ["get_echo_time", "WRONG"])
+        extractors = ["get_echo_time", "get_repetition_time",
+                      "get_manufacturer_name", "get_b_values"]
+        values = get_values_many(self.dataset_or_dcmpath, extractors)
+        self.assertEqual(sorted(values.keys()), sorted(extractors))
+        for extractor in extractors:
+            self.assertEqual(
+                values[extractor],
+                get_values(self.dataset_or_dcmpath, extractor))
+
+    def test_header_execution(self):
+        """ Test the header only and tag bounded reads.
+        """
+        # Test execution
+        dataset = read_header(self.dataset_or_dcmpath)
+        self.assertFalse(PIXEL_DATA_TAG in dataset)
+        self.assertTrue((0x0028, 0x0010) in dataset)
+        dataset = read_header(self.dataset_or_dcmpath,
+                              stop_after_tag=(0x0008, 0x0070))
+        self.assertTrue((0x0008, 0x0070) in dataset)
+        self.assertEqual(max(dataset.keys()), (0x0008, 0x0070))
+        raw_dataset = read_header(self.dataset_or_dcmpath, raw=True)
+        self.assertEqual(sorted(raw_dataset.keys()), sorted(read_header(
+            self.dataset_or_dcmpath).keys()))
+        self.assertFalse(isinstance(dict.__getitem__(
+            raw_dataset, dicom.tag.Tag(0x0010, 0x0010)),
+            dicom.dataelem.DataElement))
+        self.assertEqual(raw_dataset.PatientName, "CompressedSamples^MR1")
+        self.assertFalse(raw_dataset.is_implicit_VR)
+
+    def test_deferred_execution(self):
+        """ Test the header reads with values larger than the defer size.
+        """
+        # Test execution
+        tmpdir = tempfile.mkdtemp()
+        try:
+            dcmpath = os.path.join(tmpdir, "large.dcm")
+            dataset = dicom.read_file(self.dataset_or_dcmpath)
+            dataset.add_new((0x0019, 0x0010), "LO", "ACME")
+            dataset.add_new((0x0019, 0x1001), "OB",
+                            b"\1" * (HEADER_DEFER_SIZE + 2))
+            dataset.save_as(dcmpath)
+            raw_dataset = read_header(dcmpath, raw=True)
+            self.assertTrue(dict.__getitem__(
+                raw_dataset, dicom.tag.Tag(0x0019, 0x1001)).value is None)
+            for dataset in (read_header(dcmpath), raw_dataset):
+                self.assertEqual(dataset[0x0019, 0x1001].value,
+                                 b"\1" * (HEADER_DEFER_SIZE + 2))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_index_execution(self):
+        """ Test the tag index lookups.
+        """
+        # Test execution
+        index = TagIndex(dicom.read_file(self.rtplan_file))
+        tag = (0x0008, 0x0070)
+        self.assertTrue(tag in index)
+        self.assertEqual(walk(index, tag, stack_values=True),
+                         ["Manufacturer name here", "Linac co."])
+        self.assertEqual(walk(index, tag, stack_values=False),
+                         ["Manufacturer name here"])
+        self.assertEqual(
+            index.occurrences((0x300a, 0x0016)),
+            [((((0x300a, 0x0010), 0), ), "iso"),
+             ((((0x300a, 0x0010), 1), ), "PTV")])
+        self.assertEqual(walk(index, (0x0008, 0x0060)), ["RTPLAN"])
+        self.assertEqual(walk(index, (0x0011, 0x0011)), None)
+
+    def test_iterwalk_execution(self):
+        """ Test the lazy tag occurrences generator.
+        """
+        # Test execution
+        tags = [(0x0008, 0x0070), (0x300a, 0x0016)]
+        occurrences = list(iterwalk(self.rtplan_file, tags))
+        self.assertEqual(
+            [(path, tag) for path, tag, _ in occurrences],
+            [((), (0x0008, 0x0070)),
+             ((((0x300a, 0x0010), 0), ), (0x300a, 0x0016)),
+             ((((0x300a, 0x0010), 1), ), (0x300a, 0x0016)),
+             ((((0x300a, 0x00b0), 0), ), (0x0008, 0x0070))])
+        self.assertEqual([value for _, _, value in occurrences],
+                         ["Manufacturer name here", "iso", "PTV",
+                          "Linac co."])
+        self.assertEqual(
+            len(list(iterwalk(self.rtplan_file, tags, max_depth=0))), 1)
+        self.assertEqual(len(list(iterwalk(
+            self.rtplan_file, tags, sequences=[(0x300a, 0x0010)]))), 3)
+        self.assertEqual(len(list(iterwalk(
+            self.rtplan_file, (0x300a, 0x0016), max_hits=1))), 1)
+        self.assertEqual(list(iterwalk(
+            self.rtplan_file, [dicom.tag.Tag(tag) for tag in tags])),
+            occurrences)
+        self.assertEqual(list(iterwalk(self.rtplan_file, 0x300a0016)),
+                         occurrences[1:3])
+
+        # The tag paths only explore their sequences
+        raw_dataset = read_header(self.rtplan_file, raw=True)
+        tag_paths = [[(0x300a, 0x0010), (0x300a, 0x0016)],
+                     [(0x300a, 0x00b0), (0x0008, 0x0070)]]
+        self.assertEqual(list(iterwalk(raw_dataset, tag_paths)),
+                         occurrences[1:])
+        self.assertEqual(list(iterwalk(raw_dataset, tag_paths[:1])),
+                         occurrences[1:3])
+        self.assertTrue(isinstance(dict.__getitem__(
+            raw_dataset, dicom.tag.Tag(0x300a, 0x0010)),
+            dicom.dataelem.DataElement))
+        self.assertFalse(isinstance(dict.__getitem__(
+            raw_dataset, dicom.tag.Tag(0x300a, 0x0070)),
+            dicom.dataelem.DataElement))
+        self.assertEqual(list(iterwalk(
+            self.rtplan_file, [[(0x300a, 0x0070), (0x300a, 0x0016)]])), [])
+
 
 if __name__ == "__main__":
     unittest.main()
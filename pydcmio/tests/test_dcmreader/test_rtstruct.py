@@ -0,0 +1,126 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import os
+import shutil
+import tarfile
+import tempfile
+from pkg_resources import Requirement, resource_filename
+
+# Third party import
+import numpy
+
+# Pydcmio import
+from pydcmio.dcmreader.rtstruct import RTStruct
+from pydcmio.dcmreader.rtstruct import regions_of_interest
+from pydcmio.dcmreader.rtstruct import points_of_interest
+from pydcmio.dcmreader.rtstruct import rasterize_contours
+from pydcmio.dcmreader.rtstruct import UIDIndex
+
+
+class PyDcmioRTStruct(unittest.TestCase):
+    """ Test the PyDcmio RTstruct functions:
+    'pydcmio.dcmreader.rtstruct.RTStruct'
+    'pydcmio.dcmreader.rtstruct.rasterize_contours'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        test_dir = resource_filename(Requirement.parse("pydicom"),
+                                     "dicom/testfiles")
+        self.rtstruct_file = os.path.join(test_dir, "rtstruct.dcm")
+        self.outdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Clean the generated files.
+        """
+        shutil.rmtree(self.outdir)
+
+    def test_normal_execution(self):
+        """ Test the normal behaviour of the function.
+        """
+        # Test execution
+        rtstruct = RTStruct(self.rtstruct_file)
+        self.assertEqual(list(rtstruct),
+                         ["patient", "Isocenter 1", "Isocenter 2"])
+        self.assertEqual(rtstruct._rois, {})
+        roi = rtstruct["patient"]
+        self.assertEqual(roi.points.shape, (17, 3))
+        self.assertEqual(roi.offsets.tolist(), [0, 5, 11, 17])
+        self.assertEqual(roi.contour(1).tolist()[1], [200, -150, -190])
+        self.assertEqual(regions_of_interest(rtstruct), {
+            "patient": {"num_slices": 3, "num_pts": 17}})
+        rois, _, _, operator = points_of_interest(rtstruct)
+        self.assertEqual(list(rois.keys()), ["patient"])
+        self.assertEqual(len(rois["patient"][0]), 3)
+        self.assertEqual(operator, "dmason")
+
+    def test_rasterize_execution(self):
+        """ Test the contours filling.
+        """
+        # Test execution
+        outer = [[2, 2, 5], [12, 2, 5], [12, 12, 5], [2, 12, 5]]
+        inner = [[5, 5, 5], [9, 5, 5], [9, 9, 5], [5, 9, 5]]
+        mask = rasterize_contours([outer, inner], (20, 20, 10))
+        self.assertEqual(mask[:, :, 4].sum(), 0)
+        self.assertTrue(mask[3, 3, 5] and mask[11, 10, 5])
+        self.assertFalse(mask[7, 7, 5] or mask[1, 1, 5])
+        self.assertFalse(mask[6: 9, 6: 9, 5].any())
+        numpy.testing.assert_array_equal(
+            rasterize_contours([outer], (20, 20, 10))[5: 9, 5: 9, 5], True)
+
+    def test_uidindex_execution(self):
+        """ Test the SOP instance UIDs index.
+        """
+        # Test execution
+        series_dir = os.path.join(self.outdir, "series")
+        os.mkdir(series_dir)
+        for uid in ("1.2.3", "1.2.4"):
+            open(os.path.join(series_dir, uid + ".dcm"), "wt").close()
+        tarball = os.path.join(self.outdir, "series.tar.gz")
+        with tarfile.open(tarball, "w:gz") as tar:
+            tar.add(series_dir, arcname="series")
+        index_file = os.path.join(self.outdir, "index.json")
+        index = UIDIndex(index_file)
+        index.add("a.nii.gz", tarball)
+        index.add("b.nii.gz", series_dir)
+        index.save()
+        index = UIDIndex(index_file)
+        self.assertEqual(index.find(["1.2.4", "1.2.3"]),
+                         ("a.nii.gz", tarball))
+        self.assertEqual(index.find(["1.2.4", "1.2.5"]), None)
+        os.remove(os.path.join(series_dir, "1.2.3.dcm"))
+        open(os.path.join(series_dir, "1.2.5.dcm"), "wt").close()
+        os.utime(series_dir, (0, 0))
+        index.add("b.nii.gz", series_dir)
+        self.assertEqual(index.find(["1.2.4", "1.2.5"]),
+                         ("b.nii.gz", series_dir))
+        self.assertEqual(index.find(["1.2.3"]), ("a.nii.gz", tarball))
+        os.remove(os.path.join(series_dir, "1.2.5.dcm"))
+        os.utime(series_dir, (1, 1))
+        index.add("b.nii.gz", series_dir)
+        self.assertEqual(index.find(["1.2.5"]), None)
+        self.assertEqual(index.find(["1.2.4"]), ("a.nii.gz", tarball))
+        self.assertEqual(index.find(["1.2.4"], [["b.nii.gz", series_dir]]),
+                         ("b.nii.gz", series_dir))
+        self.assertEqual(index.find(["1.2.3"], [("b.nii.gz", series_dir)]),
+                         None)
+        index.save()
+        os.remove(tarball)
+        index = UIDIndex(index_file)
+        self.assertEqual(index.references, [("b.nii.gz", series_dir)])
+        self.assertEqual(index.find(["1.2.4"]), ("b.nii.gz", series_dir))
+        self.assertEqual(index.find(["1.2.3"]), None)
+        self.assertRaises(ValueError, index.add, "c.nii.gz",
+                          os.path.join(self.outdir, "WRONG"))
+
+
+if __name__ == "__main__":
+    unittest.main()
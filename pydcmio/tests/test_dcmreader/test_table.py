@@ -0,0 +1,71 @@
+##########################################################################
+# NSAp - Copyright (C) CEA, 2016
+# Distributed under the terms of the CeCILL-B license, as published by
+# the CEA-CNRS-INRIA. Refer to the LICENSE file or to
+# http://www.cecill.info/licences/Licence_CeCILL-B_V1-en.html
+# for details.
+##########################################################################
+
+# System import
+import unittest
+import os
+import shutil
+import tempfile
+from pkg_resources import Requirement, resource_filename
+
+# Third party import
+import numpy
+
+# Pydcmio import
+from pydcmio.dcmreader.table import extract_table
+
+
+class PyDcmioTable(unittest.TestCase):
+    """ Test the PyDcmio header table function:
+    'pydcmio.dcmreader.table.extract_table'
+    """
+    def setUp(self):
+        """ Define function parameters
+        """
+        test_dir = resource_filename(Requirement.parse("pydicom"),
+                                     "dicom/testfiles")
+        self.dicom_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dicom_dir, "sub"))
+        for basename, outname in [("MR_small.dcm", "a.dcm"),
+                                  ("CT_small.dcm", "sub/b.dcm")]:
+            shutil.copy(os.path.join(test_dir, basename),
+                        os.path.join(self.dicom_dir, outname))
+
+    def tearDown(self):
+        """ Clean the generated files.
+        """
+        shutil.rmtree(self.dicom_dir)
+
+    def test_badextractor_raise(self):
+        """ Bad extractor -> raise ValueError.
+        """
+        # Test execution
+        self.assertRaises(ValueError, extract_table, self.dicom_dir,
+                          ["WRONG"])
+
+    def test_normal_execution(self):
+        """ Test the normal behaviour of the function.
+        """
+        # Test execution
+        fields = ["get_echo_time", "get_manufacturer_name", (0x0028, 0x0010)]
+        for n_jobs in (1, 2):
+            table = extract_table(self.dicom_dir, fields, n_jobs=n_jobs)
+            self.assertEqual(
+                table["path"].tolist(),
+                [os.path.join(self.dicom_dir, "a.dcm"),
+                 os.path.join(self.dicom_dir, "sub", "b.dcm")])
+            numpy.testing.assert_array_equal(table["get_echo_time"],
+                                             [240., numpy.nan])
+            self.assertEqual(table["get_manufacturer_name"].tolist(),
+                             ["TOSHIBA_MEC", "GE MEDICAL SYSTEMS"])
+            self.assertEqual(table[(0x0028, 0x0010)].dtype, float)
+            self.assertEqual(table[(0x0028, 0x0010)].tolist(), [64., 128.])
+
+
+if __name__ == "__main__":
+    unittest.main()